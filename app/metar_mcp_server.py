@@ -1,16 +1,42 @@
+import asyncio
+import base64
+import bisect
+import copy
+import functools
+import hashlib
+import importlib.util
+import inspect
+import io
 import json
+import logging
+import logging.handlers
+import math
 import os
+import queue
+import random
+import re
+import sys
+import threading
 import time
-from datetime import datetime, timedelta
+from collections import OrderedDict
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterable
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from datetime import UTC, datetime, timedelta
 from typing import Any
 
+import bson
 import httpx
+from bson import ObjectId, json_util
 from dotenv import load_dotenv
 from fastmcp import FastMCP
-from fastmcp.server.auth.providers.jwt import JWTVerifier  # type: ignore[import-not-found]
+from fastmcp.server.auth.providers.jwt import JWTVerifier
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import IndexModel, ReplaceOne, UpdateOne
+from pymongo.errors import ExecutionTimeout
+from pymongo.monitoring import CommandListener, ConnectionPoolListener
 from starlette.requests import Request
-from starlette.responses import JSONResponse
+from starlette.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 
 # Load environment variables from .env file
 load_dotenv()
@@ -19,6 +45,48 @@ load_dotenv()
 MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
 DATABASE_NAME = os.getenv("DATABASE_NAME", "metar_data")
 COLLECTION_METAR = os.getenv("COLLECTION_METAR", "metar_data")
+# Connection pool: size, connections opened at startup, server selection timeout
+# and wire compression (compressors whose Python package is missing are skipped)
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "10"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_COMPRESSORS = os.getenv("MONGO_COMPRESSORS", "zstd,snappy,zlib")
+COLLECTION_STATS = os.getenv("COLLECTION_STATS", "metar_statistics")
+# > 0 keeps a materialized statistics document refreshed every N seconds
+STATISTICS_REFRESH_SECONDS = float(os.getenv("STATISTICS_REFRESH_SECONDS", "0"))
+COLLECTION_ROLLUPS = os.getenv("COLLECTION_ROLLUPS", "metar_rollups")
+# > 0 folds new METARs into the hourly/daily rollups every N seconds
+ROLLUP_REFRESH_SECONDS = float(os.getenv("ROLLUP_REFRESH_SECONDS", "300"))
+# > 0 adds the derived search fields to documents stored without them, at startup and every N seconds
+BACKFILL_REFRESH_SECONDS = float(os.getenv("BACKFILL_REFRESH_SECONDS", "3600"))
+# off | warn | fail - what to do when a tool query shape is not index-backed
+INDEX_BOOTSTRAP = os.getenv("INDEX_BOOTSTRAP", "warn").lower()
+# In-memory latest observation per station (change stream, polling fallback)
+LATEST_CACHE_ENABLED = os.getenv("LATEST_CACHE_ENABLED", "true").lower() == "true"
+LATEST_CACHE_POLL_SECONDS = float(os.getenv("LATEST_CACHE_POLL_SECONDS", "30"))
+LATEST_CACHE_MAX_STALENESS_SECONDS = float(os.getenv("LATEST_CACHE_MAX_STALENESS_SECONDS", "300"))
+STATION_CATALOG_TTL_SECONDS = float(os.getenv("STATION_CATALOG_TTL_SECONDS", "3600"))
+MAX_BULK_STATIONS = int(os.getenv("MAX_BULK_STATIONS", "100"))
+# Station coordinates/elevation/FIR: local data file, mirrored into a 2dsphere-indexed collection
+COLLECTION_STATIONS = os.getenv("COLLECTION_STATIONS", "stations")
+STATIONS_FILE = os.getenv("STATIONS_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "stations.json"))
+# raw_mongodb_query guard: server-side time limit, and the collection size
+# above which a COLLSCAN plan is rejected before the query runs
+RAW_QUERY_MAX_TIME_MS = int(os.getenv("RAW_QUERY_MAX_TIME_MS", "5000"))
+RAW_QUERY_COLLSCAN_MAX_DOCS = int(os.getenv("RAW_QUERY_COLLSCAN_MAX_DOCS", "100000"))
+# Tool result cache: LRU size, and TTL bounds around the next expected METAR update
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "1024"))
+RESULT_CACHE_MIN_TTL_SECONDS = float(os.getenv("RESULT_CACHE_MIN_TTL_SECONDS", "15"))
+METAR_UPDATE_INTERVAL_SECONDS = float(os.getenv("METAR_UPDATE_INTERVAL_SECONDS", "1800"))
+# Rendered observations kept in memory, keyed by (_id, metar.updatedTime)
+RENDER_CACHE_MAX_ENTRIES = int(os.getenv("RENDER_CACHE_MAX_ENTRIES", "20000"))
+# Largest batch one /sync/metar call may ask for
+SYNC_MAX_BATCH = int(os.getenv("SYNC_MAX_BATCH", "1000"))
+# /export/metar: documents per cursor batch, streamed chunk and Parquet row group
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "2000"))
+EXPORT_MAX_BATCH_SIZE = int(os.getenv("EXPORT_MAX_BATCH_SIZE", "50000"))
+# Reported by the unauthenticated /health; set by the deployment
+SERVER_VERSION = os.getenv("SERVER_VERSION", "dev")
 
 # ------------------- Config (server-only secrets) -------------------
 TENANT_ID = os.getenv("TENANT_ID")
@@ -26,33 +94,1407 @@ APP_ID = os.getenv("APP_ID")
 CLIENT_SECRET = os.getenv("CLIENT_SECRET")
 PORT = 8000
 
+# ------------------- Logging ----------------------------------------
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# text | json (one JSON object per line, for log shipping)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+# Fraction of per-query debug records (marked sampled=True) that are kept
+QUERY_LOG_SAMPLE_RATE = float(os.getenv("QUERY_LOG_SAMPLE_RATE", "0.01"))
+
+logger = logging.getLogger("metar_mcp")
+_STANDARD_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName", "sampled"}
+
+
+def record_fields(record: logging.LogRecord) -> dict[str, Any]:
+    """The extra={...} fields of a log record."""
+    return {k: v for k, v in vars(record).items() if k not in _STANDARD_RECORD_FIELDS}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message, extra fields, exception."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            **record_fields(record),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class KeyValueFormatter(logging.Formatter):
+    """Human-readable line with the extra fields appended as key=value."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = record_fields(record)
+        if fields:
+            head, sep, tail = line.partition("\n")
+            line = head + " " + " ".join(f"{k}={v}" for k, v in fields.items()) + sep + tail
+        return line
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a `rate` fraction of records logged with extra={"sampled": True}; pass all others."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return not getattr(record, "sampled", False) or random.random() < self.rate
+
+
+class StructuredQueueHandler(logging.handlers.QueueHandler):
+    """Enqueue a copy of the record with its args merged and traceback rendered.
+
+    Unlike QueueHandler.prepare, the message is not run through a formatter here,
+    so the listener's formatter still sees the plain message and extra fields.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg, record.args = record.getMessage(), None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+logger.addFilter(SamplingFilter(QUERY_LOG_SAMPLE_RATE))
+_log_listener: logging.handlers.QueueListener | None = None
+_log_handler: StructuredQueueHandler | None = None
+
+
+def configure_logging() -> None:
+    """Send records through a queue; a listener thread formats and writes them (idempotent).
+
+    The event loop only enqueues, so slow stdout or log pipes never block a tool call.
+    """
+    global _log_listener, _log_handler
+    if _log_listener is not None:
+        return
+    handler = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(KeyValueFormatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    _log_handler = StructuredQueueHandler(log_queue)
+    logger.addHandler(_log_handler)
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+    _log_listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    _log_listener.start()
+
+
+def stop_logging() -> None:
+    """Flush queued records, stop the listener thread and detach the queue handler."""
+    global _log_listener, _log_handler
+    if _log_listener is not None:
+        if _log_handler is not None:
+            logger.removeHandler(_log_handler)
+        logger.propagate = True
+        _log_listener.stop()
+        _log_listener = _log_handler = None
+
+
+# Cached app-only tokens are re-fetched this long before they expire
+TOKEN_REFRESH_MARGIN_SECONDS = float(os.getenv("TOKEN_REFRESH_MARGIN_SECONDS", "300"))
+
 # OpenID metadata
 JWKS_URI = f"https://login.microsoftonline.com/{TENANT_ID}/discovery/v2.0/keys"
 ISSUER = f"https://login.microsoftonline.com/{TENANT_ID}/v2.0"
 AUDIENCE = APP_ID
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "10000"))
+
 
 # ------------------- MCP with JWT verification ----------------------
-auth = JWTVerifier(
+class CachingJWTVerifier(JWTVerifier):
+    """JWTVerifier with a cache of verified tokens.
+
+    Verified tokens are cached by SHA-256 until their exp, so repeat calls with
+    the same bearer token skip the RSA check. Key lookup is left to JWTVerifier,
+    which keeps the JWKS between requests.
+    """
+
+    def __init__(self, *, max_entries: int = AUTH_CACHE_MAX_ENTRIES, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+        self._verified_tokens: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+    async def load_access_token(self, token: str) -> Any:
+        digest = hashlib.sha256(token.encode()).hexdigest()
+        entry = self._verified_tokens.get(digest)
+        if entry is not None:
+            if time.time() < entry[0]:
+                self.hits += 1
+                self._verified_tokens.move_to_end(digest)
+                return entry[1]
+            del self._verified_tokens[digest]
+
+        self.misses += 1
+        access_token = await super().load_access_token(token)
+        if access_token is None:
+            self.rejected += 1
+        elif access_token.expires_at and self.max_entries > 0:
+            self._verified_tokens[digest] = (float(access_token.expires_at), access_token)
+            while len(self._verified_tokens) > self.max_entries:
+                self._verified_tokens.popitem(last=False)
+        return access_token
+
+    async def verify_token(self, token: str) -> Any:
+        """Entry point of fastmcp's bearer auth middleware; answered from the same cache."""
+        return await self.load_access_token(token)
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._verified_tokens),
+            "hits": self.hits,
+            "misses": self.misses,
+            "rejected": self.rejected,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+auth = CachingJWTVerifier(
     jwks_uri=JWKS_URI,
     issuer=ISSUER,
     audience=AUDIENCE,
 )
 
-mcp = FastMCP(name="metar-weather", auth=auth)
+
+
+@asynccontextmanager
+async def server_lifespan(server: Any) -> AsyncIterator[dict[str, Any]]:
+    """Startup hook: logging, Mongo pool warm-up, indexes, index-coverage check, caches and background jobs.
+
+    The teardown closes process-wide clients, so this must run once per
+    server: fastmcp>=2.13 (pinned in requirements-dev.txt) enters it once,
+    where older releases entered it for every streamable-http session.
+    """
+    configure_logging()
+    await warm_up_mongodb()
+    await bootstrap_indexes()
+    if BACKFILL_REFRESH_SECONDS > 0:
+        start_periodic("Derived field backfill", backfill_derived_fields, BACKFILL_REFRESH_SECONDS)
+    await station_directory.sync()
+    if LATEST_CACHE_ENABLED:
+        await latest_cache.start()
+    if STATISTICS_REFRESH_SECONDS > 0:
+        start_periodic("Statistics refresh", refresh_materialized_statistics, STATISTICS_REFRESH_SECONDS)
+    if ROLLUP_REFRESH_SECONDS > 0:
+        start_periodic("Rollup update", update_rollups, ROLLUP_REFRESH_SECONDS)
+    try:
+        yield {}
+    finally:
+        await latest_cache.stop()
+        await stop_periodic_tasks()
+        await token_cache.close()
+        if client is not None:
+            client.close()
+        stop_logging()
+
+
+mcp = FastMCP(name="metar-weather", auth=auth, lifespan=server_lifespan)
 
 # Global MongoDB client
 client: AsyncIOMotorClient | None = None
 db: Any | None = None
 
 
+# Python package that provides each wire compressor (zlib is in the stdlib)
+COMPRESSOR_PACKAGES = {"zstd": "zstandard", "snappy": "snappy", "zlib": None}
+
+
+def available_compressors(names: str) -> list[str]:
+    """Requested compressors, in preference order, that this interpreter can use."""
+    available = []
+    for name in (name.strip().lower() for name in names.split(",") if name.strip()):
+        if name not in COMPRESSOR_PACKAGES:
+            continue
+        package = COMPRESSOR_PACKAGES[name]
+        if package is None or importlib.util.find_spec(package) is not None:
+            available.append(name)
+    return available
+
+
+class PoolStats(ConnectionPoolListener):
+    """Connection pool checkout waits and connection churn, from pymongo pool events."""
+
+    def __init__(self) -> None:
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.connections_created = 0
+        self.connections_closed = 0
+        self.ping_ms: float | None = None
+
+    def _record_wait(self, duration: float | None) -> None:
+        if duration is not None:
+            self.wait_seconds_total += duration
+            self.wait_seconds_max = max(self.wait_seconds_max, duration)
+
+    def connection_checked_out(self, event: Any) -> None:
+        self.checkouts += 1
+        self._record_wait(getattr(event, "duration", None))
+
+    def connection_check_out_failed(self, event: Any) -> None:
+        self.checkout_failures += 1
+        self._record_wait(getattr(event, "duration", None))
+
+    def connection_created(self, event: Any) -> None:
+        self.connections_created += 1
+
+    def connection_closed(self, event: Any) -> None:
+        self.connections_closed += 1
+
+    # Pool events the stats do not use
+    def pool_created(self, event: Any) -> None: ...
+    def pool_ready(self, event: Any) -> None: ...
+    def pool_cleared(self, event: Any) -> None: ...
+    def pool_closed(self, event: Any) -> None: ...
+    def connection_ready(self, event: Any) -> None: ...
+    def connection_check_out_started(self, event: Any) -> None: ...
+    def connection_checked_in(self, event: Any) -> None: ...
+
+    def stats(self) -> dict[str, Any]:
+        waits = self.checkouts + self.checkout_failures
+        return {
+            "ping_ms": None if self.ping_ms is None else round(self.ping_ms, 2),
+            "max_pool_size": MONGO_MAX_POOL_SIZE,
+            "min_pool_size": MONGO_MIN_POOL_SIZE,
+            "open_connections": self.connections_created - self.connections_closed,
+            "checkouts": self.checkouts,
+            "checkout_failures": self.checkout_failures,
+            "checkout_wait_ms_mean": round(1000 * self.wait_seconds_total / waits, 3) if waits else 0.0,
+            "checkout_wait_ms_max": round(1000 * self.wait_seconds_max, 3),
+        }
+
+
+pool_stats = PoolStats()
+
+
+def mongodb_client_options() -> dict[str, Any]:
+    options: dict[str, Any] = {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "event_listeners": [pool_stats, mongo_command_metrics],
+    }
+    compressors = available_compressors(MONGO_COMPRESSORS)
+    if compressors:
+        options["compressors"] = ",".join(compressors)
+    return options
+
+
 async def get_mongodb_client() -> tuple[Any, Any]:
     """Get MongoDB client connection."""
     global client, db
     if client is None:
-        client = AsyncIOMotorClient(MONGODB_URL)
+        client = AsyncIOMotorClient(MONGODB_URL, **mongodb_client_options())
         db = client[DATABASE_NAME]
-    # mypy: db is set together with client above
-    return client, db  # type: ignore[return-value]
+    return client, db
+
+
+async def ping_mongodb() -> float:
+    """One ping round trip, in ms (also kept for /health)."""
+    _, db = await get_mongodb_client()
+    started = time.perf_counter()
+    await db.command("ping")
+    pool_stats.ping_ms = (time.perf_counter() - started) * 1000
+    return pool_stats.ping_ms
+
+
+async def warm_up_mongodb() -> None:
+    """Create the pool and open MONGO_MIN_POOL_SIZE connections before the first tool call."""
+    try:
+        await asyncio.gather(*(ping_mongodb() for _ in range(max(1, MONGO_MIN_POOL_SIZE))))
+        logger.info(
+            "MongoDB pool warmed",
+            extra={"connections": pool_stats.stats()["open_connections"], "ping_ms": round(pool_stats.ping_ms or 0.0, 1)},
+        )
+    except Exception as e:
+        logger.warning("MongoDB warm-up failed: %s", e)
+
+
+# ------------------- Numeric observation fields ---------------------
+# Decoded observation values are stored as strings ("30", "M02", "9999"), so a
+# range filter on them compares lexicographically and no index can serve it.
+# Ingestion stores typed copies under NUMERIC_OBS_PREFIX; range searches use those.
+NUMERIC_OBS_PREFIX = "numericObservation"
+NUMERIC_OBS_FIELDS = (
+    "airTemperature",
+    "dewpointTemperature",
+    "windSpeed",
+    "windDirection",
+    "horizontalVisibility",
+    "observedQNH",
+)
+# Range field first, then the sort key, so a range search walks one index in order
+NUMERIC_OBS_INDEXES = [
+    [(f"{NUMERIC_OBS_PREFIX}.{field}", 1), ("timestamp", -1)]
+    for field in ("airTemperature", "horizontalVisibility", "windSpeed", "observedQNH")
+]
+CAVOK_VISIBILITY_M = 10000.0
+
+_OBS_NUMBER_RE = re.compile(r"^(M|-)?(\d+(?:\.\d+)?)")
+
+
+def parse_observation_number(value: Any) -> float | None:
+    """Parse a decoded observation value ("30", "M02", "9999", 1008) into a float."""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, int | float):
+        return float(value)
+    text = str(value).strip().upper()
+    if text == "CAVOK":
+        return CAVOK_VISIBILITY_M
+    match = _OBS_NUMBER_RE.match(text)
+    if not match:
+        return None
+    number = float(match.group(2))
+    return -number if match.group(1) else number
+
+
+def build_numeric_observation(metar_doc: dict[str, Any]) -> dict[str, float | None]:
+    """Typed copies of the decoded observation fields of a METAR document."""
+    metar = metar_doc.get("metar") or {}
+    obs = (metar.get("decodedData") or {}).get("observation") or {}
+    return {field: parse_observation_number(obs.get(field)) for field in NUMERIC_OBS_FIELDS}
+
+
+# ------------------- METAR group tokens -----------------------------
+# Weather and cloud filters match whole groups of the raw METAR through a
+# multikey index instead of an unanchored regex over metar.rawData.
+METAR_GROUPS_FIELD = "metarGroups"
+FIR_REGION_KEY_FIELD = "firRegionKey"
+# Version of derived_fields() a document was enriched with. Search filters read
+# the derived fields of current-version documents and the raw fields of the
+# rest; bumping it has the backfill re-derive every older document.
+DERIVED_VERSION_FIELD = "derivedVersion"
+DERIVED_VERSION = 2
+
+_REPORT_HEADER_RE = re.compile(r"^(METAR|SPECI|COR|AUTO|\d{6}Z)$")
+# Groups after these forecast (trend) or remark on the weather rather than report it
+_OBSERVATION_END_GROUPS = {"TEMPO", "BECMG", "NOSIG", "RMK"}
+_CLOUD_GROUP_RE = re.compile(r"^(FEW|SCT|BKN|OVC|VV)(\d{3}|///)(CB|TCU)?$")
+_WEATHER_GROUP_RE = re.compile(
+    r"^(?P<intensity>[-+]|VC)?(?P<descriptor>MI|PR|BC|DR|BL|SH|TS|FZ)?"
+    r"(?P<phenomena>(?:DZ|RA|SN|SG|IC|PL|GR|GS|UP|BR|FG|FU|VA|DU|SA|HZ|PY|PO|SQ|FC|SS|DS)*)$"
+)
+# Plain-language weather words accepted by search_metar_data
+WEATHER_WORDS = {
+    "RAIN": "RA",
+    "DRIZZLE": "DZ",
+    "SNOW": "SN",
+    "HAIL": "GR",
+    "FOG": "FG",
+    "MIST": "BR",
+    "HAZE": "HZ",
+    "SMOKE": "FU",
+    "DUST": "DU",
+    "SAND": "SA",
+    "SQUALL": "SQ",
+    "SHOWER": "SH",
+    "SHOWERS": "SH",
+    "THUNDERSTORM": "TS",
+    "THUNDER": "TS",
+}
+
+
+def tokenize_metar(raw: str | None, station_icao: str | None = None) -> list[str]:
+    """Split the observed part of a raw METAR into normalized, de-duplicated group tokens.
+
+    Trend (TEMPO, BECMG, NOSIG) and remark groups are left out. Cloud groups
+    also yield their convective type ("SCT030CB" -> "CB") and weather groups
+    their parts ("+TSRA" -> "TSRA", "TS", "RA"). Weather in the vicinity keeps
+    its VC prefix ("VCSH" -> "VCSH"), so it does not match weather at the station.
+    """
+    tokens: list[str] = []
+    for group in (raw or "").upper().replace("=", " ").split():
+        if group in _OBSERVATION_END_GROUPS:
+            break
+        if group == station_icao or _REPORT_HEADER_RE.match(group):
+            continue
+        tokens.append(group)
+        cloud = _CLOUD_GROUP_RE.match(group)
+        if cloud:
+            if cloud.group(3):
+                tokens.extend((cloud.group(1) + cloud.group(2), cloud.group(3)))
+            continue
+        weather = _WEATHER_GROUP_RE.match(group)
+        if weather and (weather.group("descriptor") or weather.group("phenomena")):
+            phenomena = weather.group("phenomena")
+            prefix = "VC" if weather.group("intensity") == "VC" else ""
+            tokens.append(prefix + group.removeprefix(weather.group("intensity") or ""))
+            if weather.group("descriptor"):
+                tokens.append(prefix + weather.group("descriptor"))
+            tokens.extend(prefix + phenomena[i:i + 2] for i in range(0, len(phenomena), 2))
+    return list(dict.fromkeys(tokens))
+
+
+def metar_group_filters(weather_condition: str | None, cloud_type: str | None) -> dict[str, Any]:
+    """Query clauses for the weather/cloud filters of search_metar_data."""
+    clauses: list[dict[str, Any]] = []
+    if weather_condition:
+        code = weather_condition.strip().upper()
+        clauses.append({METAR_GROUPS_FIELD: WEATHER_WORDS.get(code, code)})
+    if cloud_type:
+        # Anchored, case-sensitive prefix: "SCT" matches SCT030, still index-bounded
+        clauses.append({METAR_GROUPS_FIELD: {"$regex": "^" + re.escape(cloud_type.strip().upper())}})
+    if len(clauses) == 1:
+        return clauses[0]
+    return {"$and": clauses} if clauses else {}
+
+
+def fir_region_filter(fir_region: str) -> dict[str, Any]:
+    """Prefix match on the lower-cased FIR region key."""
+    return {FIR_REGION_KEY_FIELD: {"$regex": "^" + re.escape(fir_region.strip().lower())}}
+
+
+# ------------------- Raw-field fallback -----------------------------
+# The same filters over the stored raw fields, for documents that are not (yet)
+# enriched with the current DERIVED_VERSION. They are unindexed, but only run on
+# the documents the derivedVersion index bounds them to.
+def raw_metar_group_filters(weather_condition: str | None, cloud_type: str | None) -> dict[str, Any]:
+    """metar_group_filters() over the decoded weather and cloud layers."""
+    clauses: list[dict[str, Any]] = []
+    if weather_condition:
+        code = weather_condition.strip().upper()
+        code = WEATHER_WORDS.get(code, code)
+        # A whole weather group or a part of one after its intensity; VC groups only match VC codes
+        before = "" if code.startswith("VC") else "(?!VC)(?:[A-Z]{2})*?"
+        pattern = rf"(?:^|\s)[-+]?{before}{re.escape(code)}(?:[A-Z]{{2}})*(?:\s|$)"
+        clauses.append({"metar.decodedData.observation.weatherConditions": {"$regex": pattern}})
+    if cloud_type:
+        code = re.escape(cloud_type.strip().upper())
+        clauses.append({"metar.decodedData.observation.cloudLayers": {"$regex": rf"^(?:(?:FEW|SCT|BKN|OVC|VV)(?:\d{{3}}|///))?{code}"}})
+    if len(clauses) == 1:
+        return clauses[0]
+    return {"$and": clauses} if clauses else {}
+
+
+def raw_fir_region_filter(fir_region: str) -> dict[str, Any]:
+    """fir_region_filter() over metar.firRegion."""
+    return {"metar.firRegion": {"$regex": r"^\s*" + re.escape(fir_region.strip()), "$options": "i"}}
+
+
+def raw_observation_number(field: str) -> dict[str, Any]:
+    """parse_observation_number() of a decoded observation field as an aggregation expression.
+
+    Covers plain and M-prefixed numbers and CAVOK; anything else is null.
+    """
+    text: Any = {"$toString": f"$metar.decodedData.observation.{field}"}
+    for find, replacement in (("CAVOK", f"{CAVOK_VISIBILITY_M:g}"), ("M", "-")):
+        text = {"$replaceAll": {"input": text, "find": find, "replacement": replacement}}
+    return {"$convert": {"input": text, "to": "double", "onError": None, "onNull": None}}
+
+
+def raw_observation_ranges(ranges: dict[str, dict[str, float]]) -> dict[str, Any]:
+    """Numeric range filters (observation field -> {$gte, $lte}) over the decoded strings."""
+    conditions = []
+    for field, bounds in ranges.items():
+        value = raw_observation_number(field)
+        # null sorts below every number, so a missing or unparsable value fails the lower bound
+        conditions.append({"$gte": [value, bounds.get("$gte", -math.inf)]})
+        if "$lte" in bounds:
+            conditions.append({"$lte": [value, bounds["$lte"]]})
+    return {"$expr": {"$and": conditions}} if conditions else {}
+
+
+def derived_field_filter(derived: dict[str, Any], raw: dict[str, Any]) -> dict[str, Any]:
+    """Match current-version documents on their derived fields, the others on the equivalent raw filter."""
+    if not derived:
+        return {}
+    return {"$or": [
+        {**derived, DERIVED_VERSION_FIELD: DERIVED_VERSION},
+        {DERIVED_VERSION_FIELD: {"$ne": DERIVED_VERSION}, **raw},
+    ]}
+
+
+def derived_fields(metar_doc: dict[str, Any]) -> dict[str, Any]:
+    """Search fields computed from a stored METAR document at ingestion."""
+    metar = metar_doc.get("metar") or {}
+    fir_region = metar.get("firRegion")
+    return {
+        NUMERIC_OBS_PREFIX: build_numeric_observation(metar_doc),
+        METAR_GROUPS_FIELD: tokenize_metar(metar.get("rawData"), metar_doc.get("stationICAO")),
+        FIR_REGION_KEY_FIELD: fir_region.strip().lower() if isinstance(fir_region, str) else None,
+        DERIVED_VERSION_FIELD: DERIVED_VERSION,
+    }
+
+
+def enrich_metar_document(metar_doc: dict[str, Any]) -> dict[str, Any]:
+    """Return a copy of a METAR document with its derived search fields.
+
+    Ingestion should pass every document through this before insert/upsert.
+    """
+    return {**metar_doc, **derived_fields(metar_doc)}
+
+
+DERIVED_SOURCE_PROJECTION = {"stationICAO": 1, "metar.rawData": 1, "metar.firRegion": 1, "metar.decodedData.observation": 1}
+
+
+async def backfill_derived_fields(batch_size: int = 1000) -> int:
+    """(Re-)derive the search fields of documents not at DERIVED_VERSION.
+
+    New documents are enriched as the latest-observation feed sees them; this
+    catches up on older ones, at startup and every BACKFILL_REFRESH_SECONDS.
+    The derivedVersion index bounds each pass to the documents it updates.
+    Returns the number of documents updated.
+    """
+    _, db = await get_mongodb_client()
+    collection = db[COLLECTION_METAR]
+    cursor = collection.find(
+        {DERIVED_VERSION_FIELD: {"$ne": DERIVED_VERSION}}, DERIVED_SOURCE_PROJECTION
+    ).batch_size(batch_size)
+
+    updated = 0
+    ops: list[UpdateOne] = []
+    async for doc in cursor:
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": derived_fields(doc)}))
+        if len(ops) >= batch_size:
+            await collection.bulk_write(ops, ordered=False)
+            updated += len(ops)
+            ops = []
+    if ops:
+        await collection.bulk_write(ops, ordered=False)
+        updated += len(ops)
+    return updated
+
+
+# ------------------- Index bootstrap --------------------------------
+# _id is the tie-breaker of every tool sort, so keyset pages stay index-ordered
+METAR_INDEXES = [
+    IndexModel([("stationICAO", 1), ("timestamp", -1), ("_id", -1)]),
+    IndexModel([("stationIATA", 1), ("timestamp", -1), ("_id", -1)]),
+    IndexModel([("timestamp", -1), ("_id", -1)]),
+    IndexModel([("metar.updatedTime", -1), ("_id", -1)]),
+    IndexModel([("hasMetarData", 1)]),
+    IndexModel([("hasTaforData", 1)]),
+    IndexModel([(METAR_GROUPS_FIELD, 1), ("timestamp", -1)]),
+    IndexModel([(FIR_REGION_KEY_FIELD, 1), ("timestamp", -1)]),
+    IndexModel([(DERIVED_VERSION_FIELD, 1)]),
+    *(IndexModel(keys) for keys in NUMERIC_OBS_INDEXES),
+]
+
+# Plan stages that mean a query is not served by an index
+COLLSCAN_STAGE = "COLLSCAN"
+BLOCKING_SORT_STAGES = {"SORT", "SORT_KEY_GENERATOR"}
+# indexBounds of a key the filter does not constrain (ascending / descending walk)
+FULL_INDEX_BOUNDS = {"[MinKey, MaxKey]", "[MaxKey, MinKey]"}
+
+_indexes_bootstrapped = False
+
+
+def index_coverage_queries() -> dict[str, tuple[dict[str, Any], list[tuple[str, int]] | None, bool]]:
+    """Canonical query shape of each tool: name -> (filter, sort, sort_must_use_index).
+
+    A range on one field sorted by another always needs either a blocking sort
+    or a full walk of the sort index, so those shapes are only checked for COLLSCAN.
+    """
+    recent = datetime.now() - timedelta(hours=24)
+    by_time = SEARCH_SORT
+    return {
+        "search_metar_data:icao": ({"stationICAO": "VIDP"}, by_time, True),
+        "search_metar_data:iata": ({"stationIATA": "DEL"}, by_time, True),
+        "search_metar_data:hours_back": ({"timestamp": {"$gte": recent}}, by_time, True),
+        "search_metar_data:cloud": (
+            derived_field_filter(metar_group_filters(None, "CB"), raw_metar_group_filters(None, "CB")), by_time, False
+        ),
+        "search_metar_data:fir": (
+            derived_field_filter(fir_region_filter("chennai"), raw_fir_region_filter("chennai")), by_time, False
+        ),
+        "search_metar_data:temperature": (
+            derived_field_filter(
+                {f"{NUMERIC_OBS_PREFIX}.airTemperature": {"$gte": 35.0}}, raw_observation_ranges({"airTemperature": {"$gte": 35.0}})
+            ),
+            by_time,
+            False,
+        ),
+        "raw_mongodb_query:latest": ({}, RAW_QUERY_SORT, True),
+        "get_metar_at:before": ({"stationICAO": "VIDP", "timestamp": {"$lte": recent}}, SEARCH_SORT, True),
+        "get_metar_at:after": ({"stationICAO": "VIDP", "timestamp": {"$gt": recent}}, POINT_IN_TIME_AFTER_SORT, True),
+        "get_metar_changes": ({SYNC_FIELD: {"$gte": recent}}, SYNC_SORT, True),
+        "export_metar": ({"timestamp": {"$gte": recent, "$lt": datetime.now()}}, EXPORT_SORT, True),
+    }
+
+
+def index_coverage_pipelines() -> dict[str, list[dict[str, Any]]]:
+    """Canonical aggregation of each tool that reads through one; checked like the sorted finds above."""
+    return {
+        "get_latest_metar_for_stations": latest_per_station_pipeline(["VIDP", "VABB"]),
+    }
+
+
+def plan_stages(plan: dict[str, Any]) -> list[str]:
+    """All stage names in an explain() winning plan, classic or slot-based."""
+    stages = []
+    stack: list[Any] = [plan]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            if isinstance(node.get("stage"), str):
+                stages.append(node["stage"])
+            stack.extend(node.values())
+        elif isinstance(node, list):
+            stack.extend(node)
+    return stages
+
+
+def unbounded_index_scans(plan: dict[str, Any]) -> list[str]:
+    """Indexes walked end to end under a FETCH that applies the filter.
+
+    When some index provides the sort order, the planner prefers walking it
+    whole over a COLLSCAN, so an unselective filter shows up as an IXSCAN with
+    [MinKey, MaxKey] bounds (or none at all) feeding a filtering FETCH.
+    """
+    found = []
+    stack: list[Any] = [plan]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+            continue
+        if not isinstance(node, dict):
+            continue
+        if node.get("stage") == "FETCH" and node.get("filter"):
+            scans: list[Any] = [node.get("inputStage"), *(node.get("inputStages") or [])]
+            while scans:
+                scan = scans.pop()
+                if not isinstance(scan, dict):
+                    continue
+                bounds = scan.get("indexBounds")
+                if scan.get("stage") == "IXSCAN" and (not bounds or all(set(b) <= FULL_INDEX_BOUNDS for b in bounds.values())):
+                    found.append(scan.get("indexName") or str(scan.get("keyPattern")))
+                scans += [scan.get("inputStage"), *(scan.get("inputStages") or [])]
+        stack.extend(node.values())
+    return found
+
+
+async def explain_find(query: dict[str, Any], sort: list[tuple[str, int]] | None, limit: int) -> dict[str, Any]:
+    """Winning plan of a find() on the METAR collection.
+
+    Uses the explain command at queryPlanner verbosity, which only plans the
+    query; cursor.explain() would run it to completion (allPlansExecution).
+    """
+    _, db = await get_mongodb_client()
+    command: dict[str, Any] = {"find": COLLECTION_METAR, "filter": query, "limit": limit}
+    if sort:
+        command["sort"] = dict(sort)
+    explain = await db.command("explain", command, verbosity="queryPlanner")
+    return explain.get("queryPlanner", {}).get("winningPlan", {})
+
+
+async def explain_aggregate(pipeline: list[dict[str, Any]]) -> dict[str, Any]:
+    """Query planner output of an aggregation on the METAR collection.
+
+    The winning plan sits under the first stage's $cursor, or at the top when
+    the whole pipeline was pushed down to the query layer; plan_stages walks both.
+    """
+    _, db = await get_mongodb_client()
+    command = {"aggregate": COLLECTION_METAR, "pipeline": pipeline, "cursor": {}}
+    return await db.command("explain", command, verbosity="queryPlanner")
+
+
+async def ensure_indexes() -> list[str]:
+    """Create every declared index on the METAR, rollup and station collections (idempotent)."""
+    _, db = await get_mongodb_client()
+    names = await db[COLLECTION_METAR].create_indexes(METAR_INDEXES)
+    names += await db[COLLECTION_ROLLUPS].create_indexes(ROLLUP_INDEXES)
+    return names + await db[COLLECTION_STATIONS].create_indexes(STATION_INDEXES)
+
+
+async def verify_index_coverage() -> dict[str, list[str]]:
+    """Explain each canonical tool query; return name -> offending plan stages."""
+    problems: dict[str, list[str]] = {}
+    for name, (query, sort, sort_must_use_index) in index_coverage_queries().items():
+        stages = plan_stages(await explain_find(query, sort, 1))
+        bad = [stage for stage in stages if stage == COLLSCAN_STAGE or (sort_must_use_index and stage in BLOCKING_SORT_STAGES)]
+        if bad:
+            problems[name] = bad
+    for name, pipeline in index_coverage_pipelines().items():
+        stages = plan_stages(await explain_aggregate(pipeline))
+        bad = [stage for stage in stages if stage == COLLSCAN_STAGE or stage in BLOCKING_SORT_STAGES]
+        if bad:
+            problems[name] = bad
+    return problems
+
+
+async def bootstrap_indexes() -> None:
+    """Create declared indexes once per process and check tool query plans.
+
+    INDEX_BOOTSTRAP=warn logs uncovered shapes, =fail raises, =off skips.
+    """
+    global _indexes_bootstrapped
+    if INDEX_BOOTSTRAP == "off" or _indexes_bootstrapped:
+        return
+    try:
+        names = await ensure_indexes()
+        logger.info("Ensured indexes", extra={"indexes": len(names), "collection": COLLECTION_METAR})
+        problems = await verify_index_coverage()
+    except Exception as e:
+        if INDEX_BOOTSTRAP == "fail":
+            raise
+        logger.warning("Index bootstrap skipped: %s", e)
+        return
+
+    _indexes_bootstrapped = True
+    for name, stages in problems.items():
+        logger.warning("Query shape %s is not index-backed", name, extra={"stages": stages})
+    if problems and INDEX_BOOTSTRAP == "fail":
+        raise RuntimeError(f"Unindexed query shapes: {', '.join(sorted(problems))}")
+
+
+# ------------------- Latest observation cache -----------------------
+def _observation_time(doc: dict[str, Any]) -> datetime:
+    return doc.get("timestamp") or datetime.min
+
+
+class LatestObservationCache:
+    """Station ICAO -> newest METAR/TAF document, held in process memory.
+
+    Seeded with one $group/$first aggregation, then kept current by a change
+    stream on the METAR collection. Deployments without change streams (a
+    standalone mongod) fall back to polling on metar.updatedTime. Reads are
+    refused (counted as stale) when polling has not succeeded recently.
+    Documents the feed sees without the current derived search fields get them
+    written back, so they reach the indexed filters within a poll interval.
+    """
+
+    def __init__(self, poll_seconds: float, max_staleness_seconds: float):
+        self.poll_seconds = poll_seconds
+        self.max_staleness_seconds = max_staleness_seconds
+        self.mode = "idle"
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.updates = 0
+        self.enriched = 0
+        self._docs: dict[str, dict[str, Any]] = {}
+        self._updated: dict[str, datetime] = {}  # station -> newest metar.updatedTime seen
+        self._high_water: datetime | None = None
+        self._refreshed_at: float | None = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def high_water(self) -> datetime | None:
+        """Newest metar.updatedTime seen, while the cache is being kept current."""
+        return self._high_water if self._task is not None else None
+
+    def is_fresh(self) -> bool:
+        if self._refreshed_at is None:
+            return False
+        if self.mode == "change_stream":
+            return True
+        return time.monotonic() - self._refreshed_at <= self.max_staleness_seconds
+
+    def apply(self, doc: dict[str, Any]) -> None:
+        """Record a document if it is the newest seen for its station.
+
+        A document updated after anything seen for its station retires the
+        cached tool results that cover that station and observation time.
+        """
+        station = doc.get("stationICAO")
+        if not station:
+            return
+        current = self._docs.get(station)
+        if current is None:
+            station_catalog.observe(doc)
+        if current is None or _observation_time(doc) >= _observation_time(current):
+            self._docs[station] = doc
+            self.updates += 1
+        updated = (doc.get("metar") or {}).get("updatedTime")
+        if updated is None:
+            return
+        if station not in self._updated or updated > self._updated[station]:
+            self._updated[station] = updated
+            result_cache.invalidate(station, doc.get("timestamp"))
+        if self._high_water is None or updated > self._high_water:
+            self._high_water = updated
+
+    def get(self, station_icao: str) -> dict[str, Any] | None:
+        if not self.is_fresh():
+            self.stale += 1
+            return None
+        doc = self._docs.get(station_icao)
+        if doc is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return doc
+
+    def get_many(self, station_icaos: list[str]) -> dict[str, dict[str, Any]]:
+        """Latest documents for the stations that are cached; absent ones are skipped."""
+        found = {}
+        for station in station_icaos:
+            doc = self.get(station)
+            if doc is not None:
+                found[station] = doc
+        return found
+
+    def lookup(self, query: dict[str, Any]) -> list[dict[str, Any]] | None:
+        """Answer an exact {"stationICAO": X} latest-observation query, else None."""
+        station = query.get("stationICAO")
+        if len(query) != 1 or not isinstance(station, str):
+            return None
+        doc = self.get(station)
+        return [doc] if doc is not None else None
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses + self.stale
+        return {
+            "mode": self.mode,
+            "stations": len(self._docs),
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "updates": self.updates,
+            "enriched": self.enriched,
+            "seconds_since_refresh": (
+                round(time.monotonic() - self._refreshed_at, 3) if self._refreshed_at is not None else None
+            ),
+            "high_water": self._high_water.isoformat() if isinstance(self._high_water, datetime) else self._high_water,
+        }
+
+    async def enrich(self, docs: list[dict[str, Any]]) -> None:
+        """Write the derived search fields of documents not at DERIVED_VERSION (the backfill retries failures)."""
+        ops = [
+            UpdateOne({"_id": doc["_id"]}, {"$set": derived_fields(doc)})
+            for doc in docs
+            if "_id" in doc and doc.get(DERIVED_VERSION_FIELD) != DERIVED_VERSION
+        ]
+        if not ops:
+            return
+        try:
+            _, db = await get_mongodb_client()
+            await db[COLLECTION_METAR].bulk_write(ops, ordered=False)
+            self.enriched += len(ops)
+        except Exception as e:
+            logger.warning("Enriching %d new documents failed: %s", len(ops), e)
+
+    async def seed(self) -> None:
+        _, db = await get_mongodb_client()
+        pipeline = [
+            {"$sort": {"stationICAO": 1, "timestamp": -1}},
+            {"$project": LATEST_PROJECTION},
+            {"$group": {"_id": "$stationICAO", "doc": {"$first": "$$ROOT"}}},
+        ]
+        docs = []
+        async for row in db[COLLECTION_METAR].aggregate(pipeline, allowDiskUse=True):
+            self.apply(row["doc"])
+            docs.append(row["doc"])
+        self._refreshed_at = time.monotonic()
+        await self.enrich(docs)
+
+    async def poll_once(self) -> None:
+        _, db = await get_mongodb_client()
+        # an unseeded cache looks back one feed interval instead of reading the whole collection
+        since = self._high_water or datetime.now() - timedelta(seconds=METAR_UPDATE_INTERVAL_SECONDS)
+        query = {"metar.updatedTime": {"$gte": since}}
+        docs = []
+        async for doc in db[COLLECTION_METAR].find(query, LATEST_PROJECTION).sort("metar.updatedTime", 1):
+            self.apply(doc)
+            docs.append(doc)
+        self._refreshed_at = time.monotonic()
+        await self.enrich(docs)
+
+    async def _watch(self) -> None:
+        _, db = await get_mongodb_client()
+        pipeline = [
+            {"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}},
+            # _id too: cached documents end search pages, and the page cursor is keyed on it
+            {"$project": {"fullDocument." + field: 1 for field in ("_id", *LATEST_PROJECTION)}},
+        ]
+        async with db[COLLECTION_METAR].watch(pipeline, full_document="updateLookup") as stream:
+            self.mode = "change_stream"
+            self._refreshed_at = time.monotonic()
+            async for change in stream:
+                if change.get("fullDocument"):
+                    self.apply(change["fullDocument"])
+                    await self.enrich([change["fullDocument"]])
+                self._refreshed_at = time.monotonic()
+
+    async def _poll(self) -> None:
+        self.mode = "polling"
+        while True:
+            try:
+                await self.poll_once()
+            except Exception as e:
+                logger.warning("Latest-observation poll failed: %s", e)
+            await asyncio.sleep(self.poll_seconds)
+
+    async def _run(self) -> None:
+        try:
+            await self._watch()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Change stream unavailable (%s); polling", e, extra={"poll_seconds": self.poll_seconds})
+        await self._poll()
+
+    async def start(self) -> None:
+        if self._task is not None and not self._task.done():
+            return
+        try:
+            await self.seed()
+        except Exception as e:
+            logger.warning("Latest-observation cache not seeded: %s", e)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except (asyncio.CancelledError, Exception):
+            pass
+        self._task = None
+        self.mode = "idle"
+
+
+latest_cache = LatestObservationCache(LATEST_CACHE_POLL_SECONDS, LATEST_CACHE_MAX_STALENESS_SECONDS)
+
+
+# ------------------- Station catalog --------------------------------
+class StationCatalog:
+    """Known ICAO/IATA station codes and the total report count.
+
+    Rebuilt by one aggregation at most once per TTL, and early when a
+    document from an unknown station is seen.
+    """
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self.icao_to_iata: dict[str, str | None] = {}
+        self.iata_to_icao: dict[str, str] = {}
+        self.total_reports = 0
+        self._loaded_at: float | None = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def icao_codes(self) -> list[str]:
+        return sorted(self.icao_to_iata)
+
+    @property
+    def iata_codes(self) -> list[str]:
+        return sorted(self.iata_to_icao)
+
+    def is_expired(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl_seconds
+
+    def invalidate(self) -> None:
+        self._loaded_at = None
+
+    def observe(self, doc: dict[str, Any]) -> None:
+        """Invalidate when ingestion produces a station the catalog does not know."""
+        if self._loaded_at is not None and doc.get("stationICAO") not in self.icao_to_iata:
+            self.invalidate()
+
+    async def refresh(self) -> None:
+        _, db = await get_mongodb_client()
+        pipeline = [
+            {"$sort": {"stationICAO": 1, "timestamp": -1}},
+            {"$group": {"_id": "$stationICAO", "iata": {"$first": "$stationIATA"}}},
+        ]
+        icao_to_iata: dict[str, str | None] = {}
+        iata_to_icao: dict[str, str] = {}
+        async for row in db[COLLECTION_METAR].aggregate(pipeline, allowDiskUse=True):
+            if row["_id"] is None:
+                continue
+            icao_to_iata[row["_id"]] = row["iata"]
+            if row["iata"] is not None:
+                iata_to_icao[row["iata"]] = row["_id"]
+        self.icao_to_iata = icao_to_iata
+        self.iata_to_icao = iata_to_icao
+        self.total_reports = await db[COLLECTION_METAR].estimated_document_count()
+        self._loaded_at = time.monotonic()
+
+    async def get(self) -> "StationCatalog":
+        """The catalog, refreshed first if it has expired."""
+        if self.is_expired():
+            async with self._lock:
+                if self.is_expired():
+                    await self.refresh()
+        return self
+
+    async def iata_filter(self, station_iata: str) -> dict[str, str]:
+        """Filter on the ICAO index for a known IATA code, else on stationIATA."""
+        code = station_iata.upper()
+        icao = (await self.get()).iata_to_icao.get(code)
+        return {"stationICAO": icao} if icao else {"stationIATA": code}
+
+
+station_catalog = StationCatalog(STATION_CATALOG_TTL_SECONDS)
+
+
+# ------------------- Station locations ------------------------------
+EARTH_RADIUS_KM = 6371.0088
+STATION_INDEXES = [
+    IndexModel([("location", "2dsphere")]),
+    IndexModel([("stationIATA", 1)]),
+]
+
+
+def great_circle_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Haversine distance between two points, in km."""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def initial_bearing(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Initial great-circle bearing from point 1 to point 2, in radians."""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dl = math.radians(lon2 - lon1)
+    return math.atan2(math.sin(dl) * math.cos(p2), math.cos(p1) * math.sin(p2) - math.sin(p1) * math.cos(p2) * math.cos(dl))
+
+
+def route_offset_km(origin: tuple[float, float], destination: tuple[float, float], point: tuple[float, float]) -> tuple[float, float]:
+    """(along-track, off-route) km of a point relative to the great circle origin -> destination.
+
+    Off-route is the cross-track distance while the point is abeam the route,
+    else the distance to the nearer endpoint.
+    """
+    d13 = great_circle_km(*origin, *point) / EARTH_RADIUS_KM
+    delta = initial_bearing(*origin, *point) - initial_bearing(*origin, *destination)
+    cross = math.asin(max(-1.0, min(1.0, math.sin(d13) * math.sin(delta))))
+    along = math.acos(max(-1.0, min(1.0, math.cos(d13) / math.cos(cross)))) * EARTH_RADIUS_KM
+    if math.cos(delta) < 0:
+        along = -along
+    if along < 0:
+        return along, great_circle_km(*origin, *point)
+    if along > great_circle_km(*origin, *destination):
+        return along, great_circle_km(*destination, *point)
+    return along, abs(cross) * EARTH_RADIUS_KM
+
+
+def _station_point(station: dict[str, Any]) -> tuple[float, float]:
+    lon, lat = station["location"]["coordinates"]
+    return lat, lon
+
+
+class StationDirectory:
+    """Station name, coordinates, elevation and FIR from STATIONS_FILE.
+
+    Lookups use the in-memory copy (a few hundred stations scan in well under
+    a millisecond); sync() mirrors it into COLLECTION_STATIONS, whose 2dsphere
+    index serves $near/$geoWithin queries from other clients.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.stations: dict[str, dict[str, Any]] = {}  # ICAO -> station document
+        self.iata_to_icao: dict[str, str] = {}
+
+    def load(self) -> dict[str, dict[str, Any]]:
+        """Read the data file once; later calls return the in-memory copy."""
+        if not self.stations:
+            with open(self.path, encoding="utf-8") as fh:
+                rows = json.load(fh)
+            for row in rows:
+                icao = row["stationICAO"].upper()
+                self.stations[icao] = {
+                    "_id": icao,
+                    "stationICAO": icao,
+                    "stationIATA": row.get("stationIATA"),
+                    "name": row.get("name"),
+                    "elevationM": row.get("elevationM"),
+                    "fir": row.get("fir"),
+                    "location": {"type": "Point", "coordinates": [row["longitude"], row["latitude"]]},
+                }
+                if row.get("stationIATA"):
+                    self.iata_to_icao[row["stationIATA"].upper()] = icao
+        return self.stations
+
+    async def sync(self) -> int:
+        """Upsert every station into COLLECTION_STATIONS; returns the station count."""
+        try:
+            stations = self.load()
+            _, db = await get_mongodb_client()
+            await db[COLLECTION_STATIONS].bulk_write(
+                [ReplaceOne({"_id": icao}, doc, upsert=True) for icao, doc in stations.items()], ordered=False
+            )
+            logger.info("Synced station locations", extra={"stations": len(stations), "collection": COLLECTION_STATIONS})
+            return len(stations)
+        except Exception as e:
+            logger.warning("Station location sync skipped: %s", e)
+            return 0
+
+    def resolve(self, text: str) -> dict[str, Any] | None:
+        """Station by ICAO code, IATA code, or (case-insensitive) part of its name."""
+        stations = self.load()
+        code = text.strip().upper()
+        icao = code if code in stations else self.iata_to_icao.get(code)
+        if icao:
+            return stations[icao]
+        needle = text.strip().lower()
+        for icao in sorted(stations):
+            if needle and needle in (stations[icao].get("name") or "").lower():
+                return stations[icao]
+        return None
+
+    def nearest(self, lat: float, lon: float, k: int, max_distance_km: float | None = None) -> list[tuple[float, dict[str, Any]]]:
+        """Up to k (distance km, station) pairs, nearest first."""
+        ranked = sorted(
+            ((great_circle_km(lat, lon, *_station_point(s)), s) for s in self.load().values()),
+            key=lambda pair: pair[0],
+        )
+        if max_distance_km is not None:
+            ranked = [pair for pair in ranked if pair[0] <= max_distance_km]
+        return ranked[:k]
+
+    def corridor(
+        self, origin: dict[str, Any], destination: dict[str, Any], buffer_km: float
+    ) -> list[tuple[float, float, dict[str, Any]]]:
+        """(along-track km, off-route km, station) within buffer_km of the route, in route order."""
+        a, b = _station_point(origin), _station_point(destination)
+        hits = []
+        for station in self.load().values():
+            along, off = route_offset_km(a, b, _station_point(station))
+            if off <= buffer_km:
+                hits.append((along, off, station))
+        return sorted(hits, key=lambda hit: hit[0])
+
+
+station_directory = StationDirectory(STATIONS_FILE)
+
+
+# ------------------- Statistics -------------------------------------
+# Every figure of the statistics report in a single collection pass
+STATISTICS_PIPELINE: list[dict[str, Any]] = [
+    {"$facet": {
+        "total": [{"$count": "n"}],
+        "with_metar": [{"$match": {"hasMetarData": True}}, {"$count": "n"}],
+        "with_taf": [{"$match": {"hasTaforData": True}}, {"$count": "n"}],
+        "icao": [{"$group": {"_id": "$stationICAO"}}, {"$count": "n"}],
+        "iata": [{"$match": {"stationIATA": {"$ne": None}}}, {"$group": {"_id": "$stationIATA"}}, {"$count": "n"}],
+        "range": [{"$group": {
+            "_id": None,
+            "earliest": {"$min": "$metar.updatedTime"},
+            "latest": {"$max": "$metar.updatedTime"},
+        }}],
+    }},
+]
+STATISTICS_DOC_ID = "metar_statistics"
+
+async def compute_metar_statistics() -> dict[str, Any]:
+    """Run STATISTICS_PIPELINE and flatten its facets into one report dict."""
+    _, db = await get_mongodb_client()
+    rows = await db[COLLECTION_METAR].aggregate(STATISTICS_PIPELINE, allowDiskUse=True).to_list(1)
+    facets = rows[0] if rows else {}
+
+    def count(name: str) -> int:
+        return facets[name][0]["n"] if facets.get(name) else 0
+
+    date_range = facets["range"][0] if facets.get("range") else {}
+    return {
+        "total": count("total"),
+        "with_metar": count("with_metar"),
+        "with_taf": count("with_taf"),
+        "unique_icao": count("icao"),
+        "unique_iata": count("iata"),
+        "earliest": date_range.get("earliest"),
+        "latest": date_range.get("latest"),
+    }
+
+
+async def refresh_materialized_statistics() -> dict[str, Any]:
+    """Recompute the statistics and store them in COLLECTION_STATS."""
+    _, db = await get_mongodb_client()
+    stats = await compute_metar_statistics()
+    stats["refreshed_at"] = datetime.now()
+    await db[COLLECTION_STATS].replace_one({"_id": STATISTICS_DOC_ID}, stats, upsert=True)
+    return stats
+
+
+async def load_metar_statistics() -> dict[str, Any]:
+    """The materialized statistics when they are maintained, else a live computation."""
+    if STATISTICS_REFRESH_SECONDS > 0:
+        _, db = await get_mongodb_client()
+        stats = await db[COLLECTION_STATS].find_one({"_id": STATISTICS_DOC_ID})
+        if stats is not None:
+            return stats
+    return await compute_metar_statistics()
+
+
+# ------------------- Hourly / daily rollups -------------------------
+# One document per station, granularity and bucket, holding count and
+# min/max/sum/n of each metric, so trends over days read a few hundred small
+# documents instead of every raw METAR. The station-days of METARs past a
+# (metar.updatedTime, _id) high-water mark kept in the rollup collection are
+# recomputed from the METAR collection, so a re-ingested report or a retried
+# pass replaces buckets rather than adding to them.
+ROLLUP_GRANULARITIES = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+ROLLUP_METRICS = {
+    "temperature": "airTemperature",
+    "wind": "windSpeed",
+    "visibility": "horizontalVisibility",
+    "qnh": "observedQNH",
+}
+ROLLUP_INDEXES = [IndexModel([("stationICAO", 1), ("granularity", 1), ("bucketStart", 1)])]
+ROLLUP_STATE_ID = "_state"
+# Cache scope of a station's trends: retired when update_rollups rewrites its
+# buckets, not when the raw report arrives (the buckets lag behind it)
+ROLLUP_SCOPE_PREFIX = "rollups:"
+ROLLUP_BATCH_SIZE = 5000
+MAX_TREND_BUCKETS = 200
+
+
+def rollup_bucket_start(ts: datetime, granularity: str) -> datetime:
+    if granularity == "day":
+        return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+def rollup_buckets(docs: list[dict[str, Any]]) -> dict[str, dict[str, Any]]:
+    """The hourly and daily bucket documents of a set of METAR documents, by _id."""
+    buckets: dict[str, dict[str, Any]] = {}
+    for doc in docs:
+        station, ts = doc.get("stationICAO"), doc.get("timestamp")
+        if not station or not isinstance(ts, datetime):
+            continue
+        numeric = doc.get(NUMERIC_OBS_PREFIX) or build_numeric_observation(doc)
+        for granularity in ROLLUP_GRANULARITIES:
+            start = rollup_bucket_start(ts, granularity)
+            bucket_id = f"{station}:{granularity}:{start.isoformat()}"
+            bucket = buckets.setdefault(bucket_id, {
+                "_id": bucket_id, "stationICAO": station, "granularity": granularity, "bucketStart": start, "count": 0,
+            })
+            bucket["count"] += 1
+            for metric, field in ROLLUP_METRICS.items():
+                value = numeric.get(field)
+                if value is None:
+                    continue
+                stats = bucket.setdefault(metric, {"sum": 0.0, "n": 0, "min": value, "max": value})
+                stats["sum"] += value
+                stats["n"] += 1
+                stats["min"] = min(stats["min"], value)
+                stats["max"] = max(stats["max"], value)
+    return buckets
+
+
+def rollup_source_query(docs: list[dict[str, Any]]) -> dict[str, Any] | None:
+    """Every METAR on the station-days a batch of changed documents falls in, else None."""
+    days: dict[str, list[datetime]] = {}
+    for doc in docs:
+        station, ts = doc.get("stationICAO"), doc.get("timestamp")
+        if station and isinstance(ts, datetime):
+            days.setdefault(station, []).append(rollup_bucket_start(ts, "day"))
+    if not days:
+        return None
+    return {"$or": [
+        {"stationICAO": station, "timestamp": {"$gte": min(starts), "$lt": max(starts) + ROLLUP_GRANULARITIES["day"]}}
+        for station, starts in days.items()
+    ]}
+
+
+async def update_rollups(batch_size: int = ROLLUP_BATCH_SIZE) -> int:
+    """Rebuild the buckets of every METAR past the high-water mark; returns documents processed.
+
+    Each batch's buckets and the mark that follows it go out in one ordered
+    bulk write: the mark only moves once the buckets are written, and a batch
+    repeated after a failure recomputes the same buckets. Cached trends of the
+    stations written are retired afterwards.
+    """
+    _, db = await get_mongodb_client()
+    rollups = db[COLLECTION_ROLLUPS]
+    state = await rollups.find_one({"_id": ROLLUP_STATE_ID}) or {}
+    projection = {
+        "stationICAO": 1,
+        "timestamp": 1,
+        NUMERIC_OBS_PREFIX: 1,
+        "metar.decodedData.observation": 1,
+    }
+    processed = 0
+    while True:
+        query: dict[str, Any] = {"metar.updatedTime": {"$ne": None}}
+        if state.get("updatedTime") is not None:
+            query = {"$or": [
+                {"metar.updatedTime": {"$gt": state["updatedTime"]}},
+                {"metar.updatedTime": state["updatedTime"], "_id": {"$gt": state["lastId"]}},
+            ]}
+        docs = await (
+            db[COLLECTION_METAR].find(query, {"stationICAO": 1, "timestamp": 1, "metar.updatedTime": 1})
+            .sort([("metar.updatedTime", 1), ("_id", 1)])
+            .limit(batch_size)
+            .to_list(batch_size)
+        )
+        if not docs:
+            return processed
+        buckets: dict[str, dict[str, Any]] = {}
+        source_query = rollup_source_query(docs)
+        if source_query is not None:
+            buckets = rollup_buckets(await db[COLLECTION_METAR].find(source_query, projection).to_list(None))
+        ops = [ReplaceOne({"_id": bucket_id}, bucket, upsert=True) for bucket_id, bucket in buckets.items()]
+        state = {"updatedTime": docs[-1]["metar"]["updatedTime"], "lastId": docs[-1]["_id"]}
+        ops.append(ReplaceOne({"_id": ROLLUP_STATE_ID}, state, upsert=True))
+        await rollups.bulk_write(ops, ordered=True)
+        for station in {bucket["stationICAO"] for bucket in buckets.values()}:
+            result_cache.invalidate(ROLLUP_SCOPE_PREFIX + station, None)
+        processed += len(docs)
+        if len(docs) < batch_size:
+            return processed
+
+
+def summarize_rollups(buckets: list[dict[str, Any]]) -> dict[str, dict[str, float | None]]:
+    """Combine buckets into overall min/max/mean per metric."""
+    summary = {}
+    for metric in ROLLUP_METRICS:
+        parts = [b[metric] for b in buckets if (b.get(metric) or {}).get("n")]
+        n = sum(p["n"] for p in parts)
+        summary[metric] = {
+            "min": min((p["min"] for p in parts), default=None),
+            "max": max((p["max"] for p in parts), default=None),
+            "mean": sum(p["sum"] for p in parts) / n if n else None,
+        }
+    return summary
+
+
+# ------------------- Periodic background jobs -----------------------
+_periodic_tasks: dict[str, asyncio.Task] = {}
+
+
+async def _run_periodically(name: str, job: Callable[[], Awaitable[Any]], seconds: float) -> None:
+    while True:
+        try:
+            await job()
+        except Exception:
+            logger.exception("%s failed", name)
+        await asyncio.sleep(seconds)
+
+
+def start_periodic(name: str, job: Callable[[], Awaitable[Any]], seconds: float) -> None:
+    """Run job every `seconds` in the background (once per process per name)."""
+    task = _periodic_tasks.get(name)
+    if task is None or task.done():
+        _periodic_tasks[name] = asyncio.create_task(_run_periodically(name, job, seconds))
+
+
+async def stop_periodic_tasks() -> None:
+    for task in _periodic_tasks.values():
+        task.cancel()
+    for task in _periodic_tasks.values():
+        try:
+            await task
+        except (asyncio.CancelledError, Exception):
+            pass
+    _periodic_tasks.clear()
 
 
 def format_metar_data(metar_doc: dict[str, Any]) -> str:
@@ -61,39 +1503,826 @@ def format_metar_data(metar_doc: dict[str, Any]) -> str:
     iata = metar_doc.get('stationIATA', 'N/A')
     processed_timestamp = metar_doc.get('processed_timestamp', 'Unknown')
 
-    result = f"🛩️ Station: {station}"
+    parts = [f"🛩️ Station: {station}"]
     if iata:
-        result += f" ({iata})"
-    result += f"\n Last Updated: {processed_timestamp}\n"
+        parts.append(f" ({iata})")
+    parts.append(f"\n Last Updated: {processed_timestamp}\n")
 
     if metar_doc.get('hasMetarData') and 'metar' in metar_doc:
         metar = metar_doc['metar']
-        raw_data = metar.get('rawData', 'N/A')
-        result += f" Raw METAR: {raw_data}\n"
+        parts.append(f" Raw METAR: {metar.get('rawData', 'N/A')}\n")
 
         if 'decodedData' in metar and 'observation' in metar['decodedData']:
             obs = metar['decodedData']['observation']
-            result += "\n Weather Conditions:\n"
-            result += f" Temperature: {obs.get('airTemperature', 'N/A')}\n"
-            result += f" Dewpoint: {obs.get('dewpointTemperature', 'N/A')}\n"
-            wind_speed = obs.get('windSpeed', 'N/A')
-            wind_dir = obs.get('windDirection', 'N/A')
-            result += f" Wind: {wind_speed} from {wind_dir}\n"
-            result += f" Visibility: {obs.get('horizontalVisibility', 'N/A')}\n"
-            result += f" Pressure: {obs.get('observedQNH', 'N/A')}\n"
-
+            get = obs.get
+            parts.append(
+                "\n Weather Conditions:\n"
+                f" Temperature: {get('airTemperature', 'N/A')}\n"
+                f" Dewpoint: {get('dewpointTemperature', 'N/A')}\n"
+                f" Wind: {get('windSpeed', 'N/A')} from {get('windDirection', 'N/A')}\n"
+                f" Visibility: {get('horizontalVisibility', 'N/A')}\n"
+                f" Pressure: {get('observedQNH', 'N/A')}\n"
+            )
             if obs.get('cloudLayers'):
-                result += f" Clouds: {', '.join(obs['cloudLayers'])}\n"
-
+                parts.append(f" Clouds: {', '.join(obs['cloudLayers'])}\n")
             if obs.get('weatherConditions'):
-                result += f" Weather: {obs['weatherConditions']}\n"
+                parts.append(f" Weather: {obs['weatherConditions']}\n")
 
     if metar_doc.get('hasTaforData') and 'tafor' in metar_doc:
-        tafor = metar_doc['tafor']
-        raw_taf = tafor.get('rawData', 'N/A')
-        result += f"\n📊 TAF: {raw_taf}\n"
+        parts.append(f"\n📊 TAF: {metar_doc['tafor'].get('rawData', 'N/A')}\n")
+
+    return "".join(parts)
+
+
+# Only the fields format_metar_data reads, plus the sort/paging keys
+FORMATTER_PROJECTION: dict[str, int] = {
+    "stationICAO": 1,
+    "stationIATA": 1,
+    "processed_timestamp": 1,
+    "timestamp": 1,
+    "hasMetarData": 1,
+    "hasTaforData": 1,
+    "metar.updatedTime": 1,
+    "metar.rawData": 1,
+    **{
+        f"metar.decodedData.observation.{field}": 1
+        for field in (
+            "airTemperature",
+            "dewpointTemperature",
+            "windSpeed",
+            "windDirection",
+            "horizontalVisibility",
+            "observedQNH",
+            "cloudLayers",
+            "weatherConditions",
+        )
+    },
+    "tafor.rawData": 1,
+}
+# What the latest-observation feed reads: enough to render a document and to enrich it
+LATEST_PROJECTION: dict[str, int] = {**FORMATTER_PROJECTION, "metar.firRegion": 1, DERIVED_VERSION_FIELD: 1}
+
+
+def format_full_document(metar_doc: dict[str, Any]) -> str:
+    """format_metar_data plus the complete stored document as JSON."""
+    return render_cache.render(format_metar_data, metar_doc) + f" Document: {json.dumps(metar_doc, default=str)}\n"
+
+
+class RenderCache:
+    """LRU of rendered observation text keyed by (renderer, _id, metar.updatedTime, tafor.rawData).
+
+    A stored METAR does not change unless it is re-ingested, which moves
+    metar.updatedTime, so a document returned by many queries is formatted once.
+    The TAF is amended on its own schedule, so its text is part of the key.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple[str, Any, Any, Any], str] = OrderedDict()
+
+    def render(self, renderer: Callable[[dict[str, Any]], str], metar_doc: dict[str, Any]) -> str:
+        doc_id = metar_doc.get("_id")
+        if doc_id is None or self.max_entries <= 0:
+            return renderer(metar_doc)
+        key = (
+            renderer.__name__,
+            doc_id,
+            (metar_doc.get("metar") or {}).get("updatedTime"),
+            (metar_doc.get("tafor") or {}).get("rawData"),
+        )
+        text = self._entries.get(key)
+        if text is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return text
+        self.misses += 1
+        text = self._entries[key] = renderer(metar_doc)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return text
+
+    def metar_data(self, metar_doc: dict[str, Any]) -> str:
+        return self.render(format_metar_data, metar_doc)
+
+    def metar_line(self, metar_doc: dict[str, Any]) -> str:
+        return self.render(format_metar_line, metar_doc)
+
+    def stats(self) -> dict[str, int]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+render_cache = RenderCache(RENDER_CACHE_MAX_ENTRIES)
+
+
+class TransferStats:
+    """Per-tool totals of documents and BSON bytes read from MongoDB."""
+
+    def __init__(self) -> None:
+        self.calls: dict[str, int] = {}
+        self.documents: dict[str, int] = {}
+        self.bytes: dict[str, int] = {}
+
+    def record(self, tool: str, documents: int, size: int) -> None:
+        self.calls[tool] = self.calls.get(tool, 0) + 1
+        self.documents[tool] = self.documents.get(tool, 0) + documents
+        self.bytes[tool] = self.bytes.get(tool, 0) + size
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        return {
+            tool: {"calls": calls, "documents": self.documents[tool], "bytes": self.bytes[tool]}
+            for tool, calls in self.calls.items()
+        }
+
+
+transfer_stats = TransferStats()
+
+
+async def fetch_metar_documents(
+    tool: str,
+    query: dict[str, Any],
+    sort: list[tuple[str, int]],
+    limit: int,
+    full_document: bool = False,
+    max_time_ms: int | None = None,
+) -> list[dict[str, Any]]:
+    """Run a tool's find() with FORMATTER_PROJECTION (unless full_document).
+
+    Reads raw BSON batches so the bytes transferred are counted exactly.
+    """
+    _, db = await get_mongodb_client()
+    projection = None if full_document else FORMATTER_PROJECTION
+    cursor = db[COLLECTION_METAR].find_raw_batches(query, projection).sort(sort).limit(limit)
+    if max_time_ms:
+        cursor = cursor.max_time_ms(max_time_ms)
+    docs: list[dict[str, Any]] = []
+    size = 0
+    async for batch in cursor:
+        size += len(batch)
+        docs.extend(bson.decode_all(batch))
+    transfer_stats.record(tool, len(docs), size)
+    logger.debug("Fetched documents", extra={"tool": tool, "documents": len(docs), "bytes": size, "sampled": True})
+    return docs
+
+
+# ------------------- Keyset pagination ------------------------------
+SEARCH_SORT = [("timestamp", -1), ("_id", -1)]
+RAW_QUERY_SORT = [("metar.updatedTime", -1), ("_id", -1)]
+
+
+def _dotted_get(doc: dict[str, Any], path: str) -> Any:
+    value: Any = doc
+    for part in path.split("."):
+        value = value.get(part) if isinstance(value, dict) else None
+    return value
+
+
+def encode_page_cursor(sort_field: str, last_doc: dict[str, Any]) -> str:
+    """Opaque continuation token for the page ending at last_doc."""
+    payload = {"f": sort_field, "v": _dotted_get(last_doc, sort_field), "id": last_doc["_id"]}
+    return base64.urlsafe_b64encode(json_util.dumps(payload).encode()).decode().rstrip("=")
+
+
+def apply_page_cursor(query: dict[str, Any], sort_field: str, token: str) -> dict[str, Any]:
+    """Restrict a (sort_field desc, _id desc) query to documents after the cursor.
+
+    The bound is a range on the sort key, so the next page is read straight
+    off the index instead of skipping over earlier pages.
+    """
+    try:
+        payload = json_util.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(payload, dict) or payload.get("f") != sort_field or "id" not in payload:
+        raise ValueError("Cursor does not belong to this tool")
+    value, last_id = payload.get("v"), payload["id"]
+    return {"$and": [
+        query,
+        {sort_field: {"$lte": value}},
+        {"$nor": [{sort_field: value, "_id": {"$gte": last_id}}]},
+    ]}
+
+
+def next_page_cursor(sort_field: str, results: list[dict[str, Any]], limit: int) -> str | None:
+    """Cursor for the next page, when the page was full."""
+    return encode_page_cursor(sort_field, results[-1]) if results and len(results) >= limit else None
+
+
+def next_page_line(sort_field: str, results: list[dict[str, Any]], limit: int) -> str:
+    """Footer carrying the cursor for the next page, when the page was full."""
+    token = next_page_cursor(sort_field, results, limit)
+    return f"Next page: cursor={token}\n" if token else ""
+
+
+# ------------------- Compact output ---------------------------------
+# Opt-in machine-oriented tool output: the same figures without banners,
+# separators or per-field labels. "toon" is a TOON document (a table declares
+# its fields once, then one comma-separated line per row); "columns" is
+# compact JSON with one array per column.
+OUTPUT_FORMATS = ("text", "toon", "columns")
+
+# (column, document path) of a METAR row
+METAR_ROW_COLUMNS: list[tuple[str, str]] = [
+    ("icao", "stationICAO"),
+    ("iata", "stationIATA"),
+    ("time", "timestamp"),
+    ("temp", "metar.decodedData.observation.airTemperature"),
+    ("dew", "metar.decodedData.observation.dewpointTemperature"),
+    ("wind", "metar.decodedData.observation.windSpeed"),
+    ("wind_dir", "metar.decodedData.observation.windDirection"),
+    ("vis", "metar.decodedData.observation.horizontalVisibility"),
+    ("qnh", "metar.decodedData.observation.observedQNH"),
+    ("wx", "metar.decodedData.observation.weatherConditions"),
+    ("clouds", "metar.decodedData.observation.cloudLayers"),
+    ("metar", "metar.rawData"),
+    ("taf", "tafor.rawData"),
+]
+_NUMERIC_COLUMNS = {"temp", "dew", "wind", "wind_dir", "vis", "qnh"}
+
+
+def unknown_output_format(output_format: str) -> str | None:
+    """The error message for an unsupported output_format, else None."""
+    if output_format in OUTPUT_FORMATS:
+        return None
+    return f"Unknown output_format: {output_format} (use 'text', 'toon' or 'columns')"
+
+
+def compact_number(value: float | None) -> int | float | None:
+    if value is None:
+        return None
+    return int(value) if float(value).is_integer() else round(value, 1)
+
+
+def compact_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat(timespec="minutes")
+    if isinstance(value, ObjectId):
+        return str(value)
+    return value
+
+
+def metar_row(doc: dict[str, Any], full_document: bool = False) -> dict[str, Any]:
+    """One document as a flat row of METAR_ROW_COLUMNS (observation values as numbers)."""
+    row: dict[str, Any] = {}
+    for column, path in METAR_ROW_COLUMNS:
+        value = _dotted_get(doc, path)
+        if column in _NUMERIC_COLUMNS:
+            value = compact_number(parse_observation_number(value))
+        elif column == "clouds":
+            value = " ".join(value) if value else None
+        elif column == "metar" and not doc.get("hasMetarData"):
+            value = None
+        elif column == "taf" and not doc.get("hasTaforData"):
+            value = None
+        row[column] = None if value == "" else compact_value(value)
+    if full_document:
+        row["document"] = json.dumps(doc, default=str, separators=(",", ":"))
+    return row
+
+
+_TOON_KEY_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_.]*$")
+_TOON_NUMBER_LIKE_RE = re.compile(r"^-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?$")
+_TOON_NEEDS_QUOTES_RE = re.compile(r'[,:"\\\[\]{}\n\r\t]|^\s|\s$|^-')
+
+
+def _toon_key(key: Any) -> str:
+    key = str(key)
+    return key if _TOON_KEY_RE.match(key) else json.dumps(key, ensure_ascii=False)
+
+
+def _toon_scalar(value: Any) -> str:
+    value = compact_value(value)
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, int | float):
+        return str(compact_number(value)) if isinstance(value, float) else str(value)
+    text = str(value)
+    if (
+        not text
+        or text in ("true", "false", "null")
+        or _TOON_NUMBER_LIKE_RE.match(text)
+        or _TOON_NEEDS_QUOTES_RE.search(text)
+    ):
+        return json.dumps(text, ensure_ascii=False)
+    return text
+
+
+def _toon_array(key: str, items: list[Any], depth: int) -> list[str]:
+    pad = "  " * depth
+    if all(not isinstance(item, dict | list) for item in items):
+        return [f"{pad}{key}[{len(items)}]:" + (" " + ",".join(map(_toon_scalar, items)) if items else "")]
+    fields = list(items[0]) if isinstance(items[0], dict) else []
+    if fields and all(
+        isinstance(item, dict) and list(item) == fields and not any(isinstance(v, dict | list) for v in item.values())
+        for item in items
+    ):
+        lines = [f"{pad}{key}[{len(items)}]{{{','.join(map(_toon_key, fields))}}}:"]
+        lines += [f"{pad}  " + ",".join(_toon_scalar(item[f]) for f in fields) for item in items]
+        return lines
+    lines = [f"{pad}{key}[{len(items)}]:"]
+    for item in items:
+        if isinstance(item, dict) and item:
+            sub = _toon_fields(item, depth + 2)
+            lines.append(f"{pad}  - {sub[0].lstrip()}")
+            lines += sub[1:]
+        else:
+            lines.append(f"{pad}  - {_toon_scalar(item if not isinstance(item, dict | list) else json.dumps(item, default=str))}")
+    return lines
+
+
+def _toon_fields(obj: dict[str, Any], depth: int) -> list[str]:
+    pad = "  " * depth
+    lines: list[str] = []
+    for key, value in obj.items():
+        if isinstance(value, dict):
+            lines.append(f"{pad}{_toon_key(key)}:")
+            lines += _toon_fields(value, depth + 1)
+        elif isinstance(value, list):
+            lines += _toon_array(_toon_key(key), value, depth)
+        else:
+            lines.append(f"{pad}{_toon_key(key)}: {_toon_scalar(value)}")
+    return lines
+
+
+def encode_toon(payload: dict[str, Any]) -> str:
+    """A dict as a TOON document; lists of same-keyed flat dicts become tables."""
+    return "\n".join(_toon_fields(payload, 0)) + "\n"
+
+
+def encode_columns(payload: dict[str, Any]) -> str:
+    """A dict as compact JSON; lists of dicts become {column: [values]}."""
+    def columnar(value: Any) -> Any:
+        if isinstance(value, list) and value and all(isinstance(item, dict) for item in value):
+            columns = list(dict.fromkeys(key for item in value for key in item))
+            return {column: [columnar(item.get(column)) for item in value] for column in columns}
+        if isinstance(value, dict):
+            return {key: columnar(v) for key, v in value.items()}
+        return compact_value(value)
+    return json.dumps(columnar(payload), default=str, ensure_ascii=False, separators=(",", ":"))
+
+
+def render_compact(payload: dict[str, Any], output_format: str) -> str:
+    return encode_toon(payload) if output_format == "toon" else encode_columns(payload)
+
+
+# ------------------- Incremental sync -------------------------------
+# Downstream consumers poll for documents inserted or updated after a mark.
+# The mark is the (metar.updatedTime, _id) of the last document handed out,
+# so each poll is one range scan of the metar.updatedTime index starting
+# there, and steady-state polling transfers only new observations.
+SYNC_FIELD = "metar.updatedTime"
+SYNC_SORT = [(SYNC_FIELD, 1), ("_id", 1)]
+
+
+def encode_sync_mark(last_doc: dict[str, Any]) -> str:
+    payload = {"u": _dotted_get(last_doc, SYNC_FIELD), "id": last_doc["_id"]}
+    return base64.urlsafe_b64encode(json_util.dumps(payload).encode()).decode().rstrip("=")
+
+
+def changes_since_query(mark: str | None) -> dict[str, Any]:
+    """Documents after `mark` (all documents with an updatedTime when there is none)."""
+    if not mark:
+        return {SYNC_FIELD: {"$gt": datetime.min}}
+    try:
+        payload = json_util.loads(base64.urlsafe_b64decode(mark + "=" * (-len(mark) % 4)))
+    except Exception as e:
+        raise ValueError("Invalid mark") from e
+    if not isinstance(payload, dict) or not isinstance(payload.get("u"), datetime) or "id" not in payload:
+        raise ValueError("Invalid mark")
+    updated, last_id = payload["u"], payload["id"]
+    return {"$and": [
+        {SYNC_FIELD: {"$gte": updated}},
+        {"$nor": [{SYNC_FIELD: updated, "_id": {"$lte": last_id}}]},
+    ]}
+
+
+async def fetch_changes(
+    tool: str, mark: str | None, batch_size: int, full_document: bool = False
+) -> tuple[list[dict[str, Any]], str | None, bool]:
+    """(documents after mark in update order, the new mark, whether more are waiting)."""
+    docs = await fetch_metar_documents(tool, changes_since_query(mark), SYNC_SORT, batch_size + 1, full_document)
+    has_more = len(docs) > batch_size
+    docs = docs[:batch_size]
+    return docs, encode_sync_mark(docs[-1]) if docs else mark, has_more
+
+
+# ------------------- Raw query guard --------------------------------
+# Query operators an LLM-written filter may use; anything else ($where, $expr,
+# $function, $jsonSchema, ...) can run arbitrary server-side work.
+RAW_QUERY_ALLOWED_OPERATORS = frozenset({
+    "$and", "$or", "$nor", "$not",
+    "$eq", "$ne", "$gt", "$gte", "$lt", "$lte", "$in", "$nin",
+    "$exists", "$type", "$regex", "$options",
+    "$all", "$elemMatch", "$size",
+})
+
+
+class QueryTooExpensive(Exception):
+    """A raw query refused by the guard; the message is shown to the caller."""
+
+
+class QueryGuardStats:
+    """Counters for raw queries checked, rejected and timed out."""
+
+    def __init__(self) -> None:
+        self.checked = 0
+        self.rejected_operator = 0
+        self.rejected_collscan = 0
+        self.timeouts = 0
+
+    def stats(self) -> dict[str, int]:
+        return dict(vars(self))
+
+
+query_guard_stats = QueryGuardStats()
+
+
+def disallowed_operators(query: Any) -> set[str]:
+    """Every $-operator in a filter that is not in RAW_QUERY_ALLOWED_OPERATORS."""
+    found: set[str] = set()
+    if isinstance(query, dict):
+        for key, value in query.items():
+            if key.startswith("$") and key not in RAW_QUERY_ALLOWED_OPERATORS:
+                found.add(key)
+            found |= disallowed_operators(value)
+    elif isinstance(query, list):
+        for item in query:
+            found |= disallowed_operators(item)
+    return found
+
+
+def summarize_plan(plan: dict[str, Any]) -> str:
+    """One-line winning plan, e.g. "LIMIT > FETCH > IXSCAN(stationICAO_1_timestamp_-1)"."""
+    parts = []
+    node: Any = plan.get("queryPlan", plan)
+    while isinstance(node, dict) and node.get("stage"):
+        stage = node["stage"]
+        parts.append(f"{stage}({node['indexName']})" if node.get("indexName") else stage)
+        node = node.get("inputStage") or (node.get("inputStages") or [None])[0]
+    return " > ".join(parts) or "unknown"
+
+
+async def guard_raw_query(query: dict[str, Any], sort: list[tuple[str, int]], limit: int) -> None:
+    """Refuse a raw query with disallowed operators, or one that scans a large collection in full.
+
+    A full scan is a COLLSCAN, or an unbounded walk of the sort index with the
+    filter applied after FETCH (how mongod plans an unselective filter when an
+    index provides the sort).
+    """
+    query_guard_stats.checked += 1
+    blocked = disallowed_operators(query)
+    if blocked:
+        query_guard_stats.rejected_operator += 1
+        raise QueryTooExpensive(f"operators not allowed: {', '.join(sorted(blocked))}")
+
+    plan = await explain_find(query, sort, limit)
+    scan = "collection" if COLLSCAN_STAGE in plan_stages(plan) else "index" if unbounded_index_scans(plan) else None
+    if scan:
+        total = (await station_catalog.get()).total_reports
+        if total > RAW_QUERY_COLLSCAN_MAX_DOCS:
+            query_guard_stats.rejected_collscan += 1
+            raise QueryTooExpensive(
+                f"full {scan} scan over ~{total:,} documents (plan: {summarize_plan(plan)}). "
+                "Filter on an indexed field such as stationICAO, timestamp or metar.updatedTime."
+            )
+
+
+# ------------------- Metrics ----------------------------------------
+LATENCY_BUCKETS_SECONDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+RESULT_SIZE_BUCKETS_BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense (plain counters, no locking)."""
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def exposition(self, name: str, labels: str) -> list[str]:
+        lines = []
+        cumulative = 0
+        for bound, n in zip((*self.buckets, "+Inf"), self.counts, strict=True):
+            cumulative += n
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f"{name}_sum{{{labels}}} {self.total:.6f}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+class ToolMetrics:
+    """Per-tool call, error and in-flight counters with latency and result-size histograms."""
+
+    def __init__(self) -> None:
+        self.calls: dict[str, int] = {}
+        self.errors: dict[str, int] = {}
+        self.in_flight: dict[str, int] = {}
+        self.latency: dict[str, Histogram] = {}
+        self.result_bytes: dict[str, Histogram] = {}
+
+    def started(self, tool: str) -> None:
+        self.calls[tool] = self.calls.get(tool, 0) + 1
+        self.in_flight[tool] = self.in_flight.get(tool, 0) + 1
+
+    def finished(self, tool: str, seconds: float, result: Any, failed: bool) -> None:
+        self.in_flight[tool] -= 1
+        if failed:
+            self.errors[tool] = self.errors.get(tool, 0) + 1
+        self.latency.setdefault(tool, Histogram(LATENCY_BUCKETS_SECONDS)).observe(seconds)
+        if isinstance(result, str):
+            self.result_bytes.setdefault(tool, Histogram(RESULT_SIZE_BUCKETS_BYTES)).observe(len(result.encode()))
+
+
+tool_metrics = ToolMetrics()
+_tool_failed: ContextVar[bool] = ContextVar("_tool_failed", default=False)
+
+
+def mark_tool_error() -> None:
+    """Count the current tool call as an error (tools report failures as text)."""
+    _tool_failed.set(True)
+
+
+def metered_tool(fn: Callable[..., Awaitable[str]]) -> Callable[..., Awaitable[str]]:
+    """Record calls, errors, in-flight count, latency and result size of a tool."""
+
+    @functools.wraps(fn)
+    async def wrapper(*args: Any, **kwargs: Any) -> str:
+        tool = fn.__name__
+        tool_metrics.started(tool)
+        token = _tool_failed.set(False)
+        started = time.perf_counter()
+        result: Any = None
+        try:
+            result = await fn(*args, **kwargs)
+            return result
+        except Exception:
+            mark_tool_error()
+            raise
+        finally:
+            tool_metrics.finished(tool, time.perf_counter() - started, result, _tool_failed.get())
+            _tool_failed.reset(token)
+
+    return wrapper
+
 
-    return result
+class MongoCommandMetrics(CommandListener):
+    """Mongo command latency by command name, from pymongo command events.
+
+    Events arrive on Motor's worker threads, hence the lock.
+    """
+
+    def __init__(self) -> None:
+        self.latency: dict[str, Histogram] = {}
+        self.failures: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def started(self, event: Any) -> None:
+        pass
+
+    def succeeded(self, event: Any) -> None:
+        with self._lock:
+            self.latency.setdefault(event.command_name, Histogram(LATENCY_BUCKETS_SECONDS)).observe(event.duration_micros / 1e6)
+
+    def failed(self, event: Any) -> None:
+        with self._lock:
+            self.failures[event.command_name] = self.failures.get(event.command_name, 0) + 1
+            self.latency.setdefault(event.command_name, Histogram(LATENCY_BUCKETS_SECONDS)).observe(event.duration_micros / 1e6)
+
+
+mongo_command_metrics = MongoCommandMetrics()
+
+
+def render_metrics() -> str:
+    """All counters in the Prometheus text exposition format (version 0.0.4)."""
+    lines: list[str] = []
+
+    def family(name: str, kind: str, help_text: str) -> None:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    family("metar_tool_calls_total", "counter", "MCP tool calls.")
+    lines += [f'metar_tool_calls_total{{tool="{t}"}} {n}' for t, n in sorted(tool_metrics.calls.items())]
+    family("metar_tool_errors_total", "counter", "MCP tool calls that failed.")
+    lines += [f'metar_tool_errors_total{{tool="{t}"}} {tool_metrics.errors.get(t, 0)}' for t in sorted(tool_metrics.calls)]
+    family("metar_tool_in_flight", "gauge", "MCP tool calls currently running.")
+    lines += [f'metar_tool_in_flight{{tool="{t}"}} {n}' for t, n in sorted(tool_metrics.in_flight.items())]
+    family("metar_tool_latency_seconds", "histogram", "MCP tool call latency.")
+    for t, h in sorted(tool_metrics.latency.items()):
+        lines += h.exposition("metar_tool_latency_seconds", f'tool="{t}"')
+    family("metar_tool_result_bytes", "histogram", "Size of MCP tool results.")
+    for t, h in sorted(tool_metrics.result_bytes.items()):
+        lines += h.exposition("metar_tool_result_bytes", f'tool="{t}"')
+
+    with mongo_command_metrics._lock:
+        command_latency = {c: h.exposition("metar_mongo_command_seconds", f'command="{c}"') for c, h in mongo_command_metrics.latency.items()}
+        command_failures = dict(mongo_command_metrics.failures)
+    family("metar_mongo_command_seconds", "histogram", "Mongo command round-trip latency.")
+    for c in sorted(command_latency):
+        lines += command_latency[c]
+    family("metar_mongo_command_failures_total", "counter", "Mongo commands that failed.")
+    lines += [f'metar_mongo_command_failures_total{{command="{c}"}} {n}' for c, n in sorted(command_failures.items())]
+
+    pool = pool_stats.stats()
+    family("metar_mongo_pool_open_connections", "gauge", "Open connections in the Mongo pool.")
+    lines.append(f"metar_mongo_pool_open_connections {pool['open_connections']}")
+    family("metar_mongo_pool_checkout_wait_seconds_max", "gauge", "Longest wait for a pooled Mongo connection.")
+    lines.append(f"metar_mongo_pool_checkout_wait_seconds_max {pool['checkout_wait_ms_max'] / 1000:.6f}")
+
+    caches = {
+        "result": result_cache.stats(),
+        "latest_observation": latest_cache.stats(),
+        "verified_token": auth.stats(),
+        "azure_token": token_cache.stats(),
+        "rendered_observation": render_cache.stats(),
+    }
+    family("metar_cache_hits_total", "counter", "Cache lookups answered from the cache (coalesced included).")
+    for name, stats in caches.items():
+        lines.append(f'metar_cache_hits_total{{cache="{name}"}} {stats["hits"] + stats.get("coalesced", 0)}')
+    family("metar_cache_misses_total", "counter", "Cache lookups that had to compute or fetch.")
+    for name, stats in caches.items():
+        lines.append(f'metar_cache_misses_total{{cache="{name}"}} {stats.get("misses", stats.get("fetches", 0))}')
+    family("metar_cache_hit_ratio", "gauge", "Cache hit ratio since start.")
+    for name, stats in caches.items():
+        hits = stats["hits"] + stats.get("coalesced", 0)
+        lookups = hits + stats.get("misses", stats.get("fetches", 0)) + stats.get("stale", 0)
+        lines.append(f'metar_cache_hit_ratio{{cache="{name}"}} {hits / lookups if lookups else 0.0:.4f}')
+    family("metar_result_cache_in_flight", "gauge", "Result cache computations currently running.")
+    lines.append(f"metar_result_cache_in_flight {caches['result']['inflight']}")
+    return "\n".join(lines) + "\n"
+
+
+# ------------------- Tool result cache ------------------------------
+_result_cacheable: ContextVar[bool] = ContextVar("_result_cacheable", default=True)
+# (stations, observed up to) the current tool result reads; None is every report
+ResultScope = tuple[frozenset[str], datetime | None]
+_result_scope: ContextVar[ResultScope | None] = ContextVar("_result_scope", default=None)
+
+
+def mark_uncacheable() -> None:
+    """Keep the current tool result (an error, a timeout) out of the result cache."""
+    _result_cacheable.set(False)
+
+
+def cache_scope(stations: Iterable[str] | None, until: datetime | None = None) -> None:
+    """Declare that the current tool result only reads these stations' reports (observed up to `until`).
+
+    Updates elsewhere then leave it cached. Without a scope (or with
+    stations=None), any update retires it.
+    """
+    if stations is not None:
+        _result_scope.set((frozenset(stations), until))
+
+
+def query_stations(query: dict[str, Any]) -> list[str] | None:
+    """The stations an exact stationICAO match or $in limits a query to, else None."""
+    for clause in (query, *query.get("$and", ())):
+        value = clause.get("stationICAO") if isinstance(clause, dict) else None
+        if isinstance(value, str):
+            return [value]
+        if isinstance(value, dict) and list(value) == ["$in"] and all(isinstance(v, str) for v in value["$in"]):
+            return value["$in"]
+    return None
+
+
+def _scope_overlaps(scope: ResultScope | None, station: str, observed: datetime | None) -> bool:
+    if scope is None:
+        return True
+    stations, until = scope
+    return station in stations and (until is None or observed is None or observed <= until)
+
+
+class QueryResultCache:
+    """LRU cache of tool results with single-flight for identical calls.
+
+    Entries expire when the next METAR update is due (newest metar.updatedTime
+    plus METAR_UPDATE_INTERVAL_SECONDS). The latest-observation feed retires
+    them earlier, but only those whose scope (see cache_scope) covers the
+    updated station and observation time; a result computed while such an
+    update arrived is not stored.
+    """
+
+    def __init__(self, max_entries: int, min_ttl_seconds: float, max_ttl_seconds: float):
+        self.max_entries = max_entries
+        self.min_ttl_seconds = min_ttl_seconds
+        self.max_ttl_seconds = max_ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidated = 0
+        self._entries: OrderedDict[str, tuple[float, ResultScope | None, str]] = OrderedDict()
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._inflight_updates: dict[str, list[tuple[str, datetime | None]]] = {}
+
+    def ttl_seconds(self, newest: datetime | None) -> float:
+        if not isinstance(newest, datetime):
+            return self.max_ttl_seconds
+        due = (newest + timedelta(seconds=METAR_UPDATE_INTERVAL_SECONDS) - datetime.now()).total_seconds()
+        return min(max(due, self.min_ttl_seconds), self.max_ttl_seconds)
+
+    def _get(self, key: str) -> tuple[bool, str | None]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        expires_at, _, value = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[key]
+            return False, None
+        self._entries.move_to_end(key)
+        return True, value
+
+    def _store(self, key: str, value: str, scope: ResultScope | None) -> None:
+        expires_at = time.monotonic() + self.ttl_seconds(latest_cache.high_water)
+        self._entries[key] = (expires_at, scope, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, station: str, observed: datetime | None) -> None:
+        """Retire the entries, and hold back the in-flight results, that an update to a station's report overlaps."""
+        stale = [key for key, (_, scope, _) in self._entries.items() if _scope_overlaps(scope, station, observed)]
+        for key in stale:
+            del self._entries[key]
+        self.invalidated += len(stale)
+        for updates in self._inflight_updates.values():
+            updates.append((station, observed))
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[str]]) -> str:
+        found, value = self._get(key)
+        if found:
+            self.hits += 1
+            return value  # type: ignore[return-value]
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(inflight)
+
+        self.misses += 1
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        updates = self._inflight_updates[key] = []
+        token = _result_cacheable.set(True)
+        scope_token = _result_scope.set(None)
+        try:
+            value = await compute()
+            scope = _result_scope.get()
+            if _result_cacheable.get() and not any(_scope_overlaps(scope, *update) for update in updates):
+                self._store(key, value, scope)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # retrieved here when nobody else was waiting
+            raise
+        finally:
+            _result_cacheable.reset(token)
+            _result_scope.reset(scope_token)
+            del self._inflight[key]
+            del self._inflight_updates[key]
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "invalidated": self.invalidated,
+            "hit_ratio": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+            "inflight": len(self._inflight),
+        }
+
+
+result_cache = QueryResultCache(RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_MIN_TTL_SECONDS, METAR_UPDATE_INTERVAL_SECONDS)
+
+
+def cached_tool(fn: Callable[..., Awaitable[str]]) -> Callable[..., Awaitable[str]]:
+    """Serve a tool through result_cache, keyed by all its arguments with defaults applied."""
+    signature = inspect.signature(fn)
+
+    @functools.wraps(fn)
+    async def wrapper(*args: Any, **kwargs: Any) -> str:
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        key = fn.__name__ + ":" + json_util.dumps(bound.arguments, sort_keys=True)
+        return await result_cache.get_or_compute(key, lambda: fn(*args, **kwargs))
+
+    return wrapper
 
 
 @mcp.resource("resource://metar_json_schema")
@@ -143,12 +2372,26 @@ async def metar_format():
             "rawData": "String",
             "updatedTime": "Null",
             "timestamp": "DateTime (ISO 8601)"
-        }
+        },
+        NUMERIC_OBS_PREFIX: {field: "Double (indexed, use for range queries)" for field in NUMERIC_OBS_FIELDS},
+        METAR_GROUPS_FIELD: ["String (indexed upper-case METAR groups, e.g. 'FEW020', 'TSRA', 'CB')"],
+        FIR_REGION_KEY_FIELD: "String (indexed lower-case metar.firRegion)",
+        DERIVED_VERSION_FIELD: "Int (indexed; version of the derived fields above)",
     }
     return schema
 
 
+# search_metar_data arguments echoed as "filters" in compact output
+SEARCH_FILTER_PARAMS = (
+    "station_icao", "station_iata", "weather_condition", "temperature_min", "temperature_max",
+    "visibility_min", "visibility_max", "wind_speed_min", "wind_speed_max", "pressure_min",
+    "pressure_max", "cloud_type", "fir_region", "hours_back",
+)
+
+
 @mcp.tool()
+@metered_tool
+@cached_tool
 async def search_metar_data(
     station_icao: str | None = None,
     station_iata: str | None = None,
@@ -164,14 +2407,17 @@ async def search_metar_data(
     cloud_type: str | None = None,
     fir_region: str | None = None,
     hours_back: int | None = None,
-    limit: int = 10
+    limit: int = 10,
+    full_document: bool = False,
+    cursor: str | None = None,
+    output_format: str = "text",
 ) -> str:
     """Generic search for METAR data with multiple optional filters.
 
     Args:
     station_icao: Filter by ICAO code (e.g., 'VOTP', 'VIDP', 'VOBG')
     station_iata: Filter by IATA code (e.g., 'TIR', 'BOM', 'DEL')
-    weather_condition: Search in raw METAR data (e.g., 'Rain', 'fog', 'CB')
+    weather_condition: Weather group or word in the METAR (e.g., 'TSRA', 'RA', 'Rain', 'fog')
     temperature_min: Minimum temperature in Celsius
     temperature_max: Maximum temperature in Celsius
     visibility_min: Minimum visibility in meters
@@ -180,11 +2426,17 @@ async def search_metar_data(
     wind_speed_max: Maximum wind speed in m/s
     pressure_min: Minimum pressure in hPa
     pressure_max: Maximum pressure in hPa
-    cloud_type: Search for cloud types in raw data (e.g., 'CB', 'SCT', 'OVC')
-    fir_region: Filter by FIR region (e.g., 'Chennai', 'Mumbai')
+    cloud_type: Cloud group or its prefix in the METAR (e.g., 'CB', 'SCT', 'OVC010')
+    fir_region: FIR region or its prefix (e.g., 'Chennai', 'Mumbai')
     hours_back: Look back N hours from now
-    limit: Maximum results to return (set default as: 10, max: 50)
+    limit: Maximum results to return (set default as: 10, max: 50).
+        Use limit=1 with only a station for its current weather.
+    full_document: Also return every stored field of each document as JSON
+    cursor: "Next page" cursor from a previous call with the same filters
+    output_format: 'text' (default), or 'toon' / 'columns' for compact rows
     """
+    if error := unknown_output_format(output_format):
+        return error
     try:
         _, db = await get_mongodb_client()
 
@@ -194,69 +2446,90 @@ async def search_metar_data(
         # Station filters
         if station_icao:
             query["stationICAO"] = station_icao.upper()
-        if station_iata:
+        if station_iata and not station_icao:
+            query.update(await station_catalog.iata_filter(station_iata))
+        elif station_iata:
             query["stationIATA"] = station_iata.upper()
 
+        # Filters on the derived search fields, and their raw-field fallback for documents not yet enriched
+        derived: dict[str, Any] = {}
+        raw: dict[str, Any] = {}
+        ranges: dict[str, dict[str, float]] = {}
+
         # FIR region filter
         if fir_region:
-            query["metar.firRegion"] = {"$regex": fir_region, "$options": "i"}
+            derived.update(fir_region_filter(fir_region))
+            raw.update(raw_fir_region_filter(fir_region))
 
         # Time filter
         if hours_back:
             time_threshold = datetime.now() - timedelta(hours=hours_back)
             query["timestamp"] = {"$gte": time_threshold}
 
-        # Weather condition filter (search in raw METAR data)
-        if weather_condition:
-            query["metar.decodedData.observation.weatherConditions"] = weather_condition
-
-        # Cloud type filter (search in raw METAR data)
-        if cloud_type:
-            query["metar.rawData"] = {"$regex": cloud_type, "$options": "i"}
+        # Weather and cloud filters (groups of the raw METAR data)
+        derived.update(metar_group_filters(weather_condition, cloud_type))
+        raw.update(raw_metar_group_filters(weather_condition, cloud_type))
 
         # Temperature filters
         if (temperature_min is not None) or (temperature_max is not None):
             temp_query: dict[str, Any] = {}
             if temperature_min is not None:
-                temp_query["$gte"] = str(temperature_min)
+                temp_query["$gte"] = float(temperature_min)
             if temperature_max is not None:
-                temp_query["$lte"] = str(temperature_max)
-            query["metar.decodedData.observation.airTemperature"] = temp_query
+                temp_query["$lte"] = float(temperature_max)
+            ranges["airTemperature"] = temp_query
 
         # Visibility filters
         if (visibility_min is not None) or (visibility_max is not None):
             vis_query: dict[str, Any] = {}
             if visibility_min is not None:
-                vis_query["$gte"] = str(visibility_min)
+                vis_query["$gte"] = float(visibility_min)
             if visibility_max is not None:
-                vis_query["$lte"] = str(visibility_max)
-            query["metar.decodedData.observation.horizontalVisibility"] = vis_query
+                vis_query["$lte"] = float(visibility_max)
+            ranges["horizontalVisibility"] = vis_query
 
         # Wind speed filters
         if (wind_speed_min is not None) or (wind_speed_max is not None):
             wind_query: dict[str, Any] = {}
             if wind_speed_min is not None:
-                wind_query["$gte"] = str(wind_speed_min)
+                wind_query["$gte"] = float(wind_speed_min)
             if wind_speed_max is not None:
-                wind_query["$lte"] = str(wind_speed_max)
-            query["metar.decodedData.observation.windSpeed"] = wind_query
+                wind_query["$lte"] = float(wind_speed_max)
+            ranges["windSpeed"] = wind_query
 
         # Pressure filters
         if (pressure_min is not None) or (pressure_max is not None):
             pressure_query: dict[str, Any] = {}
             if pressure_min is not None:
-                pressure_query["$gte"] = str(pressure_min)
+                pressure_query["$gte"] = float(pressure_min)
             if pressure_max is not None:
-                pressure_query["$lte"] = str(pressure_max)
-            query["metar.decodedData.observation.observedQNH"] = pressure_query
+                pressure_query["$lte"] = float(pressure_max)
+            ranges["observedQNH"] = pressure_query
+
+        derived.update({f"{NUMERIC_OBS_PREFIX}.{field}": bounds for field, bounds in ranges.items()})
+        raw.update(raw_observation_ranges(ranges))
+        query.update(derived_field_filter(derived, raw))
 
         # Limit results
         limit = min(limit, 50)
+        cache_scope(query_stations(query))
+
+        # Current weather at one station is answered from memory
+        results = latest_cache.lookup(query) if limit == 1 and not (full_document or cursor) else None
 
         # Execute the query
-        print(f"🔍 Executing MongoDB query: {query}")
-        cursor = db[COLLECTION_METAR].find(query).sort("timestamp", -1).limit(limit)
-        results = await cursor.to_list(length=limit)
+        if results is None:
+            page_query = apply_page_cursor(query, "timestamp", cursor) if cursor else query
+            logger.debug("Executing MongoDB query", extra={"tool": "search_metar_data", "query": page_query, "sampled": True})
+            results = await fetch_metar_documents("search_metar_data", page_query, SEARCH_SORT, limit, full_document)
+
+        if output_format != "text":
+            return render_compact({
+                "filters": {k: v for k, v in locals().items() if k in SEARCH_FILTER_PARAMS and v is not None},
+                "count": len(results),
+                "rows": [metar_row(doc, full_document) for doc in results],
+                "next_cursor": next_page_cursor("timestamp", results, limit),
+            }, output_format)
 
         if not results:
             filters = []
@@ -296,7 +2569,10 @@ async def search_metar_data(
         applied_filters = [
             f"{k}: {v}"
             for k, v in locals().items()
-            if (v is not None) and (k not in ['db', 'cursor', 'results', 'limit', 'hours_back', 'query'])
+            if (v is not None) and (k not in [
+                'db', 'cursor', 'results', 'limit', 'hours_back', 'query', 'full_document', 'page_query', 'output_format',
+                'derived', 'raw', 'ranges',
+            ])
         ]
 
 
@@ -304,35 +2580,414 @@ async def search_metar_data(
             result += f"Filters: {', '.join(applied_filters)}\n"
         result += "=" * 80 + "\n\n"
 
+        render = format_full_document if full_document else render_cache.metar_data
+        parts = [result]
         for i, doc in enumerate(results, 1):
-            result += f"--- Result {i} ---\n"
-            result += format_metar_data(doc)
-            result += "\n"
-
-        return result
+            parts += (f"--- Result {i} ---\n", render(doc), "\n")
+        parts.append(next_page_line("timestamp", results, limit))
+        return "".join(parts)
 
     except Exception as e:
-        print(f"❌ Error in search_metar_data: {e}")
+        logger.exception("Error in search_metar_data")
+        mark_tool_error()
+        mark_uncacheable()
         return f"Error executing search: {str(e)}"
 
 
+def format_metar_line(metar_doc: dict[str, Any]) -> str:
+    """One station's observation on one line (plus its TAF, if any)."""
+    station = metar_doc.get("stationICAO", "Unknown")
+    iata = metar_doc.get("stationIATA")
+    metar = metar_doc.get("metar") or {}
+    raw = metar.get("rawData") if metar_doc.get("hasMetarData") else None
+    parts = [f"{station}/{iata}" if iata else station, f" @ {metar_doc.get('timestamp', 'Unknown')}: ", f"{raw or 'no METAR'}\n"]
+    if metar_doc.get("hasTaforData") and (metar_doc.get("tafor") or {}).get("rawData"):
+        parts.append(f"  TAF: {metar_doc['tafor']['rawData']}\n")
+    return "".join(parts)
+
+
+def latest_per_station_pipeline(icaos: list[str]) -> list[dict[str, Any]]:
+    """Newest document of each station: $match + $sort + $group/$first, projected last.
+
+    Nothing sits between the $sort and the $group, so mongod can answer it with
+    a DISTINCT_SCAN of the (stationICAO, timestamp) index: one index seek per
+    station instead of reading every report of every requested station.
+    """
+    return [
+        {"$match": {"stationICAO": {"$in": icaos}}},
+        {"$sort": {"stationICAO": 1, "timestamp": -1}},
+        {"$group": {"_id": "$stationICAO", "doc": {"$first": "$$ROOT"}}},
+        {"$replaceRoot": {"newRoot": "$doc"}},
+        {"$project": FORMATTER_PROJECTION},
+    ]
+
+
+async def latest_documents_for_stations(station_codes: list[str]) -> tuple[dict[str, dict[str, Any]], list[str]]:
+    """Latest document per requested ICAO/IATA code, and the codes not found.
+
+    IATA codes are resolved to ICAO up front, from the station directory and
+    then the station catalog; codes neither knows are reported as not found.
+    Cached stations come from latest_cache; the rest from one
+    latest_per_station_pipeline aggregation. When every code resolves, the
+    cached tool result is scoped to those stations.
+    """
+    codes = list(dict.fromkeys(c.strip().upper() for c in station_codes if c and c.strip()))
+    wanted: dict[str, str] = {}  # requested code -> ICAO (or IATA when unmapped)
+    for code in codes:
+        wanted[code] = station_directory.iata_to_icao.get(code, code) if len(code) == 3 else code
+    if any(len(icao) == 3 for icao in wanted.values()):
+        catalog = await station_catalog.get()
+        wanted = {code: catalog.iata_to_icao.get(icao, icao) if len(icao) == 3 else icao for code, icao in wanted.items()}
+
+    icaos = list(dict.fromkeys(icao for icao in wanted.values() if len(icao) != 3))
+    if all(len(icao) == 4 for icao in wanted.values()):
+        cache_scope(icaos)
+    found = latest_cache.get_many(icaos)
+    missing = [icao for icao in icaos if icao not in found]
+    if missing:
+        _, db = await get_mongodb_client()
+        async for doc in db[COLLECTION_METAR].aggregate(latest_per_station_pipeline(missing)):
+            found[doc["stationICAO"]] = doc
+
+    by_code = {code: found[icao] for code, icao in wanted.items() if icao in found}
+    return by_code, [code for code in wanted if code not in by_code]
+
+
 @mcp.tool()
-async def list_available_stations() -> str:
-    """List all available weather stations with their codes."""
+@metered_tool
+@cached_tool
+async def get_latest_metar_for_stations(station_codes: list[str]) -> str:
+    """Latest METAR/TAF for many stations in one call (e.g. every airport on a route).
+
+    Args:
+    station_codes: ICAO or IATA codes, e.g. ['VIDP', 'BOM', 'VOBL'] (max 100)
+    """
+    try:
+        if len(station_codes) > MAX_BULK_STATIONS:
+            return f"Too many stations: {len(station_codes)} (max {MAX_BULK_STATIONS})"
+
+        by_code, not_found = await latest_documents_for_stations(station_codes)
+        if not by_code:
+            return f"No METAR data found for stations: {', '.join(not_found)}"
+
+        parts = [f"📡 Latest METAR for {len(by_code)} stations:\n"]
+        parts += map(render_cache.metar_line, by_code.values())
+        if not_found:
+            parts.append(f"Not found: {', '.join(not_found)}\n")
+        return "".join(parts)
+
+    except Exception as e:
+        logger.exception("Error in get_latest_metar_for_stations")
+        mark_tool_error()
+        mark_uncacheable()
+        return f"Error retrieving latest METARs: {str(e)}"
+
+
+@mcp.tool()
+@metered_tool
+@cached_tool
+async def get_metar_near(
+    location: str | None = None,
+    latitude: float | None = None,
+    longitude: float | None = None,
+    k: int = 5,
+    max_distance_km: float | None = None,
+) -> str:
+    """Latest METAR/TAF for the k stations nearest a place (e.g. "weather near Nagpur").
+
+    Args:
+    location: Station ICAO/IATA code or part of an airport/city name (e.g., 'NAG', 'Nagpur')
+    latitude: Latitude in degrees, used with longitude instead of location
+    longitude: Longitude in degrees, used with latitude instead of location
+    k: Number of stations to return (default 5, max 100)
+    max_distance_km: Ignore stations further away than this
+    """
+    try:
+        if location:
+            center = station_directory.resolve(location)
+            if center is None:
+                return f"Unknown station or place: {location}"
+            latitude, longitude = _station_point(center)
+            label = f"{center['stationICAO']} ({center['name']})"
+        elif latitude is not None and longitude is not None:
+            label = f"{latitude:.4f}, {longitude:.4f}"
+        else:
+            return "Provide a location or both latitude and longitude"
+
+        nearby = station_directory.nearest(latitude, longitude, max(1, min(k, MAX_BULK_STATIONS)), max_distance_km)
+        if not nearby:
+            return f"No stations within {max_distance_km:g} km of {label}"
+
+        by_code, _ = await latest_documents_for_stations([s["stationICAO"] for _, s in nearby])
+        parts = [f"📍 Latest METAR for {len(nearby)} stations nearest {label}:\n"]
+        for distance, station in nearby:
+            doc = by_code.get(station["stationICAO"])
+            parts += (f"{distance:6.0f} km  ", render_cache.metar_line(doc) if doc else f"{station['stationICAO']}: no METAR data\n")
+        return "".join(parts)
+
+    except Exception as e:
+        logger.exception("Error in get_metar_near")
+        mark_tool_error()
+        mark_uncacheable()
+        return f"Error retrieving nearby METARs: {str(e)}"
+
+
+@mcp.tool()
+@metered_tool
+@cached_tool
+async def get_metar_along_route(origin: str, destination: str, corridor_km: float = 50) -> str:
+    """Latest METAR/TAF for every station along a great-circle route (e.g. DEL-BLR).
+
+    Args:
+    origin: Departure station ICAO/IATA code or name (e.g., 'DEL')
+    destination: Arrival station ICAO/IATA code or name (e.g., 'BLR')
+    corridor_km: Half-width of the corridor around the route, in km (default 50)
+    """
+    try:
+        start, end = station_directory.resolve(origin), station_directory.resolve(destination)
+        if start is None or end is None:
+            return f"Unknown station or place: {origin if start is None else destination}"
+
+        hits = station_directory.corridor(start, end, corridor_km)[:MAX_BULK_STATIONS]
+        by_code, _ = await latest_documents_for_stations([s["stationICAO"] for _, _, s in hits])
+        length = great_circle_km(*_station_point(start), *_station_point(end))
+        parts = [
+            f"🛫 Latest METAR along {start['stationICAO']}-{end['stationICAO']} "
+            f"({length:.0f} km, ±{corridor_km:g} km corridor), {len(hits)} stations:\n"
+        ]
+        for along, off, station in hits:
+            doc = by_code.get(station["stationICAO"])
+            parts += (f"{along:6.0f} km (±{off:.0f})  ", render_cache.metar_line(doc) if doc else f"{station['stationICAO']}: no METAR data\n")
+        return "".join(parts)
+
+    except Exception as e:
+        logger.exception("Error in get_metar_along_route")
+        mark_tool_error()
+        mark_uncacheable()
+        return f"Error retrieving route METARs: {str(e)}"
+
+
+# ------------------- Point-in-time lookup ---------------------------
+MAX_POINT_IN_TIME_NEIGHBOURS = 10
+POINT_IN_TIME_AFTER_SORT = [("timestamp", 1), ("_id", 1)]
+_METAR_TIME_GROUP_RE = re.compile(r"^(\d{2})(\d{2})(\d{2})Z$")
+
+
+def parse_instant(text: str, now: datetime | None = None) -> datetime:
+    """A UTC instant as a naive datetime, like the stored timestamps.
+
+    Accepts ISO 8601 ('2026-10-03T02:40Z', '2026-10-03 02:40') or a METAR
+    day-time group ('030240Z': the latest such instant that is not in the future).
+    """
+    text = text.strip().upper()
+    now = now or datetime.now()
+    match = _METAR_TIME_GROUP_RE.match(text)
+    if match:
+        day, hour, minute = map(int, match.groups())
+        year, month = now.year, now.month
+        for _ in range(3):  # this month, else an earlier one (day 31 skips short months)
+            try:
+                candidate = datetime(year, month, day, hour, minute)
+            except ValueError:
+                candidate = None
+            if candidate is not None and candidate <= now:
+                return candidate
+            year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+        raise ValueError(f"Invalid METAR time group: {text}")
+    value = datetime.fromisoformat(text)
+    if value.tzinfo is not None:
+        value = value.astimezone(UTC).replace(tzinfo=None)
+    return value
+
+
+@mcp.tool()
+@metered_tool
+@cached_tool
+async def get_metar_at(station: str, at: str, neighbours: int = 0) -> str:
+    """The METAR in effect at a station at a given instant (its latest report at or before it).
+
+    Args:
+    station: ICAO or IATA code (e.g., 'VOBL', 'BLR')
+    at: UTC instant, ISO 8601 ('2026-10-03T02:40Z') or a METAR day-time group ('030240Z')
+    neighbours: Also list this many reports before and after it (default 0, max 10)
+    """
+    try:
+        try:
+            instant = parse_instant(at)
+        except ValueError:
+            return f"Invalid time: {at} (use ISO 8601 like '2026-10-03T02:40Z' or a METAR group like '030240Z')"
+        code = station.strip().upper()
+        if len(code) == 3:
+            code = (await station_catalog.get()).iata_to_icao.get(code, code)
+        neighbours = max(0, min(neighbours, MAX_POINT_IN_TIME_NEIGHBOURS))
+        cache_scope([code], None if neighbours else instant)
+
+        # Two bounded walks of the (stationICAO, timestamp, _id) index, one each way from the instant
+        before = await fetch_metar_documents(
+            "get_metar_at", {"stationICAO": code, "timestamp": {"$lte": instant}}, SEARCH_SORT, 1 + neighbours
+        )
+        after = await fetch_metar_documents(
+            "get_metar_at", {"stationICAO": code, "timestamp": {"$gt": instant}}, POINT_IN_TIME_AFTER_SORT, neighbours
+        ) if neighbours else []
+
+        if not before:
+            return f"No METAR for {code} at or before {instant:%Y-%m-%d %H:%M}Z"
+        in_effect = before[0]
+        age = int((instant - in_effect["timestamp"]).total_seconds() // 60)
+        parts = [f"🕒 {code} METAR in effect at {instant:%Y-%m-%d %H:%M}Z (reported {age} min earlier):\n"]
+        for doc in reversed(before[1:]):
+            parts += ("   ", render_cache.metar_line(doc))
+        parts += ("→  ", render_cache.metar_line(in_effect))
+        for doc in after:
+            parts += ("   ", render_cache.metar_line(doc))
+        return "".join(parts)
+
+    except Exception as e:
+        logger.exception("Error in get_metar_at")
+        mark_tool_error()
+        mark_uncacheable()
+        return f"Error retrieving METAR: {str(e)}"
+
+
+@mcp.tool()
+@metered_tool
+async def get_metar_changes(mark: str | None = None, batch_size: int = 50, output_format: str = "text") -> str:
+    """Documents inserted or updated since a mark, oldest change first, and the next mark.
+
+    Call without a mark to start from the beginning, then pass the returned mark
+    on the next call to receive only what changed in between.
+
+    Args:
+    mark: "Next mark" from the previous call
+    batch_size: Maximum documents to return (default 50, max 50)
+    output_format: 'text' (default), or 'toon' / 'columns' for compact rows
+    """
+    if error := unknown_output_format(output_format):
+        return error
+    try:
+        try:
+            docs, next_mark, has_more = await fetch_changes("get_metar_changes", mark, max(1, min(batch_size, 50)))
+        except ValueError as e:
+            return f"{e}: pass the mark of a previous get_metar_changes call, or none to start over"
+
+        if output_format != "text":
+            return render_compact({
+                "count": len(docs),
+                "rows": [{**metar_row(doc), "updated": compact_value(_dotted_get(doc, SYNC_FIELD))} for doc in docs],
+                "mark": next_mark,
+                "has_more": has_more,
+            }, output_format)
+
+        parts = [f"🔄 {len(docs)} changed METAR documents" + (" (more waiting)" if has_more else "") + ":\n"]
+        for doc in docs:
+            parts += (f"{_dotted_get(doc, SYNC_FIELD)}  ", render_cache.metar_line(doc))
+        if next_mark:
+            parts.append(f"Next mark: {next_mark}\n")
+        return "".join(parts)
+
+    except Exception as e:
+        logger.exception("Error in get_metar_changes")
+        mark_tool_error()
+        return f"Error retrieving changes: {str(e)}"
+
+
+@mcp.tool()
+@metered_tool
+@cached_tool
+async def get_station_trends(
+    station: str, hours_back: int = 72, granularity: str = "auto", output_format: str = "text"
+) -> str:
+    """Min/max/mean temperature, wind, visibility and QNH for a station over time.
+
+    Answers trend and aggregate questions (e.g. "max wind at VABB over the last
+    3 days") from hourly/daily rollups instead of raw METARs.
+
+    Args:
+    station: ICAO or IATA code (e.g., 'VABB', 'BOM')
+    hours_back: Period to cover, in hours from now (default 72)
+    granularity: 'hour', 'day' or 'auto' (hourly up to 72 hours, else daily)
+    output_format: 'text' (default), or 'toon' / 'columns' for compact tables
+    """
+    if error := unknown_output_format(output_format):
+        return error
     try:
+        code = station.strip().upper()
+        if len(code) == 3:
+            code = (await station_catalog.get()).iata_to_icao.get(code, code)
+        if granularity == "auto":
+            granularity = "hour" if hours_back <= 72 else "day"
+        if granularity not in ROLLUP_GRANULARITIES:
+            return f"Unknown granularity: {granularity} (use 'hour', 'day' or 'auto')"
+
+        since = rollup_bucket_start(datetime.now() - timedelta(hours=hours_back), granularity)
+        cache_scope([ROLLUP_SCOPE_PREFIX + code])
         _, db = await get_mongodb_client()
+        buckets = await (
+            db[COLLECTION_ROLLUPS]
+            .find({"stationICAO": code, "granularity": granularity, "bucketStart": {"$gte": since}})
+            .sort("bucketStart", 1)
+            .to_list(None)
+        )
+        if not buckets:
+            return f"No rollup data for {code} in the last {hours_back}h"
+
+        def fmt(value: float | None) -> str:
+            return "N/A" if value is None else f"{value:g}" if value == int(value) else f"{value:.1f}"
+
+        summary = summarize_rollups(buckets)
+        if output_format != "text":
+            return render_compact({
+                "station": code,
+                "granularity": granularity,
+                "hours_back": hours_back,
+                "reports": sum(b["count"] for b in buckets),
+                "summary": [
+                    {"metric": metric, **{k: compact_number(values[k]) for k in ("min", "max", "mean")}}
+                    for metric, values in summary.items()
+                ],
+                "buckets": [
+                    {
+                        "start": bucket["bucketStart"],
+                        "n": bucket["count"],
+                        **{
+                            f"{metric}_{k}": compact_number(bucket[metric][k]) if (bucket.get(metric) or {}).get("n") else None
+                            for metric in ROLLUP_METRICS
+                            for k in ("min", "max")
+                        },
+                    }
+                    for bucket in buckets[-MAX_TREND_BUCKETS:]
+                ],
+            }, output_format)
+        label = "hourly" if granularity == "hour" else "daily"
+        result = f"📈 {code} {label} trends, last {hours_back}h ({sum(b['count'] for b in buckets)} reports)\n"
+        for metric, values in summary.items():
+            result += f" {metric}: min {fmt(values['min'])}, max {fmt(values['max'])}, mean {fmt(values['mean'])}\n"
+        result += "\n"
+        for bucket in buckets[-MAX_TREND_BUCKETS:]:
+            parts = []
+            for metric in ROLLUP_METRICS:
+                values = bucket.get(metric) or {}
+                if values.get("n"):
+                    parts.append(f"{metric} {fmt(values['min'])}..{fmt(values['max'])}")
+            result += f" {bucket['bucketStart']} n={bucket['count']} {' '.join(parts)}\n"
+        return result
 
-        # Get unique ICAO codes
-        icao_codes = await db[COLLECTION_METAR].distinct("stationICAO")
-        icao_codes.sort()
+    except Exception as e:
+        logger.exception("Error in get_station_trends")
+        mark_tool_error()
+        mark_uncacheable()
+        return f"Error retrieving trends: {str(e)}"
 
-        # Get unique IATA codes (non-null)
-        iata_codes = await db[COLLECTION_METAR].distinct("stationIATA")
-        iata_codes = [code for code in iata_codes if code is not None]
-        iata_codes.sort()
 
-        # Get station count
-        total_stations = await db[COLLECTION_METAR].count_documents({})
+@mcp.tool()
+@metered_tool
+async def list_available_stations() -> str:
+    """List all available weather stations with their codes."""
+    try:
+        catalog = await station_catalog.get()
+        icao_codes = catalog.icao_codes
+        iata_codes = catalog.iata_codes
+        total_stations = catalog.total_reports
 
         result = f"📡 Available Weather Stations ({total_stations} total reports)\n"
         result += "=" * 50 + "\n\n"
@@ -360,43 +3015,29 @@ async def list_available_stations() -> str:
         return result
 
     except Exception as e:
-        print(f"❌ Error in list_available_stations: {e}")
+        logger.exception("Error in list_available_stations")
+        mark_tool_error()
         return f"Error retrieving station list: {str(e)}"
 
 
 @mcp.tool()
-async def get_metar_statistics() -> str:
-    """Get statistics about the METAR database."""
-    try:
-        _, db = await get_mongodb_client()
+@metered_tool
+async def get_metar_statistics(output_format: str = "text") -> str:
+    """Get statistics about the METAR database.
 
-        # Get basic counts
-        total_metar = await db[COLLECTION_METAR].count_documents({})
-
-        # Get unique station counts
-        unique_icao = len(await db[COLLECTION_METAR].distinct("stationICAO"))
-        iata_list = await db[COLLECTION_METAR].distinct("stationIATA")
-        unique_iata = len([code for code in iata_list if code is not None])
-
-        # Get date range
-        earliest = (
-            await db[COLLECTION_METAR]
-            .find({}, {"metar.updatedTime": 1})
-            .sort("metar.updatedTime", 1)
-            .limit(1)
-            .to_list(1)
-        )
-        latest = (
-            await db[COLLECTION_METAR]
-            .find({}, {"metar.updatedTime": 1})
-            .sort("metar.updatedTime", -1)
-            .limit(1)
-            .to_list(1)
-        )
-
-        # Get data availability
-        with_metar = await db[COLLECTION_METAR].count_documents({"hasMetarData": True})
-        with_taf = await db[COLLECTION_METAR].count_documents({"hasTaforData": True})
+    Set output_format to 'toon' or 'columns' for the bare figures instead of text.
+    """
+    if error := unknown_output_format(output_format):
+        return error
+    try:
+        stats = await load_metar_statistics()
+        if output_format != "text":
+            return render_compact(stats, output_format)
+        total_metar = stats["total"]
+        unique_icao = stats["unique_icao"]
+        unique_iata = stats["unique_iata"]
+        with_metar = stats["with_metar"]
+        with_taf = stats["with_taf"]
 
         # ✅ Guard: avoid ZeroDivisionError
         def pct(n: int) -> float:
@@ -413,28 +3054,40 @@ async def get_metar_statistics() -> str:
         result += f" Unique IATA Codes: {unique_iata}\n\n"
 
         result += "📅 Data Range:\n"
-        if earliest:
-            result += f" Earliest: {earliest[0]['metar']['updatedTime']}\n"
-        if latest:
-            result += f" Latest: {latest[0]['metar']['updatedTime']}\n\n"
+        if stats["earliest"] is not None:
+            result += f" Earliest: {stats['earliest']}\n"
+        if stats["latest"] is not None:
+            result += f" Latest: {stats['latest']}\n\n"
 
         result += "✅ Availability:\n"
         result += f" Reports with METAR: {with_metar:,} ({pct(with_metar):.1f}%)\n"
         result += f" Reports with TAF: {with_taf:,} ({pct(with_taf):.1f}%)\n"
+        if stats.get("refreshed_at"):
+            result += f"\n As of: {stats['refreshed_at']}\n"
 
         return result
 
     except Exception as e:
-        print(f"❌ Error in get_metar_statistics: {e}")
+        logger.exception("Error in get_metar_statistics")
+        mark_tool_error()
         return f"Error retrieving statistics: {str(e)}"
 
 
 @mcp.tool()
-async def raw_mongodb_query(query_json: str, limit: int = 10) -> str:
-    """Execute a raw MongoDB query against the METAR database."""
-    try:
-        _, db = await get_mongodb_client()
+@metered_tool
+@cached_tool
+async def raw_mongodb_query(
+    query_json: str, limit: int = 10, full_document: bool = False, cursor: str | None = None, output_format: str = "text"
+) -> str:
+    """Execute a raw MongoDB query against the METAR database.
 
+    Set full_document to also return every stored field of each document as JSON.
+    Pass the "Next page" cursor of a previous result to continue the same query.
+    Set output_format to 'toon' or 'columns' for compact rows instead of text.
+    """
+    if error := unknown_output_format(output_format):
+        return error
+    try:
         # Parse the query JSON
         try:
             query = json.loads(query_json)
@@ -443,10 +3096,30 @@ async def raw_mongodb_query(query_json: str, limit: int = 10) -> str:
 
         # Limit the number of results
         limit = min(limit, 50)
+        if isinstance(query, dict):
+            cache_scope(query_stations(query))
 
-        print(f"🔍 Executing raw MongoDB query: {query}")
-        cursor = db[COLLECTION_METAR].find(query).sort("metar.updatedTime", -1).limit(limit)
-        results = await cursor.to_list(length=limit)
+        page_query = apply_page_cursor(query, "metar.updatedTime", cursor) if cursor else query
+        logger.debug("Executing MongoDB query", extra={"tool": "raw_mongodb_query", "query": page_query, "sampled": True})
+        try:
+            await guard_raw_query(page_query, RAW_QUERY_SORT, limit)
+            results = await fetch_metar_documents(
+                "raw_mongodb_query", page_query, RAW_QUERY_SORT, limit, full_document, RAW_QUERY_MAX_TIME_MS
+            )
+        except QueryTooExpensive as e:
+            return f"Query too expensive: {e}"
+        except ExecutionTimeout:
+            query_guard_stats.timeouts += 1
+            mark_uncacheable()
+            return f"Query too expensive: exceeded the {RAW_QUERY_MAX_TIME_MS} ms time limit"
+
+        if output_format != "text":
+            return render_compact({
+                "query": query,
+                "count": len(results),
+                "rows": [metar_row(doc, full_document) for doc in results],
+                "next_cursor": next_page_cursor("metar.updatedTime", results, limit),
+            }, output_format)
 
         if not results:
             return f"No documents found matching query: {query_json}"
@@ -456,101 +3129,413 @@ async def raw_mongodb_query(query_json: str, limit: int = 10) -> str:
         result += f"Query: {query_json}\n"
         result += "=" * 60 + "\n\n"
 
+        render = format_full_document if full_document else render_cache.metar_data
+        parts = [result]
         for i, doc in enumerate(results, 1):
-            result += f"--- Result {i} ---\n"
-            result += format_metar_data(doc)
-            result += "\n"
-
-        return result
+            parts += (f"--- Result {i} ---\n", render(doc), "\n")
+        parts.append(next_page_line("metar.updatedTime", results, limit))
+        return "".join(parts)
 
     except Exception as e:
-        print(f"❌ Error in raw_mongodb_query: {e}")
+        logger.exception("Error in raw_mongodb_query")
+        mark_tool_error()
+        mark_uncacheable()
         return f"Error executing query: {str(e)}"
 
 
 @mcp.tool()
+@metered_tool
 async def ping() -> str:
     """Simple ping tool for testing authentication."""
     return "🏓 Pong! Authentication working correctly."
 
 
+# ------------------- Azure AD token cache ---------------------------
+class AzureTokenError(Exception):
+    """Azure AD answered the client-credentials request with a non-200 status."""
+
+    def __init__(self, status_code: int, body: str):
+        super().__init__(f"Azure AD returned {status_code}")
+        self.status_code = status_code
+        self.body = body
+
+
+class AzureTokenCache:
+    """App-only Azure AD token, reused until shortly before it expires.
+
+    One pooled httpx client for the process lifetime; callers arriving while
+    a token is being fetched wait for that fetch instead of starting another.
+    """
+
+    def __init__(self, refresh_margin_seconds: float):
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self.hits = 0
+        self.fetches = 0
+        self.coalesced = 0
+        self._token: dict[str, Any] | None = None
+        self._fetched_at = 0.0
+        self._inflight: asyncio.Future | None = None
+        self._http: httpx.AsyncClient | None = None
+
+    def _valid(self) -> bool:
+        if self._token is None:
+            return False
+        lifetime = float(self._token.get("expires_in") or 0)
+        margin = min(self.refresh_margin_seconds, lifetime / 2)
+        return time.time() < self._fetched_at + lifetime - margin
+
+    async def _fetch(self) -> dict[str, Any]:
+        token_url = f"https://login.microsoftonline.com/{TENANT_ID}/oauth2/v2.0/token"
+        form = {
+            "client_id": APP_ID,
+            "client_secret": CLIENT_SECRET,
+            "grant_type": "client_credentials",
+            "scope": f"api://{APP_ID}/.default",
+        }
+        logger.info("Requesting token from Azure AD", extra={"url": token_url})
+        if self._http is None:
+            self._http = httpx.AsyncClient(timeout=20.0)
+        resp = await self._http.post(token_url, data=form)
+        if resp.status_code != 200:
+            raise AzureTokenError(resp.status_code, resp.text)
+        body = resp.json()
+        logger.info("Obtained token from Azure AD", extra={"expires_in": body.get("expires_in")})
+        self._token, self._fetched_at = body, time.time()
+        return body
+
+    async def get(self) -> tuple[dict[str, Any], float]:
+        """The cached token body (fetched if needed) and the time it was issued."""
+        if self._valid():
+            self.hits += 1
+            return self._token, self._fetched_at  # type: ignore[return-value]
+        if self._inflight is not None:
+            self.coalesced += 1
+            await asyncio.shield(self._inflight)
+            return self._token, self._fetched_at  # type: ignore[return-value]
+
+        self.fetches += 1
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._inflight = future
+        try:
+            body = await self._fetch()
+            future.set_result(body)
+            return body, self._fetched_at
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # retrieved here when nobody else was waiting
+            raise
+        finally:
+            self._inflight = None
+
+    async def close(self) -> None:
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    def stats(self) -> dict[str, Any]:
+        return {"hits": self.hits, "fetches": self.fetches, "coalesced": self.coalesced, "cached": self._valid()}
+
+
+token_cache = AzureTokenCache(TOKEN_REFRESH_MARGIN_SECONDS)
+
+
 # ------------------- Custom routes (public) -------------------------
 @mcp.custom_route("/health", methods=["GET"])  # type: ignore[attr-defined]
 async def health_check_route(request: Request):
-    """Health check endpoint - no authentication required."""
-    return JSONResponse({
-        "status": "healthy",
-        "timestamp": datetime.now().isoformat(),
-        "server": "metar-weather-mcp",
-        "azure_config": {
-            "tenant_id": TENANT_ID,
-            "app_id": APP_ID,
-            "auth_enabled": True
-        }
-    })
+    """Health check endpoint - status and version without authentication.
+
+    Pings Mongo on every call; 503 when it cannot be reached. A valid bearer
+    token also gets the configuration, the Mongo error and pool stats, and the
+    cache counters.
+    """
+    mongo_error = None
+    try:
+        await ping_mongodb()
+    except Exception as e:
+        mongo_error = str(e)
+    body: dict[str, Any] = {"status": "unhealthy" if mongo_error else "healthy", "version": SERVER_VERSION}
+    if await request_access_token(request) is not None:
+        body.update({
+            "timestamp": datetime.now().isoformat(),
+            "server": "metar-weather-mcp",
+            "azure_config": {
+                "tenant_id": TENANT_ID,
+                "app_id": APP_ID,
+                "auth_enabled": True
+            },
+            "latest_cache": latest_cache.stats(),
+            "transfer": transfer_stats.stats(),
+            "raw_query_guard": query_guard_stats.stats(),
+            "result_cache": result_cache.stats(),
+            "token_cache": token_cache.stats(),
+            "auth": auth.stats(),
+            "mongodb": {"error": mongo_error, **pool_stats.stats()},
+        })
+    return JSONResponse(body, status_code=503 if mongo_error else 200)
+
+
+@mcp.custom_route("/metrics", methods=["GET"])  # type: ignore[attr-defined]
+async def metrics_route(request: Request):
+    """Prometheus scrape endpoint - no authentication required."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 
 @mcp.custom_route("/auth/token", methods=["POST"])  # type: ignore[attr-defined]
 async def issue_token(request: Request):
     """
     Client yahan POST karega (no body needed).
-    Server Azure se app-only token nikaal ke return karega.
+    Server Azure se app-only token nikaal ke return karega (cached till expiry).
     """
-    print("🔐 Token request received from client")
-
-    token_url = f"https://login.microsoftonline.com/{TENANT_ID}/oauth2/v2.0/token"
-    form = {
-        "client_id": APP_ID,
-        "client_secret": CLIENT_SECRET,
-        "grant_type": "client_credentials",
-        "scope": f"api://{APP_ID}/.default",
-    }
-
-    print(f"🔄 Requesting token from Azure AD: {token_url}")
-    print(f"📋 Form data: client_id={APP_ID}, scope=api://{APP_ID}/.default")
-
     try:
-        async with httpx.AsyncClient(timeout=20.0) as http:
-            resp = await http.post(token_url, data=form)
-            print(f"🌐 Azure AD response status: {resp.status_code}")
+        body, issued_at = await token_cache.get()
 
-    except Exception as e:
-        print(f"❌ Azure token request failed: {e}")
+    except AzureTokenError as e:
+        logger.error("Azure AD error", extra={"status": e.status_code, "azure_body": e.body})
+        # Azure ka raw error dikha do (AADSTS codes) for debugging
         return JSONResponse(
-            {"error": "azure_token_request_failed", "detail": str(e)},
-            status_code=502
+            {"error": "azure_token_error", "azure_body": e.body},
+            status_code=e.status_code
         )
 
-    if resp.status_code != 200:
-        print(f"❌ Azure AD error: {resp.text}")
-        # Azure ka raw error dikha do (AADSTS codes) for debugging
+    except Exception as e:
+        logger.error("Azure token request failed: %s", e)
         return JSONResponse(
-            {"error": "azure_token_error", "azure_body": resp.text},
-            status_code=resp.status_code
+            {"error": "azure_token_request_failed", "detail": str(e)},
+            status_code=502
         )
 
-    body = resp.json()
-    print("✅ Successfully obtained token from Azure AD")
-    print(f"📊 Token expires in: {body.get('expires_in')} seconds")
-
+    expires_in = body.get("expires_in")
     return JSONResponse({
         "access_token": body.get("access_token"),
-        "expires_in": body.get("expires_in"),
+        "expires_in": None if expires_in is None else round(float(expires_in) - (time.time() - issued_at)),
         "token_type": body.get("token_type", "Bearer"),
-        "issued_at": int(time.time()),
+        "issued_at": int(issued_at),
     })
 
 
+# ------------------- Bulk export ------------------------------------
+# /export/metar streams a time range straight from one cursor: each server
+# batch is decoded, encoded and sent before the next is read, so memory stays
+# at one batch whatever the range. Parquet needs the optional pyarrow package.
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "parquet": "application/vnd.apache.parquet"}
+EXPORT_SORT = [("timestamp", 1), ("_id", 1)]
+EXPORT_PROJECTION = {**FORMATTER_PROJECTION, "metar.firRegion": 1, NUMERIC_OBS_PREFIX: 1}
+
+
+def extended_json_default(value: Any) -> Any:
+    """json.dumps default= giving json_util's relaxed Extended JSON.
+
+    The C encoder handles the plain values and calls back only for BSON
+    types, and the two common ones skip json_util: together ~2.5x faster
+    than json_util.dumps with identical output.
+    """
+    if type(value) is datetime and value.tzinfo is None and value.year >= 1970:
+        return {"$date": value.isoformat(timespec="milliseconds" if value.microsecond >= 1000 else "seconds") + "Z"}
+    if type(value) is ObjectId:
+        return {"$oid": str(value)}
+    return json_util.default(value, json_options=json_util.RELAXED_JSON_OPTIONS)
+
+
+def export_query(start: datetime, end: datetime, stations: list[str]) -> dict[str, Any]:
+    query: dict[str, Any] = {"timestamp": {"$gte": start, "$lt": end}}
+    if stations:
+        query["stationICAO"] = stations[0] if len(stations) == 1 else {"$in": stations}
+    return query
+
+
+async def export_batches(
+    query: dict[str, Any], projection: dict[str, Any] | None, batch_size: int
+) -> AsyncIterator[list[dict[str, Any]]]:
+    """The matching documents in timestamp order, one decoded server batch at a time."""
+    _, db = await get_mongodb_client()
+    cursor = db[COLLECTION_METAR].find_raw_batches(query, projection).sort(EXPORT_SORT).batch_size(batch_size)
+    documents = size = 0
+    try:
+        async for batch in cursor:
+            docs = bson.decode_all(batch)
+            documents += len(docs)
+            size += len(batch)
+            yield docs
+    finally:
+        transfer_stats.record("export_metar_route", documents, size)
+        logger.info("Export finished", extra={"documents": documents, "bytes": size})
+
+
+async def ndjson_chunks(batches: AsyncIterator[list[dict[str, Any]]]) -> AsyncIterator[bytes]:
+    """One relaxed Extended JSON document per line, one chunk per batch."""
+    async for docs in batches:
+        yield "".join(json.dumps(doc, default=extended_json_default) + "\n" for doc in docs).encode()
+
+
+def export_columns(docs: list[dict[str, Any]]) -> dict[str, list[Any]]:
+    """Flat Parquet columns of a batch: identity, raw reports and typed observation values."""
+    columns: dict[str, list[Any]] = {
+        name: [] for name in ("stationICAO", "stationIATA", "timestamp", "updatedTime", "firRegion", "metar", "taf",
+                              "weatherConditions", "cloudLayers", *NUMERIC_OBS_FIELDS)
+    }
+    for doc in docs:
+        metar = doc.get("metar") or {}
+        obs = (metar.get("decodedData") or {}).get("observation") or {}
+        numeric = doc.get(NUMERIC_OBS_PREFIX) or build_numeric_observation(doc)
+        columns["stationICAO"].append(doc.get("stationICAO"))
+        columns["stationIATA"].append(doc.get("stationIATA"))
+        columns["timestamp"].append(doc.get("timestamp"))
+        columns["updatedTime"].append(metar.get("updatedTime"))
+        columns["firRegion"].append(metar.get("firRegion"))
+        columns["metar"].append(metar.get("rawData"))
+        columns["taf"].append((doc.get("tafor") or {}).get("rawData") or None)
+        columns["weatherConditions"].append(obs.get("weatherConditions"))
+        columns["cloudLayers"].append(obs.get("cloudLayers") or [])
+        for field in NUMERIC_OBS_FIELDS:
+            columns[field].append(numeric.get(field))
+    return columns
+
+
+def export_arrow_schema(pa: Any) -> Any:
+    string, when = pa.string(), pa.timestamp("ms")
+    return pa.schema([
+        ("stationICAO", string), ("stationIATA", string), ("timestamp", when), ("updatedTime", when),
+        ("firRegion", string), ("metar", string), ("taf", string), ("weatherConditions", string),
+        ("cloudLayers", pa.list_(string)), *((field, pa.float64()) for field in NUMERIC_OBS_FIELDS),
+    ])
+
+
+class StreamSink(io.RawIOBase):
+    """Write-only file whose contents are taken out as they are produced.
+
+    tell() keeps counting across drains, as the Parquet writer records
+    column chunk offsets from it.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.chunks: list[bytes] = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: Any) -> int:
+        chunk = bytes(data)
+        self.chunks.append(chunk)
+        self.position += len(chunk)
+        return len(chunk)
+
+    def tell(self) -> int:
+        return self.position
+
+    def drain(self) -> bytes:
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+async def parquet_chunks(batches: AsyncIterator[list[dict[str, Any]]]) -> AsyncIterator[bytes]:
+    """A Parquet file with one row group per batch, sent as each row group is written."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = export_arrow_schema(pa)
+    sink = StreamSink()
+    with pq.ParquetWriter(sink, schema, compression="zstd") as writer:
+        async for docs in batches:
+            writer.write_table(pa.Table.from_pydict(export_columns(docs), schema=schema))
+            yield sink.drain()
+    yield sink.drain()
+
+
+# ------------------- Custom routes (bearer token) -------------------
+async def request_access_token(request: Request) -> Any:
+    """The verified access token of an "Authorization: Bearer" header, else None."""
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token.strip():
+        return None
+    return await auth.load_access_token(token.strip())
+
+
+@mcp.custom_route("/sync/metar", methods=["GET"])  # type: ignore[attr-defined]
+async def sync_metar_route(request: Request):
+    """Documents changed since ?mark= (all when absent), in batches of ?batch_size=.
+
+    Returns {"documents", "count", "mark", "has_more"} as relaxed Extended JSON;
+    ?full=true returns whole documents instead of the formatter fields.
+    Poll again with the returned mark; while has_more is true, call again at once.
+    """
+    if await request_access_token(request) is None:
+        return JSONResponse({"error": "unauthorized"}, status_code=401, headers={"WWW-Authenticate": "Bearer"})
+    params = request.query_params
+    try:
+        batch_size = min(max(int(params.get("batch_size", "500")), 1), SYNC_MAX_BATCH)
+        full_document = params.get("full", "false").lower() in ("1", "true", "yes")
+        docs, mark, has_more = await fetch_changes("sync_metar_route", params.get("mark"), batch_size, full_document)
+    except ValueError as e:
+        return JSONResponse({"error": "bad_request", "detail": str(e)}, status_code=400)
+    except Exception as e:
+        logger.exception("Error in sync_metar_route")
+        return JSONResponse({"error": "sync_failed", "detail": str(e)}, status_code=503)
+    body = json_util.dumps(
+        {"documents": docs, "count": len(docs), "mark": mark, "has_more": has_more},
+        json_options=json_util.RELAXED_JSON_OPTIONS,
+    )
+    return Response(body, media_type="application/json")
+
+
+@mcp.custom_route("/export/metar", methods=["GET"])  # type: ignore[attr-defined]
+async def export_metar_route(request: Request):
+    """Stream every METAR with ?start= <= timestamp < ?end= (default now), oldest first.
+
+    ?format=ndjson (default) sends one Extended JSON document per line, with
+    ?full=true for whole documents. ?format=parquet sends flat columns with
+    typed observation values. ?stations=VIDP,VABB narrows the export, and
+    ?batch_size= sets documents per cursor batch. A failure mid-stream aborts
+    the response, so a truncated body is never a complete-looking file.
+    """
+    if await request_access_token(request) is None:
+        return JSONResponse({"error": "unauthorized"}, status_code=401, headers={"WWW-Authenticate": "Bearer"})
+    params = request.query_params
+    export_format = params.get("format", "ndjson").lower()
+    if export_format not in EXPORT_FORMATS:
+        return JSONResponse({"error": "bad_request", "detail": f"format must be one of {', '.join(EXPORT_FORMATS)}"}, status_code=400)
+    if export_format == "parquet" and importlib.util.find_spec("pyarrow") is None:
+        return JSONResponse({"error": "parquet_unavailable", "detail": "install pyarrow to export Parquet"}, status_code=501)
+    try:
+        start = parse_instant(params["start"])
+        end = parse_instant(params["end"]) if params.get("end") else datetime.now()
+        batch_size = min(max(int(params.get("batch_size", EXPORT_BATCH_SIZE)), 1), EXPORT_MAX_BATCH_SIZE)
+    except KeyError:
+        return JSONResponse({"error": "bad_request", "detail": "start is required"}, status_code=400)
+    except ValueError as e:
+        return JSONResponse({"error": "bad_request", "detail": str(e)}, status_code=400)
+    stations = [code.strip().upper() for code in params.get("stations", "").split(",") if code.strip()]
+
+    query = export_query(start, end, stations)
+    if export_format == "parquet":
+        chunks = parquet_chunks(export_batches(query, EXPORT_PROJECTION, batch_size))
+    else:
+        full_document = params.get("full", "false").lower() in ("1", "true", "yes")
+        chunks = ndjson_chunks(export_batches(query, None if full_document else EXPORT_PROJECTION, batch_size))
+    filename = f"metar_{start:%Y%m%dT%H%M}_{end:%Y%m%dT%H%M}.{export_format}"
+    return StreamingResponse(
+        chunks, media_type=EXPORT_FORMATS[export_format], headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
 if __name__ == "__main__":
     # Initialize and run the server
-    print("🚀 METAR MCP Server with Azure Authentication starting...")
-    print(f"🗄️ MongoDB URL: {MONGODB_URL}")
-    print(f"📊 Database: {DATABASE_NAME}")
-    print(f"🏷️ Collection: {COLLECTION_METAR}")
-    print(f"🔐 Azure Tenant ID: {TENANT_ID}")
-    print(f"🏢 Azure App ID: {APP_ID}")
-    print(f"🌐 Port: {PORT}")
-    print("✅ Server ready! Waiting for HTTP requests...")
+    configure_logging()
+    logger.info(
+        "METAR MCP Server with Azure Authentication starting",
+        extra={
+            "mongodb_url": MONGODB_URL,
+            "database": DATABASE_NAME,
+            "collection": COLLECTION_METAR,
+            "tenant_id": TENANT_ID,
+            "app_id": APP_ID,
+            "port": PORT,
+        },
+    )
 
     # same port par custom routes + MCP endpoint serve honge
     mcp.run(transport="streamable-http", host="127.0.0.1", port=PORT)  # type: ignore[call-arg,arg-type]
@@ -0,0 +1,54 @@
+# benchmarks/bench_auth.py
+"""
+Per-request bearer token verification cost: full RSA check vs verified-token cache.
+
+The verifier is given the public key directly, so no JWKS fetch is involved.
+
+    python -m benchmarks.bench_auth --requests 20000
+"""
+import argparse
+import asyncio
+import time
+
+import jwt
+from app.metar_mcp_server import AUDIENCE, ISSUER, CachingJWTVerifier
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+
+def signed_token_and_public_key() -> tuple[str, str]:
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.public_key().public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
+    claims = {"sub": "bench", "iss": ISSUER, "aud": AUDIENCE, "exp": int(time.time()) + 3600}
+    return jwt.encode(claims, key, algorithm="RS256"), pem.decode()
+
+
+async def per_request_us(verifier: CachingJWTVerifier, token: str, requests: int) -> float:
+    assert await verifier.verify_token(token) is not None
+    t0 = time.perf_counter()
+    for _ in range(requests):
+        await verifier.verify_token(token)
+    return (time.perf_counter() - t0) / requests * 1e6
+
+
+async def run(requests: int) -> None:
+    token, public_key = signed_token_and_public_key()
+    uncached = CachingJWTVerifier(public_key=public_key, issuer=ISSUER, audience=AUDIENCE, max_entries=0)
+    cached = CachingJWTVerifier(public_key=public_key, issuer=ISSUER, audience=AUDIENCE)
+
+    before = await per_request_us(uncached, token, requests)
+    after = await per_request_us(cached, token, requests)
+    print(f"{requests:,} requests with one bearer token")
+    print(f"RSA verification every request: {before:8.1f} us/request")
+    print(f"verified-token cache:           {after:8.1f} us/request ({before / after:.0f}x)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20_000)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests))
+
+
+if __name__ == "__main__":
+    main()
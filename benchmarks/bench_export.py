@@ -0,0 +1,97 @@
+# benchmarks/bench_export.py
+"""
+/export/metar throughput and memory: NDJSON and Parquet over a day, a month
+and a year of every station's reports.
+
+The route handler is driven in-process (no HTTP, no auth) and its body is
+drained as a client would read it. Each export runs twice: once timed, and
+once under tracemalloc for the peak Python memory allocated from the first
+chunk on (steady state). That leaves out the in-memory fake's one-off sort of
+the whole range before its first batch, which a real mongod does not make.
+
+    python -m benchmarks.bench_export --days 365
+    MONGODB_URL=mongodb://localhost:27017 python -m benchmarks.bench_export --target mongo
+"""
+import argparse
+import asyncio
+import importlib.util
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import app.metar_mcp_server as srv
+from starlette.requests import Request
+
+from benchmarks.bench_fake_mongo import tiled_documents
+from benchmarks.load_driver import use_fake_db
+from benchmarks.synthetic_metar import REPORT_INTERVAL, load_stations
+
+RANGES = {"1 day": timedelta(days=1), "30 days": timedelta(days=30), "365 days": timedelta(days=365)}
+
+
+async def _authorized(request):
+    return object()
+
+
+async def export(start: datetime, end: datetime, export_format: str, batch_size: int, trace: bool = False) -> tuple[int, int]:
+    """Drain one export; returns (bytes, chunks). With `trace`, tracemalloc runs from the first chunk on."""
+    query = f"start={start.isoformat()}&end={end.isoformat()}&format={export_format}&batch_size={batch_size}"
+    request = Request({"type": "http", "method": "GET", "path": "/export/metar", "headers": [], "query_string": query.encode()})
+    response = await srv.export_metar_route(request)
+    size = chunks = 0
+    async for chunk in response.body_iterator:
+        if trace and not chunks:
+            tracemalloc.start()
+        size += len(chunk)
+        chunks += 1
+    return size, chunks
+
+
+async def run(target: str, days: int, batch_size: int, sample: int) -> None:
+    srv.request_access_token = _authorized
+    end = datetime.now().replace(second=0, microsecond=0)
+    if target == "fake":
+        fake_db = await use_fake_db(0, 0, 0, indexes=False)
+        count = len(load_stations()) * int(timedelta(days=days) / REPORT_INTERVAL)
+        t0 = time.perf_counter()
+        fake_db[srv.COLLECTION_METAR].extend(tiled_documents(count, sample))
+        print(f"tiled {count:,} docs ({days} days of every station) into the in-memory fake in {time.perf_counter() - t0:.1f}s")
+        await srv.ensure_indexes()
+        end = max(d["timestamp"] for d in fake_db[srv.COLLECTION_METAR]._docs) + timedelta(minutes=1)
+        await export(end - timedelta(hours=1), end, "ndjson", batch_size)  # builds the fake's indexes
+
+    formats = ["ndjson", "parquet"] if importlib.util.find_spec("pyarrow") else ["ndjson"]
+    print(f"batch_size={batch_size}" + ("" if "parquet" in formats else " (pyarrow not installed: NDJSON only)"))
+    print(f"{'range':<10}{'format':>8}{'docs':>10}{'MB':>9}{'chunks':>8}{'seconds':>9}{'docs/s':>10}{'peak MB':>9}")
+    for name, span in RANGES.items():
+        if span > timedelta(days=days) and target == "fake":
+            continue
+        for export_format in formats:
+            srv.transfer_stats = srv.TransferStats()
+            t0 = time.perf_counter()
+            size, chunks = await export(end - span, end, export_format, batch_size)
+            seconds = time.perf_counter() - t0
+            docs = srv.transfer_stats.stats()["export_metar_route"]["documents"]
+
+            await export(end - span, end, export_format, batch_size, trace=True)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            steady = f"{peak / 1e6:.1f}" if docs > batch_size else "-"  # nothing read after the first batch
+            print(
+                f"{name:<10}{export_format:>8}{docs:>10,}{size / 1e6:>9.1f}{chunks:>8}{seconds:>9.2f}"
+                f"{docs / seconds:>10,.0f}{steady:>9}"
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--target", choices=["fake", "mongo"], default="fake")
+    parser.add_argument("--days", type=int, default=365, help="history to load into the fake")
+    parser.add_argument("--batch-size", type=int, default=srv.EXPORT_BATCH_SIZE)
+    parser.add_argument("--sample", type=int, default=20_000, help="generated documents before tiling")
+    args = parser.parse_args()
+    asyncio.run(run(args.target, args.days, args.batch_size, args.sample))
+
+
+if __name__ == "__main__":
+    main()
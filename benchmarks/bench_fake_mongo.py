@@ -0,0 +1,89 @@
+# benchmarks/bench_fake_mongo.py
+"""
+Tool latency against the in-memory stand-in of tests/fake_mongo.py at 1M+ documents.
+
+A generated sample (benchmarks.synthetic_metar) is tiled back in time until the
+collection holds --docs documents. Each tool is timed on its first call (which
+builds the field indexes it needs) and then warm. With --no-indexes no index is
+declared, so every query scans the collection.
+
+    python -m benchmarks.bench_fake_mongo --docs 1000000
+"""
+import argparse
+import asyncio
+import time
+from collections.abc import Iterator
+from datetime import timedelta
+
+import app.metar_mcp_server as srv
+from bson import ObjectId
+
+from benchmarks.load_driver import percentile, use_fake_db
+from benchmarks.synthetic_metar import generate_documents
+
+
+def tiled_documents(count: int, sample: int, seed: int = 0) -> Iterator[dict]:
+    """`count` documents: a generated sample repeated further back in time (shallow copies)."""
+    base = list(generate_documents(min(count, sample), seed=seed))
+    span = base[0]["timestamp"] - base[-1]["timestamp"] + timedelta(minutes=30)
+    produced, tile = 0, 0
+    while produced < count:
+        shift = span * tile
+        for doc in base:
+            if produced == count:
+                return
+            if tile:
+                doc = {
+                    **doc, "_id": ObjectId(), "timestamp": doc["timestamp"] - shift,
+                    "metar": {**doc["metar"], "updatedTime": doc["metar"]["updatedTime"] - shift},
+                }
+            produced += 1
+            yield doc
+        tile += 1
+
+
+CALLS = {
+    "search_metar_data:station": lambda: srv.search_metar_data(station_icao="VIDP", limit=5),
+    "search_metar_data:temperature": lambda: srv.search_metar_data(hours_back=24, temperature_min=35.0, limit=10),
+    "get_latest_metar_for_stations": lambda: srv.get_latest_metar_for_stations(["VIDP", "VABB", "VOMM", "VECC"]),
+    "get_metar_near": lambda: srv.get_metar_near("BLR", k=5),
+    "get_metar_statistics": lambda: srv.get_metar_statistics(),
+    "raw_mongodb_query": lambda: srv.raw_mongodb_query('{"stationICAO": "VOMM"}', limit=5),
+}
+
+
+async def run(docs: int, sample: int, repeat: int, indexes: bool) -> None:
+    fake_db = await use_fake_db(0, 0, 0, indexes=False)
+    t0 = time.perf_counter()
+    fake_db[srv.COLLECTION_METAR].extend(tiled_documents(docs, sample))
+    print(f"tiled {docs:,} docs into the in-memory fake in {time.perf_counter() - t0:.1f}s")
+    if indexes:
+        await srv.ensure_indexes()
+    srv.result_cache = srv.QueryResultCache(0, 0, 0)
+
+    print(f"{'tool':<32}{'first ms':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for name, call in CALLS.items():
+        t0 = time.perf_counter()
+        await call()
+        first = time.perf_counter() - t0
+        warm = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            await call()
+            warm.append(time.perf_counter() - t0)
+        warm.sort()
+        print(f"{name:<32}{first * 1000:>10.1f}{percentile(warm, 50) * 1000:>10.2f}{percentile(warm, 99) * 1000:>10.2f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=1_000_000)
+    parser.add_argument("--sample", type=int, default=20_000, help="generated documents before tiling")
+    parser.add_argument("--repeat", type=int, default=20, help="warm calls per tool")
+    parser.add_argument("--no-indexes", action="store_true", help="declare no indexes: every query scans")
+    args = parser.parse_args()
+    asyncio.run(run(args.docs, args.sample, args.repeat, not args.no_indexes))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# benchmarks/bench_numeric_range.py
+"""
+String vs numeric range search over METAR observations.
+
+Loads N synthetic documents into a scratch collection of a real mongod, then
+times the old lexicographic string-range query against the numeric shadow
+field query backed by NUMERIC_OBS_INDEXES.
+
+    MONGODB_URL=mongodb://localhost:27017 python -m benchmarks.bench_numeric_range --docs 3000000
+"""
+import argparse
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+from app.metar_mcp_server import NUMERIC_OBS_INDEXES, NUMERIC_OBS_PREFIX, enrich_metar_document
+from pymongo import MongoClient
+
+STATIONS = [f"V{a}{b}{c}" for a in "AEIO" for b in "ABDGKLPRT" for c in "ABDGKLPRT"]
+
+
+def _doc(i: int, now: datetime) -> dict:
+    ts = now - timedelta(minutes=30 * (i // len(STATIONS)))
+    temp = random.randint(-5, 45)
+    return {
+        "stationICAO": STATIONS[i % len(STATIONS)],
+        "timestamp": ts,
+        "hasMetarData": True,
+        "metar": {
+            "updatedTime": ts,
+            "decodedData": {"observation": {
+                "airTemperature": f"M{-temp:02d}" if temp < 0 else f"{temp:02d}",
+                "horizontalVisibility": str(random.choice([800, 1500, 3000, 5000, 6000, 8000, 9999])),
+                "windSpeed": str(random.randint(0, 35)),
+                "windDirection": str(random.randrange(0, 360, 10)),
+                "observedQNH": str(random.randint(990, 1025)),
+            }},
+        },
+    }
+
+
+def load(coll, total: int, batch: int = 10_000) -> None:
+    coll.drop()
+    now = datetime.now()
+    for start in range(0, total, batch):
+        coll.insert_many([enrich_metar_document(_doc(i, now)) for i in range(start, min(start + batch, total))], ordered=False)
+    for keys in NUMERIC_OBS_INDEXES:
+        coll.create_index(keys)
+    coll.create_index([("timestamp", -1)])
+
+
+def timed(coll, query: dict, runs: int) -> tuple[float, str]:
+    plan = coll.find(query).sort("timestamp", -1).limit(50).explain()
+    stage = plan["queryPlanner"]["winningPlan"]
+    best = float("inf")
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        list(coll.find(query).sort("timestamp", -1).limit(50))
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000, str(stage.get("stage")) + "/" + str(stage.get("inputStage", {}).get("stage"))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=3_000_000)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--skip-load", action="store_true")
+    args = parser.parse_args()
+
+    coll = MongoClient(os.getenv("MONGODB_URL", "mongodb://localhost:27017"))["metar_bench"]["metar_data"]
+    if not args.skip_load:
+        t0 = time.perf_counter()
+        load(coll, args.docs)
+        print(f"loaded {args.docs:,} docs in {time.perf_counter() - t0:.1f}s")
+
+    cases = {
+        "temperature 40..45": ("metar.decodedData.observation.airTemperature", "airTemperature", 40, 45),
+        "visibility 0..1500": ("metar.decodedData.observation.horizontalVisibility", "horizontalVisibility", 0, 1500),
+        "wind 30..35": ("metar.decodedData.observation.windSpeed", "windSpeed", 30, 35),
+        "qnh 990..995": ("metar.decodedData.observation.observedQNH", "observedQNH", 990, 995),
+    }
+    print(f"{'case':<22}{'string ms':>12}{'numeric ms':>12}  plans")
+    for name, (raw_field, num_field, lo, hi) in cases.items():
+        string_ms, string_plan = timed(coll, {raw_field: {"$gte": str(lo), "$lte": str(hi)}}, args.runs)
+        numeric_ms, numeric_plan = timed(coll, {f"{NUMERIC_OBS_PREFIX}.{num_field}": {"$gte": float(lo), "$lte": float(hi)}}, args.runs)
+        print(f"{name:<22}{string_ms:>12.1f}{numeric_ms:>12.1f}  {string_plan} -> {numeric_plan}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# benchmarks/bench_output_tokens.py
+"""
+Prompt tokens of tool results: the text formatter vs output_format 'toon' / 'columns'.
+
+Tools run in-process against the in-memory fake loaded with synthetic
+documents. Tokens are counted with tiktoken (o200k_base) when it is installed,
+otherwise approximated as words plus punctuation (a run of one mark counts once).
+
+    python -m benchmarks.bench_output_tokens --docs 20000 --limit 50
+"""
+import argparse
+import asyncio
+import json
+import re
+from collections.abc import Callable
+
+import app.metar_mcp_server as srv
+
+from benchmarks.load_driver import use_fake_db
+
+
+def token_counter() -> tuple[str, Callable[[str], int]]:
+    try:
+        import tiktoken
+    except ImportError:
+        pieces = re.compile(r"\w+|([^\w\s])\1*")
+        return "approx (words + punctuation)", lambda text: sum(1 for _ in pieces.finditer(text))
+    encoding = tiktoken.get_encoding("o200k_base")
+    return "tiktoken o200k_base", lambda text: len(encoding.encode(text))
+
+
+def calls(limit: int) -> dict[str, Callable[[str], object]]:
+    return {
+        f"search_metar_data limit={limit}": lambda fmt: srv.search_metar_data(
+            hours_back=48, limit=limit, output_format=fmt
+        ),
+        f"raw_mongodb_query limit={limit}": lambda fmt: srv.raw_mongodb_query(
+            json.dumps({"stationICAO": {"$in": ["VIDP", "VABB", "VOMM"]}}), limit=limit, output_format=fmt
+        ),
+        "get_metar_statistics": lambda fmt: srv.get_metar_statistics(output_format=fmt),
+    }
+
+
+async def run(docs: int, limit: int) -> None:
+    await use_fake_db(docs, 0, 0)
+    name, count = token_counter()
+    print(f"tokens: {name}")
+    print(f"{'tool':<32}{'format':>9}{'chars':>9}{'tokens':>9}{'vs text':>9}")
+    for tool, call in calls(limit).items():
+        baseline = None
+        for fmt in srv.OUTPUT_FORMATS:
+            text = await call(fmt)
+            tokens = count(text)
+            baseline = baseline or tokens
+            print(f"{tool:<32}{fmt:>9}{len(text):>9}{tokens:>9}{tokens / baseline:>9.0%}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=20_000)
+    parser.add_argument("--limit", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(run(args.docs, args.limit))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# benchmarks/bench_render.py
+"""
+Formatting cost of 10k observations: the former `result +=` renderer, the
+list-join renderer, and the RenderCache (cold and warm).
+
+    python -m benchmarks.bench_render --docs 10000 --rounds 5
+"""
+import argparse
+import time
+from typing import Any
+
+from app.metar_mcp_server import RenderCache, format_metar_data
+
+from benchmarks.synthetic_metar import generate_documents
+
+
+def format_metar_data_concat(metar_doc: dict[str, Any]) -> str:
+    """format_metar_data as it was before the list-join rewrite (reference only)."""
+    station = metar_doc.get('stationICAO', 'Unknown')
+    iata = metar_doc.get('stationIATA', 'N/A')
+    result = f"🛩️ Station: {station}"
+    if iata:
+        result += f" ({iata})"
+    result += f"\n Last Updated: {metar_doc.get('processed_timestamp', 'Unknown')}\n"
+    if metar_doc.get('hasMetarData') and 'metar' in metar_doc:
+        metar = metar_doc['metar']
+        result += f" Raw METAR: {metar.get('rawData', 'N/A')}\n"
+        if 'decodedData' in metar and 'observation' in metar['decodedData']:
+            obs = metar['decodedData']['observation']
+            result += "\n Weather Conditions:\n"
+            result += f" Temperature: {obs.get('airTemperature', 'N/A')}\n"
+            result += f" Dewpoint: {obs.get('dewpointTemperature', 'N/A')}\n"
+            result += f" Wind: {obs.get('windSpeed', 'N/A')} from {obs.get('windDirection', 'N/A')}\n"
+            result += f" Visibility: {obs.get('horizontalVisibility', 'N/A')}\n"
+            result += f" Pressure: {obs.get('observedQNH', 'N/A')}\n"
+            if obs.get('cloudLayers'):
+                result += f" Clouds: {', '.join(obs['cloudLayers'])}\n"
+            if obs.get('weatherConditions'):
+                result += f" Weather: {obs['weatherConditions']}\n"
+    if metar_doc.get('hasTaforData') and 'tafor' in metar_doc:
+        result += f"\n📊 TAF: {metar_doc['tafor'].get('rawData', 'N/A')}\n"
+    return result
+
+
+def best_ms(fn, rounds: int) -> float:
+    best = float("inf")
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def run(count: int, rounds: int) -> None:
+    docs = list(generate_documents(count))
+    assert all(format_metar_data_concat(d) == format_metar_data(d) for d in docs)
+
+    def concat_page() -> str:
+        result = ""
+        for i, doc in enumerate(docs, 1):
+            result += f"--- Result {i} ---\n"
+            result += format_metar_data_concat(doc)
+            result += "\n"
+        return result
+
+    def join_page(render) -> str:
+        parts = []
+        for i, doc in enumerate(docs, 1):
+            parts += (f"--- Result {i} ---\n", render(doc), "\n")
+        return "".join(parts)
+
+    def cold() -> str:
+        return join_page(RenderCache(count).metar_data)
+
+    warm_cache = RenderCache(count)
+    join_page(warm_cache.metar_data)
+
+    print(f"{count:,} documents, best of {rounds}")
+    rows = [
+        ("result += renderer", best_ms(concat_page, rounds)),
+        ("list-join renderer", best_ms(lambda: join_page(format_metar_data), rounds)),
+        ("RenderCache cold", best_ms(cold, rounds)),
+        ("RenderCache warm", best_ms(lambda: join_page(warm_cache.metar_data), rounds)),
+    ]
+    baseline = rows[0][1]
+    for name, ms in rows:
+        print(f"{name:<22}{ms:>9.1f} ms{ms / count * 1000:>9.2f} us/doc{baseline / ms:>7.1f}x")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=10_000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    run(args.docs, args.rounds)
+
+
+if __name__ == "__main__":
+    main()
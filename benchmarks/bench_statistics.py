@@ -0,0 +1,63 @@
+# benchmarks/bench_statistics.py
+"""
+get_metar_statistics latency: seven round trips vs one $facet vs materialized.
+
+    MONGODB_URL=mongodb://localhost:27017 python -m benchmarks.bench_statistics --docs 3000000
+"""
+import argparse
+import os
+import time
+
+from app.metar_mcp_server import STATISTICS_PIPELINE
+from pymongo import MongoClient
+
+from benchmarks.bench_numeric_range import load
+
+
+def legacy(coll) -> None:
+    coll.count_documents({})
+    coll.distinct("stationICAO")
+    coll.distinct("stationIATA")
+    list(coll.find({}, {"metar.updatedTime": 1}).sort("metar.updatedTime", 1).limit(1))
+    list(coll.find({}, {"metar.updatedTime": 1}).sort("metar.updatedTime", -1).limit(1))
+    coll.count_documents({"hasMetarData": True})
+    coll.count_documents({"hasTaforData": True})
+
+
+def facet(coll) -> None:
+    list(coll.aggregate(STATISTICS_PIPELINE, allowDiskUse=True))
+
+
+def best_ms(fn, runs: int) -> float:
+    best = float("inf")
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=3_000_000)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--skip-load", action="store_true")
+    args = parser.parse_args()
+
+    db = MongoClient(os.getenv("MONGODB_URL", "mongodb://localhost:27017"))["metar_bench"]
+    coll = db["metar_data"]
+    if not args.skip_load:
+        load(coll, args.docs)
+    coll.create_index([("metar.updatedTime", -1)])
+
+    stats = next(coll.aggregate(STATISTICS_PIPELINE, allowDiskUse=True))
+    db["metar_statistics"].replace_one({"_id": "metar_statistics"}, stats, upsert=True)
+
+    print(f"{coll.estimated_document_count():,} documents")
+    print(f"legacy (7 round trips): {best_ms(lambda: legacy(coll), args.runs):10.1f} ms")
+    print(f"single $facet:          {best_ms(lambda: facet(coll), args.runs):10.1f} ms")
+    print(f"materialized find_one:  {best_ms(lambda: db['metar_statistics'].find_one({'_id': 'metar_statistics'}), args.runs):10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
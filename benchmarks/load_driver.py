@@ -0,0 +1,156 @@
+# benchmarks/load_driver.py
+"""
+Async load driver: replays a mixed MCP tool-call workload and reports
+p50/p95/p99 latency and throughput per tool.
+
+Tools are called in-process (no HTTP, no auth) against either a real mongod
+loaded with benchmarks.synthetic_metar, or the in-memory fake of tests/fake_mongo.py.
+
+    python -m benchmarks.load_driver --target fake --docs 200000 --concurrency 32 --duration 30
+    MONGODB_URL=mongodb://localhost:27017 python -m benchmarks.load_driver --target mongo --duration 60
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections.abc import Awaitable, Callable
+
+import app.metar_mcp_server as srv
+
+from benchmarks.synthetic_metar import generate_documents, load_fake, load_stations
+
+Call = Callable[[random.Random], Awaitable[str]]
+
+
+def workload(stations: list[dict]) -> dict[str, tuple[float, Call]]:
+    """Tool name -> (weight, call factory), roughly the mix an assistant produces."""
+    icaos = [s["stationICAO"] for s in stations]
+    iatas = [s["stationIATA"] for s in stations if s["stationIATA"]]
+    return {
+        "search_metar_data:station": (35, lambda rng: srv.search_metar_data(station_icao=rng.choice(icaos), limit=5)),
+        "search_metar_data:latest": (15, lambda rng: srv.search_metar_data(station_iata=rng.choice(iatas), limit=1)),
+        "search_metar_data:temperature": (
+            5, lambda rng: srv.search_metar_data(hours_back=24, temperature_min=float(rng.randint(30, 40)), limit=10)
+        ),
+        "get_latest_metar_for_stations": (15, lambda rng: srv.get_latest_metar_for_stations(rng.sample(icaos, 5))),
+        "get_metar_near": (5, lambda rng: srv.get_metar_near(rng.choice(iatas), k=5)),
+        "get_metar_statistics": (10, lambda rng: srv.get_metar_statistics()),
+        "list_available_stations": (10, lambda rng: srv.list_available_stations()),
+        "raw_mongodb_query": (
+            5, lambda rng: srv.raw_mongodb_query(json.dumps({"stationICAO": rng.choice(icaos)}), limit=5)
+        ),
+    }
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(p / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+async def run_load(
+    calls: dict[str, tuple[float, Call]], concurrency: int, duration: float, seed: int = 0
+) -> tuple[dict[str, list[float]], dict[str, int], float]:
+    """Run `concurrency` workers for `duration` seconds; returns latencies (s), errors, elapsed."""
+    names = list(calls)
+    weights = [calls[name][0] for name in names]
+    latencies: dict[str, list[float]] = {name: [] for name in names}
+    errors: dict[str, int] = dict.fromkeys(names, 0)
+    deadline = time.perf_counter() + duration
+
+    async def worker(n: int) -> None:
+        rng = random.Random(seed + n)
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights)[0]
+            t0 = time.perf_counter()
+            try:
+                result = await calls[name][1](rng)
+                if result.startswith(("Error", "Query too expensive")):
+                    errors[name] += 1
+            except Exception:
+                errors[name] += 1
+            latencies[name].append(time.perf_counter() - t0)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(n) for n in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+
+def report(latencies: dict[str, list[float]], errors: dict[str, int], elapsed: float) -> str:
+    lines = [f"{'tool':<32}{'calls':>8}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'calls/s':>10}"]
+    total = 0
+    for name, values in sorted(latencies.items()):
+        values = sorted(values)
+        total += len(values)
+        lines.append(
+            f"{name:<32}{len(values):>8}{errors[name]:>8}"
+            + "".join(f"{percentile(values, p) * 1000:>10.2f}" for p in (50, 95, 99))
+            + f"{len(values) / elapsed:>10.1f}"
+        )
+    everything = sorted(v for values in latencies.values() for v in values)
+    lines.append(
+        f"{'all':<32}{total:>8}{sum(errors.values()):>8}"
+        + "".join(f"{percentile(everything, p) * 1000:>10.2f}" for p in (50, 95, 99))
+        + f"{total / elapsed:>10.1f}"
+    )
+    return "\n".join(lines)
+
+
+async def use_fake_db(docs: int, extra_stations: int, seed: int, indexes: bool = True):
+    """Point the server at an in-memory FakeDB holding `docs` synthetic documents,
+    with the server's indexes declared unless `indexes` is false; returns the FakeDB."""
+    from tests.fake_mongo import FakeDB, FakeMongoClient
+
+    fake_client, fake_db = FakeMongoClient(), FakeDB()
+
+    async def _fake_get_mongodb_client():
+        return fake_client, fake_db
+
+    srv.get_mongodb_client = _fake_get_mongodb_client
+    if docs:
+        t0 = time.perf_counter()
+        load_fake(fake_db, generate_documents(docs, extra_stations=extra_stations, seed=seed))
+        print(f"loaded {docs:,} docs into the in-memory fake in {time.perf_counter() - t0:.1f}s")
+    if indexes:
+        await srv.ensure_indexes()
+    return fake_db
+
+
+async def main_async(args: argparse.Namespace) -> None:
+    if args.target == "fake":
+        await use_fake_db(args.docs, args.extra_stations, args.seed)
+    else:
+        await srv.warm_up_mongodb()
+        await srv.bootstrap_indexes()
+    if args.no_result_cache:
+        srv.result_cache = srv.QueryResultCache(0, 0, 0)
+    if args.latest_cache:
+        await srv.latest_cache.start()
+
+    calls = workload(load_stations(args.extra_stations, args.seed))
+    try:
+        latencies, errors, elapsed = await run_load(calls, args.concurrency, args.duration, args.seed)
+    finally:
+        await srv.latest_cache.stop()
+    print(f"{args.concurrency} workers, {elapsed:.1f}s")
+    print(report(latencies, errors, elapsed))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--target", choices=["fake", "mongo"], default="fake")
+    parser.add_argument("--docs", type=int, default=100_000, help="synthetic documents for --target fake")
+    parser.add_argument("--extra-stations", type=int, default=0)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-result-cache", action="store_true", help="measure every call against the database")
+    parser.add_argument("--latest-cache", action="store_true", help="start the latest-observation cache")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+# benchmarks/synthetic_metar.py
+"""
+Synthetic METAR/TAF documents shaped like the metar_json_schema resource.
+
+Stations come from app/stations.json, optionally padded with made-up stations
+scattered over India. Every station reports half-hourly (a few reports missing).
+Temperature follows latitude, season and time of day. Winter mornings in the
+north bring fog and mist, and monsoon afternoons bring showers and
+thunderstorms. Major stations issue a TAF every six hours. Documents are
+enriched like ingestion does (numeric shadow fields, METAR groups, FIR key).
+
+    MONGODB_URL=mongodb://localhost:27017 python -m benchmarks.synthetic_metar --docs 2000000 --drop
+"""
+import argparse
+import itertools
+import json
+import math
+import os
+import random
+import time
+from collections.abc import Iterator
+from datetime import datetime, timedelta
+
+from app.metar_mcp_server import STATIONS_FILE, enrich_metar_document
+from bson import ObjectId
+
+IST_OFFSET = timedelta(hours=5, minutes=30)
+REPORT_INTERVAL = timedelta(minutes=30)
+MISSING_REPORT_RATE = 0.02
+VISIBILITIES = [9999, 8000, 6000, 5000, 4000, 3000]
+
+
+def load_stations(extra: int = 0, seed: int = 0) -> list[dict]:
+    """Stations of STATIONS_FILE plus `extra` synthetic ones (flagged major=False)."""
+    with open(STATIONS_FILE, encoding="utf-8") as fh:
+        stations = [{**row, "major": row.get("stationIATA") is not None} for row in json.load(fh)]
+    rng = random.Random(seed)
+    firs = sorted({s["fir"] for s in stations})
+    letters = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    taken = {s["stationICAO"] for s in stations}
+    while extra > 0:
+        icao = "V" + rng.choice("AEIO") + rng.choice(letters) + rng.choice(letters)
+        if icao in taken:
+            continue
+        taken.add(icao)
+        stations.append({
+            "stationICAO": icao, "stationIATA": None, "name": f"Synthetic {icao}",
+            "latitude": rng.uniform(8.0, 32.0), "longitude": rng.uniform(69.0, 95.0),
+            "elevationM": rng.randint(0, 900), "fir": rng.choice(firs), "major": False,
+        })
+        extra -= 1
+    return stations
+
+
+def _observation(rng: random.Random, station: dict, ts: datetime) -> dict:
+    lat = station["latitude"]
+    local_hour = (ts + IST_OFFSET).hour + (ts + IST_OFFSET).minute / 60
+    winter = math.cos(2 * math.pi * (ts.timetuple().tm_yday - 15) / 365)  # 1 mid-Jan, -1 mid-Jul
+    monsoon = ts.month in (6, 7, 8, 9)
+    diurnal = -math.cos(2 * math.pi * (local_hour - 3) / 24)  # min ~03 LT, max ~15 LT
+
+    temp = round(33 - 0.9 * max(lat - 12, 0) * max(winter, 0) - station["elevationM"] / 200 + 6 * diurnal + rng.gauss(0, 1.5))
+    spread = max(1, round((4 if monsoon else 9) + 4 * diurnal + rng.gauss(0, 2)))
+    wind = max(0, round(rng.gammavariate(2.0, 3.5 if monsoon else 2.5)))
+    direction = 0 if wind == 0 else rng.randrange(10, 361, 10)
+    gust = wind + rng.randint(10, 15) if wind >= 15 and rng.random() < 0.3 else None
+    qnh = round(1012 + 6 * winter - 0.3 * (local_hour % 12 - 6) + rng.gauss(0, 2))
+
+    weather, clouds = None, []
+    visibility = rng.choice(VISIBILITIES)
+    if lat > 20 and winter > 0.6 and 1 <= local_hour <= 9 and rng.random() < 0.35:
+        visibility = rng.choice([50, 100, 200, 400, 600, 800, 1000, 1500, 2000])
+        weather = "FG" if visibility < 1000 else "BR"
+        spread = 0 if weather == "FG" else 1
+    elif monsoon and 12 <= local_hour <= 21 and rng.random() < 0.3:
+        weather = rng.choice(["-RA", "RA", "SHRA", "TSRA", "TS", "+TSRA"])
+        visibility = rng.choice([1500, 2000, 3000, 4000, 5000])
+        clouds.append(f"{rng.choice(['SCT', 'BKN'])}0{rng.randint(15, 30)}CB" if "TS" in weather else f"BKN0{rng.randint(8, 20):02d}")
+    elif rng.random() < 0.15:
+        weather = "HZ"
+        visibility = rng.choice([2000, 3000, 4000])
+    for _ in range(rng.choice([0, 1, 1, 2, 3 if monsoon else 1])):
+        clouds.append(f"{rng.choice(['FEW', 'SCT', 'BKN'])}{rng.choice([15, 20, 25, 30, 40, 80, 100]):03d}")
+    clouds = sorted(dict.fromkeys(clouds), key=lambda c: int(c[3:6]))
+
+    dew = temp - spread
+    return {
+        "windSpeed": str(wind), "windDirection": f"{direction:03d}", "windGust": gust,
+        "horizontalVisibility": str(visibility), "weatherConditions": weather, "cloudLayers": clouds,
+        "airTemperature": str(temp), "dewpointTemperature": str(dew), "observedQNH": str(qnh),
+    }
+
+
+def _raw_metar(icao: str, ts: datetime, obs: dict) -> str:
+    def temp(v: str) -> str:
+        return f"M{-int(v):02d}" if int(v) < 0 else f"{int(v):02d}"
+
+    wind = f"{obs['windDirection']}{int(obs['windSpeed']):02d}" + (f"G{obs['windGust']:02d}" if obs["windGust"] else "") + "KT"
+    cavok = obs["horizontalVisibility"] == "9999" and not obs["weatherConditions"] and all(int(c[3:6]) >= 50 for c in obs["cloudLayers"])
+    groups = [icao, ts.strftime("%d%H%MZ"), wind]
+    if cavok:
+        groups.append("CAVOK")
+    else:
+        groups.append(f"{int(obs['horizontalVisibility']):04d}")
+        if obs["weatherConditions"]:
+            groups.append(obs["weatherConditions"])
+        groups += obs["cloudLayers"] or ["NSC"]
+    groups += [f"{temp(obs['airTemperature'])}/{temp(obs['dewpointTemperature'])}", f"Q{obs['observedQNH']}", "NOSIG"]
+    return " ".join(groups)
+
+
+def _raw_taf(rng: random.Random, icao: str, issued: datetime) -> str:
+    valid_from = issued + timedelta(hours=1)
+    valid_to = valid_from + timedelta(hours=24)
+    wind = f"{rng.randrange(10, 361, 10):03d}{rng.randint(3, 15):02d}KT"
+    return (
+        f"TAF {icao} {issued:%d%H%M}Z {valid_from:%d%H}/{valid_to:%d%H} {wind} "
+        f"{rng.choice(VISIBILITIES):04d} {rng.choice(['FEW', 'SCT'])}0{rng.randint(15, 30)} "
+        f"TEMPO {valid_from + timedelta(hours=8):%d%H}/{valid_from + timedelta(hours=12):%d%H} 3000 TSRA SCT025CB"
+    )
+
+
+def generate_documents(
+    count: int, end: datetime | None = None, extra_stations: int = 0, seed: int = 0
+) -> Iterator[dict]:
+    """`count` enriched documents, one half-hourly round of reports at a time, newest round
+    (at `end`, default now) first."""
+    rng = random.Random(seed)
+    stations = load_stations(extra_stations, seed)
+    end = (end or datetime.now()).replace(second=0, microsecond=0)
+    end -= timedelta(minutes=end.minute % 30)
+    produced = 0
+    for r in itertools.count():
+        ts = end - r * REPORT_INTERVAL
+        for station in stations:
+            if produced == count:
+                return
+            if rng.random() < MISSING_REPORT_RATE:
+                continue
+            icao = station["stationICAO"]
+            obs = _observation(rng, station, ts)
+            taf_issued = ts.replace(hour=ts.hour - ts.hour % 6, minute=0)
+            has_taf = station["major"]
+            doc = {
+                "_id": ObjectId(),
+                "stationICAO": icao,
+                "stationIATA": station["stationIATA"],
+                "hasMetarData": True,
+                "hasTaforData": has_taf,
+                "timestamp": ts,
+                "processed_timestamp": ts + timedelta(seconds=rng.randint(20, 240)),
+                "metar": {
+                    "updatedTime": ts + timedelta(seconds=rng.randint(5, 120)),
+                    "firRegion": station["fir"],
+                    "rawData": _raw_metar(icao, ts, obs),
+                    "decodedData": {
+                        "observation": {
+                            "observationTimeUTC": ts,
+                            "observationTimeIST": ts + IST_OFFSET,
+                            **{k: v for k, v in obs.items() if k != "windGust"},
+                            "runwayVisualRange": None,
+                            "windShear": None,
+                            "runwayConditions": None,
+                        },
+                        "additionalInformation": {"weatherTrend": "NOSIG", "forecastWeather": None},
+                    },
+                },
+                "tafor": {
+                    "rawData": _raw_taf(rng, icao, taf_issued) if has_taf else "",
+                    "updatedTime": None,
+                    "timestamp": taf_issued,
+                },
+            }
+            produced += 1
+            yield enrich_metar_document(doc)
+
+
+def load_mongo(coll, docs: Iterator[dict], batch: int = 10_000) -> int:
+    """insert_many in batches into a pymongo collection; returns the count."""
+    total = 0
+    chunk: list[dict] = []
+    for doc in docs:
+        chunk.append(doc)
+        if len(chunk) == batch:
+            coll.insert_many(chunk, ordered=False)
+            total += len(chunk)
+            chunk = []
+    if chunk:
+        coll.insert_many(chunk, ordered=False)
+        total += len(chunk)
+    return total
+
+
+def load_fake(fake_db, docs: Iterator[dict], collection: str = "metar_data") -> int:
+    """Append into the in-memory FakeDB of tests/fake_mongo.py; returns the count."""
+    target = fake_db[collection]
+    before = len(target._docs)
+    target.extend(docs)
+    return len(target._docs) - before
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=1_000_000)
+    parser.add_argument("--extra-stations", type=int, default=0, help="synthetic stations on top of app/stations.json")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--drop", action="store_true", help="drop the collection first")
+    args = parser.parse_args()
+
+    from pymongo import MongoClient
+
+    coll = MongoClient(os.getenv("MONGODB_URL", "mongodb://localhost:27017"))[os.getenv("DATABASE_NAME", "metar_data")][
+        os.getenv("COLLECTION_METAR", "metar_data")
+    ]
+    if args.drop:
+        coll.drop()
+    t0 = time.perf_counter()
+    total = load_mongo(coll, generate_documents(args.docs, extra_stations=args.extra_stations, seed=args.seed))
+    print(f"loaded {total:,} docs into {coll.full_name} in {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,9 +7,10 @@ import types
 fastmcp_mod = types.ModuleType("fastmcp")
 
 class _FastMCPStub:
-    def __init__(self, name, auth=None):
+    def __init__(self, name, auth=None, lifespan=None):
         self.name = name
         self.auth = auth
+        self.lifespan = lifespan
         self.app = None  # optional; used only if you do ASGI tests
 
     def tool(self, *args, **kwargs):
@@ -41,11 +42,24 @@ providers_mod = types.ModuleType("fastmcp.server.auth.providers")
 jwt_mod = types.ModuleType("fastmcp.server.auth.providers.jwt")
 
 class _JWTVerifierStub:
-    def __init__(self, jwks_uri=None, issuer=None, audience=None):
+    def __init__(self, public_key=None, jwks_uri=None, issuer=None, audience=None):
+        self.public_key = public_key
         self.jwks_uri = jwks_uri
         self.issuer = issuer
         self.audience = audience
 
+    async def load_access_token(self, token):
+        # Same checks as fastmcp: RS256 signature, exp, iss and aud (JWKS fetching is not modelled)
+        import jwt as pyjwt
+        try:
+            claims = pyjwt.decode(token, self.public_key, algorithms=["RS256"], audience=self.audience, issuer=self.issuer)
+        except Exception:
+            return None
+        return types.SimpleNamespace(token=token, client_id=claims.get("sub"), scopes=[], expires_at=claims.get("exp"))
+
+    async def verify_token(self, token):
+        return await self.load_access_token(token)
+
 jwt_mod.JWTVerifier = _JWTVerifierStub
 
 sys.modules["fastmcp.server"] = server_mod
@@ -85,6 +99,12 @@ def set_env_vars(monkeypatch):
     monkeypatch.setenv("COLLECTION_METAR", "metar_data")
 
 
+@pytest.fixture(autouse=True)
+def fresh_token_cache(monkeypatch):
+    # Each test starts without a cached Azure token or pooled HTTP client
+    monkeypatch.setattr(srv, "token_cache", srv.AzureTokenCache(srv.TOKEN_REFRESH_MARGIN_SECONDS))
+
+
 @pytest.fixture()
 def frozen_time():
     # Keep tests deterministic
@@ -108,6 +128,15 @@ def fake_db(monkeypatch):
     # Ensure module-level globals align if referenced
     monkeypatch.setattr(srv, "client", fake_client, raising=False)
     monkeypatch.setattr(srv, "db", _fake_db, raising=False)
+    # Process-wide caches must not leak data between tests
+    monkeypatch.setattr(srv, "station_catalog", srv.StationCatalog(srv.STATION_CATALOG_TTL_SECONDS))
+    monkeypatch.setattr(srv, "transfer_stats", srv.TransferStats())
+    monkeypatch.setattr(srv, "query_guard_stats", srv.QueryGuardStats())
+    monkeypatch.setattr(srv, "pool_stats", srv.PoolStats())
+    monkeypatch.setattr(srv, "tool_metrics", srv.ToolMetrics())
+    monkeypatch.setattr(srv, "mongo_command_metrics", srv.MongoCommandMetrics())
+    monkeypatch.setattr(srv, "result_cache", srv.QueryResultCache(srv.RESULT_CACHE_MAX_ENTRIES, 0, 60))
+    monkeypatch.setattr(srv, "render_cache", srv.RenderCache(srv.RENDER_CACHE_MAX_ENTRIES))
 
     return _fake_db
 
@@ -118,7 +147,8 @@ def sample_docs(fake_db):
     Load sample METAR/TAF docs into fake DB.
     """
     from .fixtures_sample_data import SAMPLE_DOCS
-    fake_db.collections["metar_data"].extend(SAMPLE_DOCS)
+    # Stored documents carry the typed observation fields written at ingestion
+    fake_db.collections["metar_data"].extend(srv.enrich_metar_document(d) for d in SAMPLE_DOCS)
     return SAMPLE_DOCS
 
 
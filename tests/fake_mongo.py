@@ -1,32 +1,870 @@
 # tests/fake_mongo.py
+"""
+In-memory stand-in for the Motor/pymongo surface the server uses.
+
+Collections are DocLists (plain lists that count their mutations). Every
+field named in a declared index gets a sorted single-field index, built
+lazily and rebuilt after the collection changes. find()/aggregate() $match
+use the most selective index range. sort+limit either walks the sort
+field's index or keeps a heap of the best `limit` matches, whichever the
+estimated cost favours. Results are new lists; the backing list is never
+reordered. Matching follows MongoDB semantics for the operators the server
+uses (type-bracketed comparisons, multikey arrays, $in/$and/$or/$nor,
+$regex, $exists, $ne, and $expr over a few aggregation operators). With FakeDB.replica_set set, watch() opens a change
+stream that sees later insert_one()/replace_one() calls.
+"""
+import asyncio
+import heapq
+import operator
 import re
+from bisect import bisect_left, bisect_right
 from datetime import datetime
+from functools import cache
+
+import bson
+from bson import ObjectId
+from pymongo import ReplaceOne
+
+
+# ------------------- values, ordering ----------------------------------
+@cache
+def _path(dotted):
+    return tuple(dotted.split("."))
+
+def _get_by_dotted(doc, dotted):
+    parts = _path(dotted)
+    if len(parts) == 1:
+        return doc.get(dotted)
+    cur = doc
+    for part in parts:
+        if not isinstance(cur, dict):
+            return None
+        cur = cur.get(part)
+    return cur
+
+def _set_by_dotted(doc, dotted, value):
+    parts = dotted.split(".")
+    cur = doc
+    for part in parts[:-1]:
+        cur = cur.setdefault(part, {})
+    cur[parts[-1]] = value
+
+def _bson_key(value):
+    # BSON comparison order: null < numbers < strings < objects < arrays < ObjectId < bool < dates
+    if value is None:
+        return (1, 0)
+    if isinstance(value, bool):
+        return (8, value)
+    if isinstance(value, int | float):
+        return (2, value)
+    if isinstance(value, str):
+        return (3, value)
+    if isinstance(value, dict):
+        return (4, repr(value))
+    if isinstance(value, list):
+        return (5, repr(value))
+    if isinstance(value, ObjectId):
+        return (7, value.binary)
+    if isinstance(value, datetime):
+        return (9, value)
+    return (10, repr(value))
+
+class _Desc:
+    """Inverts the order of a key inside a sort tuple."""
+    __slots__ = ("key",)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __lt__(self, other):
+        return other.key < self.key
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+def _sort_spec(field, direction=None):
+    if isinstance(field, list):
+        return [(f, d) for f, d in field]
+    if isinstance(field, dict):
+        return list(field.items())
+    return [(field, direction or 1)]
+
+def _sort_value(doc, field, direction):
+    # Arrays sort by their smallest element ascending, their largest descending
+    value = _get_by_dotted(doc, field)
+    if isinstance(value, list) and value:
+        keys = [_bson_key(v) for v in value]
+        return min(keys) if direction == 1 else _Desc(max(keys))
+    return _bson_key(value) if direction == 1 else _Desc(_bson_key(value))
+
+def _sort_key(spec):
+    def key(doc):
+        return tuple(_sort_value(doc, f, d) for f, d in spec)
+    return key
+
+
+# ------------------- matching ------------------------------------------
+def _matches_regex(value, regex, options=None):
+    if not isinstance(value, str):
+        return False
+    flags = re.I if (options and "i" in options) else 0
+    return re.search(regex, value, flags) is not None
+
+def _compare(op, value, comp):
+    # Type bracketing: only values of the comparand's BSON type can match
+    a, b = _bson_key(value), _bson_key(comp)
+    if value is None or a[0] != b[0]:
+        return False
+    if op == "$gte":
+        return a >= b
+    if op == "$gt":
+        return a > b
+    if op == "$lte":
+        return a <= b
+    return a < b
+
+def _match_field(value, cond):
+    # Arrays match when any element does (multikey semantics)
+    if isinstance(value, list) and not isinstance(cond, list):
+        if not (isinstance(cond, dict) and ("$exists" in cond or "$ne" in cond)):
+            if any(_match_field(v, cond) for v in value):
+                return True
+            if not (isinstance(cond, dict) and "$in" in cond):
+                return False
+    if isinstance(cond, dict) and any(k.startswith("$") for k in cond):
+        for k, v in cond.items():
+            if k == "$regex":
+                if not _matches_regex(value, v, cond.get("$options")):
+                    return False
+            elif k == "$options":
+                continue
+            elif k in ("$gte", "$lte", "$gt", "$lt"):
+                if not _compare(k, value, v):
+                    return False
+            elif k == "$exists":
+                if (value is not None) != bool(v):
+                    return False
+            elif k == "$ne":
+                if value == v:
+                    return False
+            elif k == "$eq":
+                if value != v:
+                    return False
+            elif k == "$in":
+                if value not in v:
+                    return False
+            elif k == "$nin":
+                if value in v:
+                    return False
+            else:
+                # unsupported operator -> fail strict
+                return False
+        return True
+    return value == cond
+
+_AGG_COMPARISONS = {
+    "$gte": operator.ge, "$gt": operator.gt, "$lte": operator.le, "$lt": operator.lt, "$eq": operator.eq, "$ne": operator.ne,
+}
+
+def _eval_agg(doc, expr):
+    # The aggregation expressions $expr filters use here: comparisons (BSON order), $and,
+    # $toString, $replaceAll and $convert to double
+    if isinstance(expr, str) and expr.startswith("$"):
+        return _get_by_dotted(doc, expr[1:])
+    if not isinstance(expr, dict):
+        return expr
+    (op, arg), = expr.items()
+    if op == "$and":
+        return all(_eval_agg(doc, e) for e in arg)
+    if op in _AGG_COMPARISONS:
+        return _AGG_COMPARISONS[op](*(_bson_key(_eval_agg(doc, e)) for e in arg))
+    if op == "$toString":
+        value = _eval_agg(doc, arg)
+        return None if value is None else value if isinstance(value, str) else f"{value:g}" if isinstance(value, float) else str(value)
+    if op == "$replaceAll":
+        value = _eval_agg(doc, arg["input"])
+        return None if value is None else value.replace(arg["find"], arg["replacement"])
+    if op == "$convert" and arg["to"] == "double":
+        value = _eval_agg(doc, arg["input"])
+        if value is None:
+            return arg.get("onNull")
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return arg.get("onError")
+    raise NotImplementedError(op)
+
+def _matches(doc, query):
+    for k, cond in query.items():
+        if k == "$expr":
+            if not _eval_agg(doc, cond):
+                return False
+        elif k == "$and":
+            if not all(_matches(doc, sub) for sub in cond):
+                return False
+        elif k == "$or":
+            if not any(_matches(doc, sub) for sub in cond):
+                return False
+        elif k == "$nor":
+            if any(_matches(doc, sub) for sub in cond):
+                return False
+        elif not _match_field(_get_by_dotted(doc, k), cond):
+            return False
+    return True
+
+def _filter_docs(docs, query):
+    if not query:
+        return list(docs)
+    return [d for d in docs if _matches(d, query)]
+
+
+# ------------------- storage and indexes -------------------------------
+class DocList(list):
+    """A collection's documents; any mutation drops the field indexes built on it."""
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.field_indexes = {}
+
+    def changed(self):
+        self.field_indexes = {}
+
+    def field_index(self, field):
+        index = self.field_indexes.get(field)
+        if index is None:
+            index = self.field_indexes[field] = FieldIndex(self, field)
+        return index
+
+def _mutator(name):
+    method = getattr(list, name)
+
+    def wrapper(self, *args, **kwargs):
+        result = method(self, *args, **kwargs)
+        self.changed()
+        return result
+    wrapper.__name__ = name
+    return wrapper
+
+for _name in ("append", "extend", "insert", "pop", "remove", "clear", "sort", "reverse",
+              "__setitem__", "__delitem__", "__iadd__", "__imul__"):
+    setattr(DocList, _name, _mutator(_name))
 
+class FieldIndex:
+    """Sorted (BSON key, position) entries for one field; arrays add one entry per element."""
+
+    _STRING = 3
+
+    def __init__(self, docs, field):
+        values = [_get_by_dotted(doc, field) for doc in docs]
+        self.field = field
+        self.multikey = any(isinstance(v, list) and v for v in values)
+        if self.multikey:
+            positions = [pos for pos, v in enumerate(values) for _ in (v if isinstance(v, list) and v else (v,))]
+            keys = [_bson_key(e) for v in values for e in (v if isinstance(v, list) and v else (v,))]
+        else:
+            positions = range(len(values))
+            keys = [_bson_key(v) for v in values]
+        order = sorted(range(len(keys)), key=keys.__getitem__)  # stable: positions ascend within equal keys
+        self.keys = [keys[i] for i in order]
+        self.positions = [positions[i] for i in order]
+
+    def spans(self, cond):
+        """(lo, hi) entry ranges whose union holds every match of `cond`, or None if unusable."""
+        keys = self.keys
+        if not isinstance(cond, dict) or not any(k.startswith("$") for k in cond):
+            key = _bson_key(cond)
+            return [(bisect_left(keys, key), bisect_right(keys, key))]
+        if "$eq" in cond:
+            return self.spans(cond["$eq"])
+        if "$in" in cond:
+            spans = []
+            for value in cond["$in"]:
+                spans += self.spans(value)
+            return spans
+        bounds = {op: cond[op] for op in ("$gt", "$gte", "$lt", "$lte") if op in cond}
+        if bounds:
+            rank = _bson_key(next(iter(bounds.values())))[0]
+            lo, hi = bisect_left(keys, (rank,)), bisect_left(keys, (rank + 1,))
+            for op, value in bounds.items():
+                key = _bson_key(value)
+                if key[0] != rank:
+                    return [(0, 0)]
+                if op == "$gte":
+                    lo = max(lo, bisect_left(keys, key))
+                elif op == "$gt":
+                    lo = max(lo, bisect_right(keys, key))
+                elif op == "$lte":
+                    hi = min(hi, bisect_right(keys, key))
+                else:
+                    hi = min(hi, bisect_left(keys, key))
+            return [(lo, max(lo, hi))]
+        prefix = _literal_prefix(cond)
+        if prefix is not None:
+            lo = bisect_left(keys, (self._STRING, prefix))
+            hi = bisect_left(keys, (self._STRING, prefix + "\U0010ffff"))
+            return [(lo, hi)]
+        return None
+
+    def positions_in(self, spans):
+        if len(spans) == 1 and not self.multikey:
+            lo, hi = spans[0]
+            return sorted(self.positions[lo:hi])
+        found = set()
+        for lo, hi in spans:
+            found.update(self.positions[lo:hi])
+        return sorted(found)
+
+def _literal_prefix(cond):
+    # {"$regex": "^ABC"} (case-sensitive, no metacharacters after the anchor) -> "ABC"
+    regex = cond.get("$regex")
+    if not isinstance(regex, str) or cond.get("$options") or not regex.startswith("^"):
+        return None
+    prefix = re.match(r"[A-Za-z0-9_ /-]*", regex[1:]).group(0)
+    rest = regex[1 + len(prefix):]
+    if rest[:1] in ("*", "?", "{"):
+        prefix = prefix[:-1]
+    return prefix or None
+
+
+# ------------------- query planning ------------------------------------
+def _plan(docs, indexed, query):
+    """(estimated entries, positions thunk) for the cheapest index range in `query`, or None."""
+    best = None
+    for k, cond in query.items():
+        option = None
+        if k == "$and":
+            for sub in cond:
+                sub_plan = _plan(docs, indexed, sub)
+                if sub_plan and (option is None or sub_plan[0] < option[0]):
+                    option = sub_plan
+        elif k == "$or":
+            branches = [_plan(docs, indexed, sub) for sub in cond]
+            if branches and all(branches):
+                option = (
+                    sum(b[0] for b in branches),
+                    lambda branches=branches: sorted(set().union(*(b[1]() for b in branches))),
+                )
+        elif not k.startswith("$") and k in indexed:
+            index = docs.field_index(k)
+            spans = index.spans(cond)
+            if spans is not None:
+                option = (sum(hi - lo for lo, hi in spans), lambda index=index, spans=spans: index.positions_in(spans))
+        if option and (best is None or option[0] < best[0]):
+            best = option
+    return best
+
+def _select(docs, indexed, query, sort=None, limit=None):
+    """Documents matching `query`, ordered by `sort`, at most `limit` (0/None: all)."""
+    query = query or {}
+    n = len(docs)
+    use_index = isinstance(docs, DocList)
+    plan = _plan(docs, indexed, query) if use_index and query else None
+    estimate = plan[0] if plan else n
+
+    if sort and limit and use_index and sort[0][0] in indexed and estimate * estimate > limit * n:
+        return _walk_sort_index(docs, query, sort, limit)
+
+    if plan:
+        candidates = (docs[p] for p in plan[1]())
+        matched = [d for d in candidates if _matches(d, query)]
+    else:
+        matched = _filter_docs(docs, query)
+    if sort:
+        key = _sort_key(sort)
+        return heapq.nsmallest(limit, matched, key=key) if limit else sorted(matched, key=key)
+    return matched[:limit] if limit else matched
+
+def _walk_sort_index(docs, query, sort, limit):
+    # Walk the leading sort field's index in order; ties on it are ordered by the full sort key
+    index = docs.field_index(sort[0][0])
+    key = _sort_key(sort)
+    keys, positions = index.keys, index.positions
+    out, seen = [], set()
+    i, step = (0, 1) if sort[0][1] == 1 else (len(keys) - 1, -1)
+    while 0 <= i < len(keys) and len(out) < limit:
+        j = i
+        while 0 <= j < len(keys) and keys[j] == keys[i]:
+            j += step
+        group = sorted(positions[i:j] if step == 1 else positions[j + 1:i + 1])
+        matched = []
+        for p in group:
+            if p not in seen:
+                seen.add(p)
+                if _matches(docs[p], query):
+                    matched.append(docs[p])
+        out.extend(sorted(matched, key=key))
+        i = j
+    return out[:limit]
+
+
+# ------------------- projection, aggregation ---------------------------
+def _project(doc, projection):
+    # Inclusion ({f: 1}) or exclusion ({f: 0}) projection on dotted paths; _id kept unless excluded
+    fields = {k: v for k, v in projection.items() if k != "_id"}
+    if fields and not any(fields.values()):
+        out = {k: v for k, v in doc.items() if projection.get("_id", 1) or k != "_id"}
+        for path in fields:
+            parts = path.split(".")
+            parent = out
+            for part in parts[:-1]:
+                if not isinstance(parent.get(part), dict):
+                    parent = None
+                    break
+                parent[part] = dict(parent[part])
+                parent = parent[part]
+            if parent is not None:
+                parent.pop(parts[-1], None)
+        return out
+    out = {}
+    if projection.get("_id", 1):
+        if "_id" in doc:
+            out["_id"] = doc["_id"]
+    for path, keep in fields.items():
+        if not keep:
+            continue
+        src, dst = doc, out
+        parts = path.split(".")
+        for part in parts[:-1]:
+            if not isinstance(src, dict) or not isinstance(src.get(part), dict):
+                src = None
+                break
+            src = src[part]
+            dst = dst.setdefault(part, {})
+        if isinstance(src, dict) and parts[-1] in src:
+            dst[parts[-1]] = src[parts[-1]]
+    return out
+
+def _eval_expr(doc, expr):
+    if expr == "$$ROOT":
+        return doc
+    if isinstance(expr, str) and expr.startswith("$"):
+        return _get_by_dotted(doc, expr[1:])
+    return expr
+
+def _group_key(value):
+    return bson.encode({"k": value}) if isinstance(value, dict | list) else value
+
+def _group(docs, spec):
+    # Streaming accumulators: one pass, one row of state per group
+    rows = {}
+    accumulators = [(name, *acc.popitem()) for name, acc in ((n, dict(a)) for n, a in spec.items() if n != "_id")]
+    for d in docs:
+        group_id = _eval_expr(d, spec["_id"])
+        key = _group_key(group_id)
+        row = rows.get(key)
+        if row is None:
+            row = rows[key] = {"_id": group_id}
+            for name, op, _ in accumulators:
+                row[name] = 0 if op == "$sum" else [0.0, 0] if op == "$avg" else _UNSET
+        for name, op, expr in accumulators:
+            value = _eval_expr(d, expr)
+            if op == "$first":
+                if row[name] is _UNSET:
+                    row[name] = value
+            elif op == "$last":
+                row[name] = value
+            elif op == "$sum":
+                if isinstance(value, int | float) and not isinstance(value, bool):
+                    row[name] += value
+            elif op in ("$min", "$max"):
+                if value is not None and (
+                    row[name] is _UNSET or (value < row[name] if op == "$min" else value > row[name])
+                ):
+                    row[name] = value
+            elif op == "$avg":
+                if isinstance(value, int | float) and not isinstance(value, bool):
+                    row[name][0] += value
+                    row[name][1] += 1
+            else:
+                raise NotImplementedError(op)
+    out = []
+    for row in rows.values():
+        for name, op, _ in accumulators:
+            if op == "$avg":
+                total, count = row[name]
+                row[name] = total / count if count else None
+            elif row[name] is _UNSET:
+                row[name] = None
+        out.append(row)
+    return out
+
+_UNSET = object()
+
+def _first_last_shape(stages):
+    # $sort [$project] $group whose accumulators are all $first/$last -> (sort, projection, group, stages used)
+    if len(stages) < 2 or stages[0][0] != "$sort":
+        return None
+    projection = stages[1][1] if stages[1][0] == "$project" else None
+    used = 3 if projection is not None else 2
+    if len(stages) < used or stages[used - 1][0] != "$group":
+        return None
+    group = stages[used - 1][1]
+    if not all(next(iter(acc)) in ("$first", "$last") for name, acc in group.items() if name != "_id"):
+        return None
+    return list(stages[0][1].items()), projection, group, used
+
+def _first_last_rows(winners, group, projection):
+    out = []
+    for group_id, first, last in sorted(winners.values(), key=lambda e: (e[1][0], e[1][1])):
+        row = {"_id": group_id}
+        for name, acc in group.items():
+            if name == "_id":
+                continue
+            (op, expr), = acc.items()
+            doc = first[2] if op == "$first" else last[2]
+            if projection is not None:
+                doc = _project(doc, projection)
+            row[name] = _eval_expr(doc, expr)
+        out.append(row)
+    return out
+
+def _sorted_first_last(docs, sort, group):
+    # One pass keeping each group's first and last document in sort order
+    key = _sort_key(sort)
+    winners = {}
+    for pos, d in enumerate(docs):
+        k = key(d)
+        group_id = _eval_expr(d, group["_id"])
+        gk = _group_key(group_id)
+        entry = winners.get(gk)
+        if entry is None:
+            winners[gk] = [group_id, (k, pos, d), (k, pos, d)]
+        else:
+            if k < entry[1][0]:
+                entry[1] = (k, pos, d)
+            if not k < entry[2][0]:
+                entry[2] = (k, pos, d)
+    return winners
+
+def _first_per_group_walk(docs, match, sort, group, indexed):
+    """Like a DISTINCT_SCAN: for [$match] {G: 1, T: ±1} + {_id: "$G", $first} on a collection,
+    walk T's index from its winning end until every candidate G has its first document."""
+    if not isinstance(docs, DocList) or len(sort) != 2 or group["_id"] != f"${sort[0][0]}":
+        return None
+    if any(next(iter(acc)) != "$first" for name, acc in group.items() if name != "_id"):
+        return None
+    (g_field, _), (t_field, t_dir) = sort
+    if g_field not in indexed or t_field not in indexed:
+        return None
+    g_index, t_index = docs.field_index(g_field), docs.field_index(t_field)
+    if g_index.multikey or t_index.multikey:
+        return None
+    candidates = None
+    if match:
+        plan = _plan(docs, indexed, match)
+        if plan is None:
+            return None
+        candidates = set(plan[1]())
+        remaining = len({_group_key(_get_by_dotted(docs[p], g_field)) for p in candidates})
+    else:
+        remaining, i = 0, 0
+        while i < len(g_index.keys):
+            remaining += 1
+            i = bisect_right(g_index.keys, g_index.keys[i], i)
+    key = _sort_key(sort)
+    keys, positions = t_index.keys, t_index.positions
+    winners = {}
+    i, step = (0, 1) if t_dir == 1 else (len(keys) - 1, -1)
+    while 0 <= i < len(keys) and len(winners) < remaining:
+        j = i
+        while 0 <= j < len(keys) and keys[j] == keys[i]:
+            j += step
+        for pos in sorted(positions[i:j] if step == 1 else positions[j + 1:i + 1]):
+            if candidates is not None and (pos not in candidates or not _matches(docs[pos], match)):
+                continue
+            d = docs[pos]
+            group_id = _get_by_dotted(d, g_field)
+            gk = _group_key(group_id)
+            if gk not in winners:
+                winners[gk] = [group_id, (key(d), pos, d), None]
+        i = j
+    return winners
+
+def _covered(docs, stages, indexed):
+    """Answer leading stages from single-field indexes alone (a COUNT_SCAN / DISTINCT_SCAN):
+    [$match F] $count, [$match F] $group {_id: "$F"}, $group {_id: null, $min/$max: "$F"}.
+    Returns (rows, stages consumed) or None."""
+    if not isinstance(docs, DocList):
+        return None
+    match = None
+    if stages and stages[0][0] == "$match" and len(stages[0][1]) == 1:
+        match = next(iter(stages[0][1].items()))
+    rest = stages[1:] if match else stages
+    if not rest:
+        return None
+    op, spec = rest[0]
+    if match and op == "$count" and match[0] in indexed:
+        field, cond = match
+        index = docs.field_index(field)
+        exact = not isinstance(cond, dict | list) or set(cond) <= {"$eq", "$gt", "$gte", "$lt", "$lte"}
+        spans = index.spans(cond) if exact and not index.multikey else None
+        if spans is None:
+            return None
+        n = sum(hi - lo for lo, hi in spans)
+        return ([{spec: n}] if n else []), 2
+    if op != "$group" or not isinstance(spec["_id"], str | type(None)):
+        return None
+    if spec["_id"] is None and not match:
+        fields = {name: next(iter(acc.items())) for name, acc in spec.items() if name != "_id"}
+        if not fields or not all(
+            acc in ("$min", "$max") and isinstance(expr, str) and expr[1:] in indexed for acc, expr in fields.values()
+        ):
+            return None
+        if not docs:
+            return [], 1
+        row = {"_id": None}
+        for name, (acc, expr) in fields.items():
+            index = docs.field_index(expr[1:])
+            if index.multikey:
+                return None
+            lo = bisect_left(index.keys, (2,))  # $min/$max ignore null and missing
+            i = lo if acc == "$min" else len(index.keys) - 1
+            row[name] = _get_by_dotted(docs[index.positions[i]], expr[1:]) if lo < len(index.keys) else None
+        return [row], 1
+    field = spec["_id"][1:] if isinstance(spec["_id"], str) and spec["_id"].startswith("$") else None
+    if field is None or len(spec) != 1 or field not in indexed or (match and match[0] != field):
+        return None
+    index = docs.field_index(field)
+    if index.multikey:
+        return None
+    rows, i = [], 0
+    while i < len(index.keys):
+        value = _get_by_dotted(docs[index.positions[i]], field)
+        if not match or _match_field(value, match[1]):
+            rows.append({"_id": value})
+        i = bisect_right(index.keys, index.keys[i], i)
+    return rows, (2 if match else 1)
+
+def _run_pipeline(docs, pipeline, indexed=()):
+    stages = [next(iter(stage.items())) for stage in pipeline]
+    covered = _covered(docs, stages, indexed)
+    if covered is None:
+        match = stages[0][1] if stages and stages[0][0] == "$match" else None
+        shape = _first_last_shape(stages[1:] if match else stages)
+        if shape:
+            sort, projection, group, used = shape
+            winners = _first_per_group_walk(docs, match, sort, group, indexed)
+            if winners is not None:
+                covered = _first_last_rows(winners, group, projection), used + (1 if match else 0)
+    if covered is not None:
+        return _run_pipeline(covered[0], [dict([stage]) for stage in stages[covered[1]:]])
+
+    i = 0
+    if stages and stages[0][0] == "$match":
+        docs = _select(docs, indexed, stages[0][1])
+        i = 1
+    whole = i == 0
+    while i < len(stages):
+        op, spec = stages[i]
+        if op == "$sort":
+            sort = list(spec.items())
+            if i + 1 < len(stages) and stages[i + 1][0] == "$limit":
+                docs = heapq.nsmallest(stages[i + 1][1], docs, key=_sort_key(sort))
+                i += 2
+                continue
+            shape = _first_last_shape(stages[i:])
+            if shape:
+                sort, projection, group, used = shape
+                docs = _first_last_rows(_sorted_first_last(docs, sort, group), group, projection)
+                i += used
+                continue
+            docs = sorted(docs, key=_sort_key(sort))
+        elif op == "$match":
+            docs = _filter_docs(docs, spec)
+        elif op == "$group":
+            docs = _group(docs, spec)
+        elif op == "$project":
+            docs = [_project(d, spec) for d in docs]
+        elif op == "$replaceRoot":
+            docs = [_eval_expr(d, spec["newRoot"]) for d in docs]
+        elif op == "$limit":
+            docs = docs[:spec]
+        elif op == "$count":
+            docs = [{spec: len(docs)}] if docs else []
+        elif op == "$facet":
+            # On the whole collection, sub-pipelines may use its indexes
+            docs = [{name: _run_pipeline(docs, sub, indexed if whole else ()) for name, sub in spec.items()}]
+        else:
+            raise NotImplementedError(op)
+        whole = False
+        i += 1
+    return docs
+
+
+# ------------------- cursors, collection, database ---------------------
+def _constrained_fields(query):
+    # field -> condition for the top-level fields and those of top-level $and clauses
+    fields = {}
+    for key, cond in query.items():
+        if key == "$and":
+            for clause in cond:
+                fields.update((k, v) for k, v in _constrained_fields(clause).items() if k not in fields)
+        elif not key.startswith("$"):
+            fields.setdefault(key, cond)
+    return fields
 
 class FakeCursor:
-    def __init__(self, docs):
+    def __init__(self, docs, query=None, indexes=None, projection=None, indexed=()):
         self._docs = docs
         self._sort = None
+        self._sort_spec = None
         self._limit = None
+        self._query = query or {}
+        self._indexes = indexes or []
+        self._projection = projection
+        self._indexed = indexed
+        self._batch_size = None
 
-    def sort(self, field, direction):
-        reverse = direction == -1
-        def getter(d):
-            return _get_by_dotted(d, field)
-        self._docs.sort(key=lambda d: getter(d), reverse=reverse)
+    def sort(self, field, direction=None):
+        self._sort_spec = _sort_spec(field, direction)
+        self._sort = self._sort_spec[0][0]
         return self
 
+    async def explain(self):
+        # Pretend the planner uses an index whose leading key is a filter field.
+        # Failing that, like mongod, it prefers walking an index that provides
+        # the sort order over COLLSCAN + SORT: bounds come from the filter when
+        # it constrains the sort field, else the whole index is walked and the
+        # filter applied at FETCH. A top-level $or whose branches each lead an
+        # index becomes an OR of index scans. Anything else is a collection scan.
+        constrained = _constrained_fields(self._query)
+        index = self._leading_index(constrained)
+        branches = [_constrained_fields(b) for b in self._query.get("$or", ())] if index is None else []
+        or_indexes = [self._leading_index(b) for b in branches]
+        if index is None and self._sort and not (or_indexes and all(or_indexes)):
+            index = next((keys for keys in self._indexes if keys[0][0] == self._sort), None)
+        if index is not None:
+            ixscan = self._ixscan(index, constrained)
+            stage = {"stage": "FETCH", "inputStage": ixscan}
+            if set(constrained) - set(ixscan["indexBounds"]):
+                stage["filter"] = self._query
+            if self._sort and self._sort not in dict(index):
+                stage = {"stage": "SORT", "inputStage": stage}
+        elif or_indexes and all(or_indexes):
+            scans = [self._ixscan(keys, branch) for keys, branch in zip(or_indexes, branches, strict=True)]
+            stage = {"stage": "FETCH", "filter": self._query, "inputStage": {"stage": "OR", "inputStages": scans}}
+            if self._sort:
+                stage = {"stage": "SORT", "inputStage": stage}
+        else:
+            stage = {"stage": "COLLSCAN"}
+            if self._query:
+                stage["filter"] = self._query
+            if self._sort:
+                stage = {"stage": "SORT", "inputStage": stage}
+        return {"queryPlanner": {"winningPlan": {"stage": "LIMIT", "inputStage": stage}}}
+
+    def _leading_index(self, constrained):
+        return next((keys for f in constrained for keys in self._indexes if keys[0][0] == f), None)
+
+    def _ixscan(self, index, constrained):
+        full = "[MinKey, MaxKey]" if dict(self._sort_spec or ()).get(index[0][0], 1) == 1 else "[MaxKey, MinKey]"
+        return {
+            "stage": "IXSCAN", "keyPattern": dict(index),
+            "indexBounds": {f: [f"[{constrained[f]!r}]" if f in constrained else full] for f, _ in index},
+            "indexName": "_".join(f"{f}_{d}" for f, d in index),
+        }
+
     def limit(self, n):
         self._limit = n
         return self
 
-    async def to_list(self, length):
-        docs = self._docs[: self._limit or length]
+    def batch_size(self, n):
+        self._batch_size = n or None
+        return self
+
+    def max_time_ms(self, ms):
+        return self
+
+    def _selected(self, length=None):
+        limit = min(filter(None, (self._limit, length)), default=None)
+        return _select(self._docs, self._indexed, self._query, self._sort_spec, limit)
+
+    def _results(self, length=None):
+        docs = self._selected(length)
+        if self._projection:
+            docs = [_project(d, self._projection) for d in docs]
         return docs
 
+    async def to_list(self, length):
+        return self._results(length)
+
+    def __aiter__(self):
+        return self._aiter()
+
+    async def _aiter(self):
+        # projected one at a time, like documents arriving batch by batch
+        for d in self._selected():
+            yield _project(d, self._projection) if self._projection else d
+
+class FakeRawBatchCursor:
+    """find_raw_batches(): the same documents as BSON bytes, in batch_size batches (default one)."""
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def sort(self, field, direction=None):
+        self._cursor.sort(field, direction)
+        return self
+
+    def limit(self, n):
+        self._cursor.limit(n)
+        return self
+
+    def max_time_ms(self, ms):
+        return self
+
+    def batch_size(self, n):
+        self._cursor.batch_size(n)
+        return self
+
+    def __aiter__(self):
+        return self._aiter()
+
+    async def _aiter(self):
+        docs = self._cursor._selected()
+        step = self._cursor._batch_size or max(len(docs), 1)
+        projection = self._cursor._projection
+        for i in range(0, len(docs), step):
+            yield b"".join(bson.encode(_project(d, projection) if projection else d) for d in docs[i:i + step])
+
+class FakeChangeStream:
+    """watch() on a replica set: insert/replace events, passed through the pipeline."""
+    def __init__(self, streams, pipeline):
+        self._streams = streams
+        self._pipeline = pipeline or []
+        self._queue = asyncio.Queue()
+
+    async def __aenter__(self):
+        self._streams.append(self)
+        return self
+
+    async def __aexit__(self, *exc):
+        self._streams.remove(self)
+        return False
+
+    def publish(self, event):
+        for out in _run_pipeline([event], self._pipeline):
+            self._queue.put_nowait(out)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self._queue.get()
+
 class FakeCollection:
     def __init__(self):
-        self._docs = []
+        self._docs = DocList()
+        self._indexes = []
+        self._streams = None  # open change streams; None on a standalone server
+
+    def _publish(self, operation, doc):
+        for stream in self._streams or ():
+            stream.publish({"_id": {"_data": str(ObjectId())}, "operationType": operation, "fullDocument": dict(doc)})
+
+    @property
+    def _indexed(self):
+        # Every field of a declared index gets its own sorted index; _id always has one
+        return {"_id"} | {field for keys in self._indexes for field, _ in keys}
 
     def extend(self, docs):
         self._docs.extend(docs)
@@ -38,84 +876,158 @@ class FakeCollection:
             vals.add(v)
         return list(vals)
 
+    async def find_one(self, query):
+        found = _select(self._docs, self._indexed, query, limit=1)
+        return found[0] if found else None
+
+    async def insert_one(self, doc):
+        self._docs.append(doc)
+        self._publish("insert", doc)
+
+    async def replace_one(self, query, doc, upsert=False):
+        found = _select(self._docs, self._indexed, query, limit=1)
+        if found:
+            found[0].clear()
+            found[0].update({**query, **doc})
+            self._changed()
+            self._publish("replace", found[0])
+        elif upsert:
+            self._docs.append({**query, **doc})
+            self._publish("insert", self._docs[-1])
+
+    async def estimated_document_count(self):
+        return len(self._docs)
+
     async def count_documents(self, query):
-        return len(_filter_docs(self._docs, query))
+        return len(_select(self._docs, self._indexed, query))
 
     def find(self, query, projection=None):
-        filtered = _filter_docs(self._docs, query)
-        # projection is ignored (not needed for tests)
-        return FakeCursor(filtered)
+        return FakeCursor(self._docs, query, self._indexes, projection, self._indexed)
 
-def _get_by_dotted(doc, dotted):
-    cur = doc
-    for part in dotted.split("."):
-        if cur is None:
-            return None
-        cur = cur.get(part) if isinstance(cur, dict) else None
-    return cur
+    def find_raw_batches(self, query, projection=None):
+        return FakeRawBatchCursor(self.find(query, projection))
 
-def _matches_regex(value, regex, options=None):
-    if value is None:
-        return False
-    flags = re.I if (options and "i" in options) else 0
-    return re.search(regex, str(value), flags) is not None
+    def aggregate(self, pipeline, **kwargs):
+        return FakeCursor(_run_pipeline(self._docs, pipeline, self._indexed))
 
-def _compare(op, value, comp):
-    try:
-        # try datetime compare first
-        if isinstance(value, datetime) or isinstance(comp, datetime):
-            return (value >= comp) if op == "$gte" else (value <= comp)
-        # else numeric if possible
-        v1 = float(value)
-        v2 = float(comp)
-        return (v1 >= v2) if op == "$gte" else (v1 <= v2)
-    except Exception:
-        # fallback to string lexicographic
-        v1 = str(value)
-        v2 = str(comp)
-        return (v1 >= v2) if op == "$gte" else (v1 <= v2)
+    async def explain_aggregate(self, pipeline):
+        # [$match F] $sort {G, T} $group {_id: "$G", all $first} with an index led by (G, T),
+        # in either direction, is a DISTINCT_SCAN; anything else plans as find(F).sort(...).
+        stages = [next(iter(stage.items())) for stage in pipeline]
+        match = stages[0][1] if stages and stages[0][0] == "$match" else {}
+        rest = stages[1:] if stages and stages[0][0] == "$match" else stages
+        shape = _first_last_shape(rest)
+        plan = None
+        if shape and shape[1] is None and shape[2]["_id"] == f"${shape[0][0][0]}":
+            sort, group = shape[0], shape[2]
+            flipped = [(f, -d) for f, d in sort]
+            index = next((keys for keys in self._indexes if keys[:len(sort)] in (sort, flipped)), None)
+            if index is not None and all(next(iter(acc)) == "$first" for name, acc in group.items() if name != "_id"):
+                scan = self.find(match).sort(sort)._ixscan(index, _constrained_fields(match))
+                plan = {"stage": "FETCH", "inputStage": {**scan, "stage": "DISTINCT_SCAN"}}
+        if plan is None:
+            cursor = self.find(match)
+            if rest and rest[0][0] == "$sort":
+                cursor.sort(list(rest[0][1].items()))
+            plan = (await cursor.explain())["queryPlanner"]["winningPlan"]["inputStage"]
+        return {"stages": [{"$cursor": {"queryPlanner": {"winningPlan": plan}}}, *pipeline[len(stages) - len(rest):]]}
 
-def _match_field(value, cond):
-    if isinstance(cond, dict):
-        for k, v in cond.items():
-            if k == "$regex":
-                if not _matches_regex(value, v, cond.get("$options")):
-                    return False
-            elif k == "$options":
-                # ignore options key; handled within $regex
-                continue
-            elif k in ("$gte", "$lte"):
-                if not _compare(k, value, v):
-                    return False
-            else:
-                # unsupported operator -> fail strict
-                return False
-        return True
-    else:
-        return value == cond
+    def watch(self, pipeline=None, **kwargs):
+        if self._streams is None:
+            # Like a standalone mongod: change streams need a replica set
+            raise RuntimeError("The $changeStream stage is only supported on replica sets")
+        return FakeChangeStream(self._streams, pipeline)
 
+    async def create_index(self, keys, **kwargs):
+        self._indexes.append(list(keys))
+        return "_".join(f"{k}_{d}" for k, d in keys)
 
-def _filter_docs(docs, query):
-    def match(doc, q):
-        for k, cond in q.items():
-            v = _get_by_dotted(doc, k)
-            if not _match_field(v, cond):
-                return False
-        return True
-    return [d for d in docs if match(d, query)]
+    async def create_indexes(self, models):
+        return [await self.create_index(list(m.document["key"].items())) for m in models]
+
+    def _changed(self):
+        if isinstance(self._docs, DocList):
+            self._docs.changed()
+
+    async def bulk_write(self, ops, ordered=True):
+        # UpdateOne with $set/$inc/$min/$max/$setOnInsert, or ReplaceOne; optionally upserting.
+        # Filters on _id alone go through one dict built for the whole batch.
+        by_id = None
+        for op in ops:
+            if set(op._filter) == {"_id"} and not isinstance(op._filter["_id"], dict):
+                if by_id is None:
+                    by_id = {d.get("_id"): d for d in self._docs}
+                found = [by_id[op._filter["_id"]]] if op._filter["_id"] in by_id else []
+            else:
+                found = _filter_docs(self._docs, op._filter)[:1]
+            if isinstance(op, ReplaceOne):
+                # like mongod, a replacement keeps the _id, and an upsert takes the filter's
+                doc = dict(op._doc)
+                if found:
+                    doc = {"_id": found[0].get("_id"), **doc}
+                    found[0].clear()
+                    found[0].update(doc)
+                elif op._upsert:
+                    doc = {**op._filter, **doc}
+                    list.append(self._docs, doc)
+                    if by_id is not None:
+                        by_id[doc.get("_id")] = doc
+                continue
+            if not found and op._upsert:
+                doc = dict(op._filter)
+                for k, v in op._doc.get("$setOnInsert", {}).items():
+                    _set_by_dotted(doc, k, v)
+                list.append(self._docs, doc)
+                if by_id is not None:
+                    by_id[doc.get("_id")] = doc
+                found = [doc]
+            for d in found:
+                for k, v in op._doc.get("$set", {}).items():
+                    _set_by_dotted(d, k, v)
+                for k, v in op._doc.get("$inc", {}).items():
+                    _set_by_dotted(d, k, (_get_by_dotted(d, k) or 0) + v)
+                for k, v in op._doc.get("$min", {}).items():
+                    cur = _get_by_dotted(d, k)
+                    _set_by_dotted(d, k, v if cur is None else min(cur, v))
+                for k, v in op._doc.get("$max", {}).items():
+                    cur = _get_by_dotted(d, k)
+                    _set_by_dotted(d, k, v if cur is None else max(cur, v))
+        self._changed()
+        return len(ops)
 
 class FakeDB:
     def __init__(self):
-        self.collections = {"metar_data": []}
+        self.collections = {"metar_data": DocList()}
+        self.indexes = {}
+        self.commands = []
+        self.replica_set = False
+        self.streams = {}
+        self.explains = []
+    async def command(self, name, value=1, **kwargs):
+        self.commands.append(name)
+        if name == "explain":
+            # {"find": coll, "filter", "sort", "limit"} or {"aggregate": coll, "pipeline"}; only the planner is modelled
+            self.explains.append((value, kwargs))
+            if "aggregate" in value:
+                return {**await self[value["aggregate"]].explain_aggregate(value["pipeline"]), "ok": 1.0}
+            cursor = self[value["find"]].find(value.get("filter") or {})
+            if value.get("sort"):
+                cursor.sort(list(value["sort"].items()))
+            return {**await cursor.limit(value.get("limit")).explain(), "ok": 1.0}
+        return {"ok": 1.0}
     def __getitem__(self, name):
-        if name not in self.collections:
-            self.collections[name] = []
+        if not isinstance(self.collections.get(name), DocList):
+            self.collections[name] = DocList(self.collections.get(name, []))
         # Return a collection-like wrapper
         fc = FakeCollection()
         # bind to the same list
         fc._docs = self.collections[name]
+        fc._indexes = self.indexes.setdefault(name, [])
+        fc._streams = self.streams.setdefault(name, []) if self.replica_set else None
         return fc
 
 class FakeMongoClient:
     def __repr__(self):
         return "<FakeMongoClient>"
+    def close(self):
+        pass
@@ -20,14 +20,37 @@ def _make_request(scope_overrides=None):
         scope.update(scope_overrides)
     return Request(scope, receive=lambda: None)
 
-async def test_health_route_direct_call():
+async def test_health_route_direct_call(fake_db, monkeypatch):
     req = _make_request()
     resp = await srv.health_check_route(req)
     assert resp.status_code == 200
+    assert json.loads(resp.body.decode()) == {"status": "healthy", "version": srv.SERVER_VERSION}
+    assert fake_db.commands == ["ping"]
+
+    # details are for authenticated callers only
+    _, token = _use_verifier(monkeypatch)
+    resp = await srv.health_check_route(_authorized_request("/health", token=token))
     body = json.loads(resp.body.decode())
     assert body["status"] == "healthy"
     assert body["server"] == "metar-weather-mcp"
-    assert "azure_config" in body
+    assert "azure_config" in body and "result_cache" in body
+    assert body["mongodb"]["error"] is None
+    assert body["mongodb"]["ping_ms"] >= 0
+    assert json.loads((await srv.health_check_route(_authorized_request("/health", token=token + "x"))).body) == {
+        "status": "healthy", "version": srv.SERVER_VERSION,
+    }
+
+async def test_health_route_reports_unreachable_mongo(fake_db, monkeypatch):
+    async def _down(name, **kwargs):
+        raise RuntimeError("No servers found yet")
+    monkeypatch.setattr(fake_db, "command", _down)
+    resp = await srv.health_check_route(_make_request())
+    assert resp.status_code == 503
+    assert json.loads(resp.body.decode()) == {"status": "unhealthy", "version": srv.SERVER_VERSION}
+
+    _, token = _use_verifier(monkeypatch)
+    body = json.loads((await srv.health_check_route(_authorized_request("/health", token=token))).body.decode())
+    assert "No servers found" in body["mongodb"]["error"]
 
 async def test_auth_token_success(fake_httpx_client):
     # POST /auth/token
@@ -90,3 +113,217 @@ async def test_auth_token_azure_non_200(monkeypatch):
     assert resp.status_code == 401
     assert body["error"] == "azure_token_error"
     assert "AADSTS" in body["azure_body"]
+
+@pytest.fixture()
+def fake_token_endpoint(monkeypatch):
+    """A local Azure AD token endpoint (httpx MockTransport) that counts its calls."""
+    import asyncio
+
+    import httpx
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        await asyncio.sleep(0.01)  # keep the fetch in flight while other requests arrive
+        return httpx.Response(200, json={"access_token": f"token-{len(calls)}", "expires_in": 3600, "token_type": "Bearer"})
+
+    real_client = httpx.AsyncClient
+    monkeypatch.setattr(srv.httpx, "AsyncClient", lambda timeout=None: real_client(transport=httpx.MockTransport(handler), timeout=timeout))
+    return calls
+
+@pytest.mark.asyncio
+async def test_auth_token_single_upstream_call_per_lifetime(fake_token_endpoint, monkeypatch):
+    import asyncio
+    import time
+    now = [time.time()]
+    monkeypatch.setattr(srv.time, "time", lambda: now[0])
+    req = Request({"type":"http","http_version":"1.1","method":"POST","path":"/auth/token","headers":[],"query_string":b""}, receive=lambda: None)
+
+    responses = await asyncio.gather(*(srv.issue_token(req) for _ in range(1000)))
+    assert len(fake_token_endpoint) == 1
+    assert {json.loads(r.body.decode())["access_token"] for r in responses} == {"token-1"}
+    assert srv.token_cache.stats()["coalesced"] == 999
+
+    # still cached until the refresh margin before expiry, with the remaining lifetime reported
+    now[0] += 3600 - srv.TOKEN_REFRESH_MARGIN_SECONDS - 1
+    body = json.loads((await srv.issue_token(req)).body.decode())
+    assert body["access_token"] == "token-1" and body["expires_in"] == srv.TOKEN_REFRESH_MARGIN_SECONDS + 1
+
+    now[0] += 2
+    responses = await asyncio.gather(*(srv.issue_token(req) for _ in range(1000)))
+    assert len(fake_token_endpoint) == 2
+    assert {json.loads(r.body.decode())["access_token"] for r in responses} == {"token-2"}
+    await srv.token_cache.close()
+
+def _signing_key():
+    """An RSA key and the PEM of its public half, as JWTVerifier(public_key=...) takes it."""
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.public_key().public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
+    return key, pem.decode()
+
+def _bearer(key, exp_in=3600, sub="orchestrator"):
+    import time
+
+    import jwt as pyjwt
+    claims = {"sub": sub, "iss": srv.ISSUER, "aud": srv.AUDIENCE, "exp": int(time.time()) + exp_in}
+    return pyjwt.encode(claims, key, algorithm="RS256")
+
+@pytest.mark.asyncio
+async def test_verified_token_cache_skips_signature_check(monkeypatch):
+    key, pem = _signing_key()
+    verifier = srv.CachingJWTVerifier(public_key=pem, issuer=srv.ISSUER, audience=srv.AUDIENCE, max_entries=2)
+    verifications = []
+    real_load = srv.JWTVerifier.load_access_token
+    async def _counting_load(self, token):
+        verifications.append(token)
+        return await real_load(self, token)
+    monkeypatch.setattr(srv.JWTVerifier, "load_access_token", _counting_load)
+
+    token = _bearer(key)
+    first = await verifier.load_access_token(token)
+    assert first.client_id == "orchestrator"
+    assert await verifier.load_access_token(token) is first
+    assert await verifier.verify_token(token) is first  # the middleware's entry point shares the cache
+    assert len(verifications) == 1
+    assert await verifier.load_access_token(token + "x") is None
+    assert verifier.stats()["rejected"] == 1
+
+    # bounded: the least recently used token is evicted
+    for sub in ("a", "b"):
+        await verifier.load_access_token(_bearer(key, sub=sub))
+    assert verifier.stats()["entries"] == 2
+    await verifier.load_access_token(token)
+    assert len(verifications) == 5
+
+    # cached entries end at the token's exp, after which it is verified again
+    expiring = _bearer(key, exp_in=60, sub="short")
+    await verifier.load_access_token(expiring)
+    await verifier.load_access_token(expiring)
+    assert len(verifications) == 6
+    now = srv.time.time()
+    monkeypatch.setattr(srv.time, "time", lambda: now + 61)
+    await verifier.load_access_token(expiring)
+    assert len(verifications) == 7
+    assert verifier.stats()["hits"] == 3
+
+@pytest.mark.asyncio
+async def test_metrics_route_exports_tool_mongo_and_cache_metrics(fake_db, sample_docs, monkeypatch):
+    await srv.search_metar_data(station_icao="VOTP")
+    await srv.search_metar_data(station_icao="VOTP")
+    await srv.raw_mongodb_query("{not json")
+    monkeypatch.setattr(srv, "load_metar_statistics", lambda: (_ for _ in ()).throw(RuntimeError("boom")))
+    assert (await srv.get_metar_statistics()).startswith("Error retrieving statistics")
+    srv.mongo_command_metrics.succeeded(types.SimpleNamespace(command_name="find", duration_micros=1800))
+    srv.mongo_command_metrics.failed(types.SimpleNamespace(command_name="aggregate", duration_micros=5_000_000))
+
+    resp = await srv.metrics_route(_make_request({"path": "/metrics"}))
+    assert resp.status_code == 200
+    assert resp.media_type.startswith("text/plain; version=0.0.4")
+    lines = resp.body.decode().splitlines()
+    assert 'metar_tool_calls_total{tool="search_metar_data"} 2' in lines
+    assert 'metar_tool_errors_total{tool="search_metar_data"} 0' in lines
+    assert 'metar_tool_errors_total{tool="get_metar_statistics"} 1' in lines
+    assert 'metar_tool_in_flight{tool="search_metar_data"} 0' in lines
+    assert 'metar_tool_latency_seconds_count{tool="search_metar_data"} 2' in lines
+    assert 'metar_tool_latency_seconds_bucket{tool="search_metar_data",le="+Inf"} 2' in lines
+    assert 'metar_tool_result_bytes_count{tool="raw_mongodb_query"} 1' in lines
+    assert 'metar_mongo_command_seconds_bucket{command="find",le="0.001"} 0' in lines
+    assert 'metar_mongo_command_seconds_bucket{command="find",le="0.0025"} 1' in lines
+    assert 'metar_mongo_command_failures_total{command="aggregate"} 1' in lines
+    assert 'metar_cache_hits_total{cache="result"} 1' in lines
+    assert 'metar_cache_hit_ratio{cache="result"} 0.3333' in lines
+    assert "# TYPE metar_tool_latency_seconds histogram" in lines
+
+def _use_verifier(monkeypatch):
+    """Swap srv.auth for a verifier trusting a fresh key; returns (verifier, valid bearer token)."""
+    key, pem = _signing_key()
+    verifier = srv.CachingJWTVerifier(public_key=pem, issuer=srv.ISSUER, audience=srv.AUDIENCE)
+    monkeypatch.setattr(srv, "auth", verifier)
+    return verifier, _bearer(key)
+
+def _authorized_request(path, query=b"", token=None):
+    headers = [(b"authorization", f"Bearer {token}".encode())] if token else []
+    return _make_request({"path": path, "query_string": query, "headers": headers})
+
+async def test_sync_route_requires_bearer_and_pages_by_mark(fake_db, sample_docs, monkeypatch):
+    from bson import json_util
+    verifier, token = _use_verifier(monkeypatch)
+
+    def sync_request(query=b"", token=None):
+        return _authorized_request("/sync/metar", query, token)
+
+    for bad in (None, "not-a-jwt"):
+        resp = await srv.sync_metar_route(sync_request(token=bad))
+        assert resp.status_code == 401 and resp.headers["www-authenticate"] == "Bearer"
+
+    ids, mark, pages = [], "", 0
+    while True:
+        resp = await srv.sync_metar_route(sync_request(f"batch_size=1&mark={mark}".encode(), token))
+        assert resp.status_code == 200 and resp.media_type == "application/json"
+        body = json_util.loads(resp.body)
+        ids += [doc["_id"] for doc in body["documents"]]
+        mark, pages = body["mark"], pages + 1
+        if not body["has_more"]:
+            break
+    assert sorted(ids) == sorted(doc["_id"] for doc in sample_docs) and pages == len(sample_docs)
+
+    resp = await srv.sync_metar_route(sync_request(f"mark={mark}".encode(), token))
+    assert json_util.loads(resp.body) == {"documents": [], "count": 0, "mark": mark, "has_more": False}
+    resp = await srv.sync_metar_route(sync_request(b"mark=%%%", token))
+    assert resp.status_code == 400
+
+async def _export(query, token):
+    resp = await srv.export_metar_route(_authorized_request("/export/metar", query, token))
+    if resp.status_code != 200:
+        return resp, None
+    return resp, [chunk async for chunk in resp.body_iterator]
+
+@pytest.fixture()
+def year_end_docs(fake_db):
+    from benchmarks.synthetic_metar import generate_documents, load_fake
+
+    from .fixtures_sample_data import NOW
+    load_fake(fake_db, generate_documents(500, end=NOW, seed=3))
+    return list(fake_db["metar_data"]._docs)
+
+async def test_export_route_streams_ndjson_one_chunk_per_batch(fake_db, year_end_docs, monkeypatch):
+    from bson import json_util
+    verifier, token = _use_verifier(monkeypatch)
+    resp, _ = await _export(b"start=2025-11-01", None)
+    assert resp.status_code == 401
+    for query in (b"", b"start=yesterday", b"start=2025-11-01&format=csv"):
+        resp, _ = await _export(query, token)
+        assert resp.status_code == 400
+
+    resp, chunks = await _export(b"start=2025-11-01T00:00Z&end=2025-11-10T10:30Z&batch_size=64", token)
+    assert resp.media_type == "application/x-ndjson"
+    assert resp.headers["content-disposition"] == 'attachment; filename="metar_20251101T0000_20251110T1030.ndjson"'
+    assert len(chunks) == -(-len(year_end_docs) // 64)
+    rows = [json_util.loads(line) for chunk in chunks for line in chunk.decode().splitlines()]
+    assert sorted(r["_id"] for r in rows) == sorted(d["_id"] for d in year_end_docs)
+    assert [r["timestamp"] for r in rows] == sorted(d["timestamp"].replace(tzinfo=None) for d in year_end_docs)
+    assert "numericObservation" in rows[0] and "metarGroups" not in rows[0]
+    assert srv.transfer_stats.stats()["export_metar_route"]["documents"] == len(year_end_docs)
+
+    resp, chunks = await _export(b"start=2025-11-10T08:00Z&stations=vidp,VABB&full=true", token)
+    rows = [json_util.loads(line) for line in b"".join(chunks).decode().splitlines()]
+    assert {r["stationICAO"] for r in rows} == {"VIDP", "VABB"} and all("metarGroups" in r for r in rows)
+    assert len(rows) == sum(1 for d in year_end_docs if d["stationICAO"] in ("VIDP", "VABB") and d["timestamp"] >= srv.datetime(2025, 11, 10, 8))
+
+async def test_export_route_parquet_has_typed_observation_columns(fake_db, year_end_docs, monkeypatch):
+    import io
+    pq = pytest.importorskip("pyarrow.parquet")
+    verifier, token = _use_verifier(monkeypatch)
+    resp, chunks = await _export(b"start=2025-11-01&end=2025-11-10T10:30&format=parquet&batch_size=200", token)
+    assert resp.media_type == "application/vnd.apache.parquet"
+    parquet = pq.ParquetFile(io.BytesIO(b"".join(chunks)))
+    assert parquet.metadata.num_rows == len(year_end_docs) and parquet.metadata.num_row_groups == 3
+    table = parquet.read()
+    assert str(table.schema.field("airTemperature").type) == "double"
+    first = min(year_end_docs, key=lambda d: (d["timestamp"], d["_id"]))
+    row = table.slice(0, 1).to_pylist()[0]
+    assert row["stationICAO"] == first["stationICAO"] and row["metar"] == first["metar"]["rawData"]
+    assert row["airTemperature"] == first["numericObservation"]["airTemperature"]
+    assert row["cloudLayers"] == first["metar"]["decodedData"]["observation"]["cloudLayers"]
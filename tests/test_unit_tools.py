@@ -1,4 +1,8 @@
 # tests/test_unit_tools.py
+import asyncio
+import json
+import types
+
 import app.metar_mcp_server as srv
 import pytest
 
@@ -123,3 +127,830 @@ async def test_statistics_empty_db(fake_db):
     # should show zeros and not crash on earliest/latest
     assert "METAR Reports: 0" in out
     assert "Earliest:" not in out and "Latest:" not in out
+
+
+async def test_parse_observation_number_variants():
+    assert srv.parse_observation_number("30") == 30.0
+    assert srv.parse_observation_number("M02") == -2.0
+    assert srv.parse_observation_number("CAVOK") == srv.CAVOK_VISIBILITY_M
+    assert srv.parse_observation_number("VRB") is None
+    assert srv.parse_observation_number(None) is None
+
+# "30" < "5.0" as strings; numeric shadow fields must still match VOTP and VOBG
+async def test_search_temp_min_is_numeric(fake_db, sample_docs):
+    out = await srv.search_metar_data(temperature_min=5, limit=10)
+    assert "VOTP" in out and "VOBG" in out
+
+async def test_backfill_derived_fields(fake_db):
+    from .fixtures_sample_data import SAMPLE_DOCS
+    fake_db.collections["metar_data"].extend(dict(d) for d in SAMPLE_DOCS)
+    assert await srv.backfill_derived_fields(batch_size=2) == 3
+    votp = next(d for d in fake_db.collections["metar_data"] if d["stationICAO"] == "VOTP")
+    assert votp["numericObservation"]["observedQNH"] == 1008.0
+    assert votp["metarGroups"][:2] == ["09008KT", "6000"]
+    assert votp["firRegionKey"] == "chennai"
+    # second run has nothing left to do
+    assert await srv.backfill_derived_fields() == 0
+
+async def test_legacy_documents_match_on_raw_fields_until_the_startup_backfill(fake_db, monkeypatch):
+    from .fixtures_sample_data import SAMPLE_DOCS
+    fake_db.collections["metar_data"].extend(dict(d) for d in SAMPLE_DOCS)  # stored before derived fields existed
+    monkeypatch.setattr(srv, "configure_logging", lambda: None)
+    monkeypatch.setattr(srv, "stop_logging", lambda: None)
+    monkeypatch.setattr(srv, "LATEST_CACHE_ENABLED", False)
+    monkeypatch.setattr(srv, "ROLLUP_REFRESH_SECONDS", 0)
+    monkeypatch.setattr(srv, "BACKFILL_REFRESH_SECONDS", 600)
+    monkeypatch.setattr(srv, "result_cache", srv.QueryResultCache(0, 0, 0))
+
+    async def searches():
+        assert "VOTP" in await srv.search_metar_data(temperature_min=25, limit=10)
+        assert "VOTP" not in await srv.search_metar_data(temperature_max=29, limit=10)
+        assert "VOTP" in await srv.search_metar_data(cloud_type="FEW", fir_region="chen", limit=10)
+        out = await srv.search_metar_data(weather_condition="thunderstorm", cloud_type="SCT", limit=10)
+        assert "VOBG" in out and "VOTP" not in out
+        assert "VOBG" not in await srv.search_metar_data(weather_condition="R", limit=10)
+
+    await searches()  # from the raw fields
+    async with srv.server_lifespan(None):
+        for _ in range(5):  # let the first backfill pass run
+            await asyncio.sleep(0)
+        assert {d.get("derivedVersion") for d in fake_db.collections["metar_data"]} == {srv.DERIVED_VERSION}
+        await searches()  # from the derived fields
+    assert not srv._periodic_tasks
+
+async def test_raw_observation_number_parses_like_the_derived_fields():
+    from .fake_mongo import _eval_agg
+    for value in ("30", "M02", "9999", "CAVOK", "1008", 7, None, "", "//"):
+        doc = {"metar": {"decodedData": {"observation": {"airTemperature": value}}}}
+        assert _eval_agg(doc, srv.raw_observation_number("airTemperature")) == srv.parse_observation_number(value)
+
+async def test_latest_feed_enriches_new_documents(fake_db, monkeypatch):
+    from .fixtures_sample_data import SAMPLE_DOCS
+    fake_db.collections["metar_data"].extend(dict(d) for d in SAMPLE_DOCS)
+    cache = srv.LatestObservationCache(poll_seconds=60, max_staleness_seconds=120)
+    await cache.seed()
+    assert cache.enriched == 3
+    assert all(d["derivedVersion"] == srv.DERIVED_VERSION for d in fake_db.collections["metar_data"])
+    fresh = {**SAMPLE_DOCS[0], "_id": "4", "metar": {**SAMPLE_DOCS[0]["metar"], "updatedTime": srv.datetime(2030, 1, 1)}}
+    fake_db.collections["metar_data"].append(fresh)
+    await cache.poll_once()
+    assert cache.enriched == 4 and fresh["numericObservation"]["airTemperature"] == 30.0
+    await cache.poll_once()  # already enriched
+    assert cache.enriched == 4
+
+async def test_ensure_indexes_covers_tool_queries(fake_db):
+    names = await srv.ensure_indexes()
+    assert len(names) == len(srv.METAR_INDEXES) + len(srv.ROLLUP_INDEXES) + len(srv.STATION_INDEXES)
+    assert await srv.verify_index_coverage() == {}
+
+async def test_verify_index_coverage_flags_collscan(fake_db):
+    problems = await srv.verify_index_coverage()
+    assert "COLLSCAN" in problems["search_metar_data:icao"]
+    assert "SORT" in problems["raw_mongodb_query:latest"]
+    assert "COLLSCAN" in problems["get_latest_metar_for_stations"]
+
+async def test_latest_per_station_pipeline_plans_a_distinct_scan(fake_db):
+    await srv.ensure_indexes()
+    pipeline = srv.latest_per_station_pipeline(["VIDP", "VABB"])
+    assert "DISTINCT_SCAN" in srv.plan_stages(await srv.explain_aggregate(pipeline))
+    assert fake_db.explains[-1][0] == {"aggregate": "metar_data", "pipeline": pipeline, "cursor": {}}
+    # any stage between $sort and $group rules it out
+    projected_early = [*pipeline[:2], {"$project": srv.FORMATTER_PROJECTION}, pipeline[2]]
+    assert "DISTINCT_SCAN" not in srv.plan_stages(await srv.explain_aggregate(projected_early))
+
+async def test_bootstrap_indexes_fail_mode_raises(fake_db, monkeypatch):
+    monkeypatch.setattr(srv, "INDEX_BOOTSTRAP", "fail")
+    monkeypatch.setattr(srv, "_indexes_bootstrapped", False)
+    monkeypatch.setattr(srv, "METAR_INDEXES", [])
+    with pytest.raises(RuntimeError, match="Unindexed query shapes"):
+        await srv.bootstrap_indexes()
+
+async def test_plan_stages_reads_slot_based_plans():
+    plan = {"queryPlan": {"stage": "SORT", "inputStage": {"stage": "COLLSCAN"}}, "slotBasedPlan": {}}
+    assert sorted(srv.plan_stages(plan)) == ["COLLSCAN", "SORT"]
+
+@pytest.fixture()
+def latest_cache(monkeypatch):
+    cache = srv.LatestObservationCache(poll_seconds=3600, max_staleness_seconds=60)
+    monkeypatch.setattr(srv, "latest_cache", cache)
+    return cache
+
+async def test_latest_cache_seed_and_lookup(fake_db, sample_docs, latest_cache):
+    await latest_cache.seed()
+    assert latest_cache.lookup({"stationICAO": "VOBG"})[0]["_id"] == "2"
+    assert latest_cache.lookup({"stationICAO": "XXXX"}) is None
+    assert latest_cache.lookup({"stationICAO": "VOBG", "hasMetarData": True}) is None
+    stats = latest_cache.stats()
+    assert (stats["stations"], stats["hits"], stats["misses"]) == (3, 1, 1)
+
+async def test_latest_cache_serves_search_limit_one(fake_db, sample_docs, latest_cache):
+    await latest_cache.seed()
+    fake_db.collections["metar_data"].clear()
+    out = await srv.search_metar_data(station_icao="VOTP", limit=1)
+    assert "Station: VOTP" in out
+    assert latest_cache.hits == 1
+
+async def test_latest_cache_polling_applies_newer_docs(fake_db, sample_docs, latest_cache):
+    from .fixtures_sample_data import NOW
+    await latest_cache.seed()
+    newer = srv.enrich_metar_document({**sample_docs[1], "_id": "2b", "timestamp": NOW, "metar": {**sample_docs[1]["metar"], "updatedTime": NOW}})
+    fake_db.collections["metar_data"].append(newer)
+    await latest_cache.poll_once()
+    assert latest_cache.get("VOBG")["_id"] == "2b"
+
+async def test_latest_cache_refuses_stale_reads(fake_db, sample_docs, latest_cache):
+    await latest_cache.seed()
+    latest_cache.mode = "polling"
+    latest_cache._refreshed_at -= 120
+    assert latest_cache.get("VOTP") is None
+    assert latest_cache.stale == 1
+
+async def test_latest_cache_change_stream_docs_serve_search_limit_one(fake_db, sample_docs, latest_cache):
+    from .fixtures_sample_data import NOW
+    fake_db.replica_set = True
+    await latest_cache.start()
+    await asyncio.sleep(0)
+    assert latest_cache.mode == "change_stream"
+    newer = srv.enrich_metar_document({**sample_docs[1], "_id": "2b", "timestamp": NOW, "metar": {**sample_docs[1]["metar"], "updatedTime": NOW}})
+    await fake_db["metar_data"].insert_one(newer)
+    await asyncio.sleep(0)
+    assert latest_cache.get("VOBG")["_id"] == "2b"
+
+    fake_db.collections["metar_data"].clear()  # answered by the cache alone
+    out = await srv.search_metar_data(station_icao="VOBG", limit=1)
+    assert "Station: VOBG" in out and "Error" not in out
+    await latest_cache.stop()
+
+async def test_latest_cache_falls_back_to_polling(fake_db, sample_docs, latest_cache):
+    import asyncio
+    await latest_cache.start()
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    assert latest_cache.mode == "polling"
+    await latest_cache.stop()
+    assert latest_cache.mode == "idle"
+
+async def test_latest_cache_unseeded_poll_looks_back_one_interval(fake_db, sample_docs, latest_cache, frozen_time, monkeypatch):
+    from .fake_mongo import FakeCollection
+    def no_aggregate(self, pipeline, **kwargs):
+        raise RuntimeError("aggregate unavailable")
+    monkeypatch.setattr(FakeCollection, "aggregate", no_aggregate)
+    await latest_cache.start()  # seed fails; the poll must not fetch the whole collection
+    for _ in range(3):
+        await asyncio.sleep(0)
+    assert latest_cache.mode == "polling"
+    assert latest_cache.get("VOTP")["_id"] == "1"
+    assert latest_cache.stats()["stations"] == 1  # VOBG and VIDP are older than METAR_UPDATE_INTERVAL_SECONDS
+    await latest_cache.stop()
+
+async def test_station_catalog_maps_iata_to_icao(fake_db, sample_docs):
+    catalog = await srv.station_catalog.get()
+    assert catalog.iata_to_icao["BLR"] == "VOBG"
+    assert catalog.total_reports == 3
+    assert await catalog.iata_filter("del") == {"stationICAO": "VIDP"}
+    assert await catalog.iata_filter("xxx") == {"stationIATA": "XXX"}
+
+async def test_station_catalog_is_cached_until_new_station(fake_db, sample_docs):
+    await srv.station_catalog.get()
+    fake_db.collections["metar_data"].append({"_id": "4", "stationICAO": "VABB", "stationIATA": "BOM"})
+    assert "VABB" not in (await srv.station_catalog.get()).icao_codes
+    srv.station_catalog.observe({"stationICAO": "VABB"})
+    assert "VABB" in (await srv.station_catalog.get()).icao_codes
+
+async def test_search_by_iata_uses_icao(fake_db, sample_docs):
+    out = await srv.search_metar_data(station_iata="blr", limit=5)
+    assert "Station: VOBG (BLR)" in out
+
+async def test_compute_metar_statistics_single_pipeline(fake_db, sample_docs):
+    stats = await srv.compute_metar_statistics()
+    assert (stats["total"], stats["with_metar"], stats["with_taf"]) == (3, 2, 1)
+    assert (stats["unique_icao"], stats["unique_iata"]) == (3, 3)
+    assert stats["earliest"] < stats["latest"]
+
+async def test_statistics_served_from_materialized_doc(fake_db, sample_docs, monkeypatch):
+    monkeypatch.setattr(srv, "STATISTICS_REFRESH_SECONDS", 600)
+    await srv.refresh_materialized_statistics()
+    fake_db.collections["metar_data"].clear()
+    out = await srv.get_metar_statistics()
+    assert "METAR Reports: 3" in out
+    assert "As of:" in out
+
+async def test_search_projects_formatter_fields_and_counts_bytes(fake_db, sample_docs):
+    fake_db.collections["metar_data"][0]["metar"]["decodedData"]["tempoSection"] = {"type": "TEMPO " * 500}
+    docs = await srv.fetch_metar_documents("search_metar_data", {"stationICAO": "VOTP"}, [("timestamp", -1)], 5)
+    assert "tempoSection" not in docs[0]["metar"]["decodedData"]
+    assert "tafor" in docs[0] and "timestamp" not in docs[0]["tafor"]
+    stats = srv.transfer_stats.stats()["search_metar_data"]
+    assert stats["documents"] == 1 and 0 < stats["bytes"] < 3000
+
+async def test_raw_query_full_document_mode(fake_db, sample_docs):
+    out = await srv.raw_mongodb_query('{"stationICAO": "VOTP"}', limit=1, full_document=True)
+    assert "Document: {" in out
+    assert '"numericObservation"' in out
+
+def _next_cursor(out):
+    lines = [line for line in out.splitlines() if line.startswith("Next page: cursor=")]
+    return lines[0].split("=", 1)[1] if lines else None
+
+async def test_search_keyset_pages_through_ties(fake_db, frozen_time):
+    from datetime import timedelta
+
+    from .fixtures_sample_data import NOW, SAMPLE_DOCS
+    base = SAMPLE_DOCS[0]
+    for i in range(7):
+        # pairs of documents share a timestamp, so _id has to break ties
+        ts = NOW - timedelta(minutes=30 * (i // 2))
+        fake_db.collections["metar_data"].append({**base, "_id": f"d{i}", "timestamp": ts, "processed_timestamp": f"p{i}"})
+    seen, cursor = [], None
+    for _ in range(4):
+        out = await srv.search_metar_data(station_icao="VOTP", limit=3, cursor=cursor)
+        seen += [line.split(": ")[1] for line in out.splitlines() if "Last Updated" in line]
+        cursor = _next_cursor(out)
+        if cursor is None:
+            break
+    assert sorted(seen) == [f"p{i}" for i in range(7)]
+
+async def test_raw_query_rejects_foreign_cursor(fake_db, sample_docs, frozen_time):
+    out = await srv.search_metar_data(limit=1, hours_back=48)
+    cursor = _next_cursor(out)
+    out = await srv.raw_mongodb_query('{"stationICAO": "VOTP"}', limit=1, cursor=cursor)
+    assert "Cursor does not belong to this tool" in out
+    out = await srv.raw_mongodb_query('{}', limit=1, cursor="!!not-a-cursor")
+    assert "Invalid cursor" in out
+
+async def test_tokenize_metar_groups():
+    tokens = srv.tokenize_metar("METAR VABB 101000Z 27010KT 2000 +TSRA FEW020 SCT030CB 30/25 Q1006=", "VABB")
+    assert tokens[:2] == ["27010KT", "2000"]
+    assert {"+TSRA", "TSRA", "TS", "RA", "SCT030CB", "SCT030", "CB"} <= set(tokens)
+    assert "VABB" not in tokens and "101000Z" not in tokens
+
+async def test_tokenize_metar_keeps_to_observed_weather():
+    tokens = srv.tokenize_metar("VABB 101000Z 27010KT 6000 VCTS FEW020 30/25 Q1006 TEMPO 3000 TSRA SCT025CB RMK CB W", "VABB")
+    assert "VCTS" in tokens and not {"TS", "TSRA", "RA", "CB", "SCT025CB", "TEMPO", "RMK"} & set(tokens)
+    assert srv.tokenize_metar("VABB 101000Z VCSHRA", "VABB") == ["VCSHRA", "VCSH", "VCRA"]
+
+async def test_search_weather_ignores_trend_and_vicinity_groups(fake_db, sample_docs):
+    from .fixtures_sample_data import NOW
+    def report(_id, raw, weather):
+        base = sample_docs[0]
+        metar = {**base["metar"], "rawData": raw, "decodedData": {"observation": {**base["metar"]["decodedData"]["observation"], "weatherConditions": weather}}}
+        return {**base, "_id": _id, "stationICAO": "VOMM", "timestamp": NOW, "metar": metar}
+    tempo = report("t", "VOMM 101000Z 09008KT 6000 FEW020 30/22 Q1008 TEMPO 3000 TSRA", None)
+    vicinity = report("v", "VOMM 101000Z 09008KT 6000 VCTS FEW020 30/22 Q1008 NOSIG", "VCTS")
+    for doc in (tempo, vicinity):
+        fake_db.collections["metar_data"].extend([srv.enrich_metar_document(doc)])
+    out = await srv.search_metar_data(weather_condition="TSRA", limit=10)
+    assert "VOBG" in out and "VOMM" not in out
+    out = await srv.search_metar_data(weather_condition="TS", limit=10)
+    assert "VOBG" in out and "VOMM" not in out
+    assert "VOMM" in await srv.search_metar_data(weather_condition="VCTS", limit=10)
+
+    # documents derived by an older version are matched on the decoded weather instead
+    for doc in fake_db.collections["metar_data"]:
+        doc["derivedVersion"] = srv.DERIVED_VERSION - 1
+    fake_db.collections["metar_data"].changed()
+    srv.result_cache.clear()
+    out = await srv.search_metar_data(weather_condition="TS", limit=10)
+    assert "VOBG" in out and "VOMM" not in out
+    assert "VOMM" in await srv.search_metar_data(weather_condition="VCTS", limit=10)
+
+async def test_search_weather_word_and_cloud_combined(fake_db, sample_docs):
+    out = await srv.search_metar_data(weather_condition="rain", cloud_type="SCT", limit=10)
+    assert "Station: VOBG" in out and "VOTP" not in out
+    out = await srv.search_metar_data(weather_condition="rain", cloud_type="FEW", limit=10)
+    assert out.startswith("No METAR data found")
+
+async def test_search_fir_region_prefix(fake_db, sample_docs):
+    out = await srv.search_metar_data(fir_region="chen", limit=10)
+    assert "Station: VOTP" in out and "VOBG" not in out
+
+async def test_raw_query_rejects_disallowed_operators(fake_db, sample_docs):
+    out = await srv.raw_mongodb_query('{"$where": "sleep(1000)"}')
+    assert out == "Query too expensive: operators not allowed: $where"
+    out = await srv.raw_mongodb_query('{"stationICAO": {"$in": ["VOTP"]}, "metar": {"$expr": {}}}')
+    assert "operators not allowed: $expr" in out
+    assert srv.query_guard_stats.rejected_operator == 2
+
+async def test_raw_query_rejects_collscan_on_large_collection(fake_db, sample_docs, monkeypatch):
+    monkeypatch.setattr(srv, "RAW_QUERY_COLLSCAN_MAX_DOCS", 2)
+    out = await srv.raw_mongodb_query('{"metar.firRegion": "Chennai"}')
+    assert out.startswith("Query too expensive: full collection scan over ~3 documents")
+    assert "COLLSCAN" in out
+    await srv.ensure_indexes()
+    out = await srv.raw_mongodb_query('{"stationICAO": "VOTP"}')
+    assert "Station: VOTP" in out
+    assert srv.query_guard_stats.stats() == {"checked": 2, "rejected_operator": 0, "rejected_collscan": 1, "timeouts": 0}
+
+async def test_raw_query_rejects_unbounded_sort_index_walk(fake_db, sample_docs, monkeypatch):
+    monkeypatch.setattr(srv, "RAW_QUERY_COLLSCAN_MAX_DOCS", 2)
+    await srv.ensure_indexes()
+    out = await srv.raw_mongodb_query('{"metar.rawData": {"$regex": "TSRA"}}')
+    assert out.startswith("Query too expensive: full index scan over ~3 documents")
+    assert "IXSCAN" in out
+    assert {kwargs["verbosity"] for _, kwargs in fake_db.explains} == {"queryPlanner"}
+    out = await srv.raw_mongodb_query('{"stationICAO": "VOTP", "metar.rawData": {"$regex": "NOSIG"}}')
+    assert "Station: VOTP" in out
+    assert srv.query_guard_stats.rejected_collscan == 1
+
+async def test_unbounded_index_scans_needs_full_bounds_under_a_filtering_fetch():
+    def plan(bounds, fetch_filter):
+        ixscan = {"stage": "IXSCAN", "indexName": "timestamp_-1", "indexBounds": bounds}
+        return {"stage": "LIMIT", "inputStage": {"stage": "FETCH", "filter": fetch_filter, "inputStage": ixscan}}
+    regex = {"metar.rawData": {"$regex": "TSRA"}}
+    assert srv.unbounded_index_scans(plan({"timestamp": ["[MaxKey, MinKey]"]}, regex)) == ["timestamp_-1"]
+    assert srv.unbounded_index_scans(plan({}, regex)) == ["timestamp_-1"]
+    assert srv.unbounded_index_scans(plan({"timestamp": ["[MaxKey, MinKey]"]}, None)) == []
+    bounded = {"timestamp": ["[new Date(1700000000000), new Date(1690000000000)]"]}
+    assert srv.unbounded_index_scans(plan(bounded, regex)) == []
+
+async def test_raw_query_reports_timeouts(fake_db, sample_docs, monkeypatch):
+    async def _timeout(*args, **kwargs):
+        raise srv.ExecutionTimeout("operation exceeded time limit")
+    monkeypatch.setattr(srv, "fetch_metar_documents", _timeout)
+    out = await srv.raw_mongodb_query('{"stationICAO": "VOTP"}')
+    assert out.startswith("Query too expensive: exceeded the")
+    assert srv.query_guard_stats.timeouts == 1
+
+async def test_result_cache_coalesces_concurrent_identical_calls(fake_db, sample_docs, monkeypatch):
+    import asyncio
+    calls = []
+    real_fetch = srv.fetch_metar_documents
+    async def _counting_fetch(*args, **kwargs):
+        calls.append(args[1])
+        await asyncio.sleep(0.01)
+        return await real_fetch(*args, **kwargs)
+    monkeypatch.setattr(srv, "fetch_metar_documents", _counting_fetch)
+
+    outs = await asyncio.gather(*(srv.search_metar_data(station_icao="VOBG", limit=5) for _ in range(20)))
+    assert len(set(outs)) == 1 and len(calls) == 1
+    assert await srv.search_metar_data("VOBG", limit=5) == outs[0]
+    stats = srv.result_cache.stats()
+    assert (stats["misses"], stats["coalesced"], stats["hits"]) == (1, 19, 1)
+
+async def test_result_cache_skips_errors_and_follows_metar_updates(fake_db, sample_docs, monkeypatch):
+    async def _boom(*args, **kwargs):
+        raise RuntimeError("db down")
+    real_fetch = srv.fetch_metar_documents
+    monkeypatch.setattr(srv, "fetch_metar_documents", _boom)
+    assert (await srv.raw_mongodb_query('{"stationICAO": "VOTP"}')).startswith("Error executing query")
+    monkeypatch.setattr(srv, "fetch_metar_documents", real_fetch)
+    assert "Station: VOTP" in await srv.raw_mongodb_query('{"stationICAO": "VOTP"}')
+
+    # a newer metar.updatedTime from the latest-observation feed retires the results covering its station
+    await srv.search_metar_data(fir_region="Chennai")
+    newer = {**sample_docs[1], "metar": {**sample_docs[1]["metar"], "updatedTime": srv.datetime.now()}}
+    srv.latest_cache.apply(newer)
+    await srv.raw_mongodb_query('{"stationICAO": "VOTP"}')
+    assert srv.result_cache.stats()["misses"] == 3
+    await srv.search_metar_data(fir_region="Chennai")
+    assert srv.result_cache.stats()["misses"] == 4
+    srv.latest_cache.apply({**newer, "stationICAO": "VOTP"})
+    await srv.raw_mongodb_query('{"stationICAO": "VOTP"}')
+    assert srv.result_cache.stats()["misses"] == 5
+
+async def test_result_cache_scopes_updates_by_station_and_time(fake_db, sample_docs, monkeypatch):
+    from .fixtures_sample_data import NOW
+    earlier = (NOW - srv.timedelta(hours=1)).strftime("%Y-%m-%dT%H:%M")
+    await srv.get_metar_at("VOTP", earlier)
+    await srv.get_latest_metar_for_stations(["VOTP", "BLR"])
+    srv.result_cache.invalidate("VOTP", NOW)  # a later report leaves the earlier instant alone
+    assert srv.result_cache.stats()["entries"] == 1
+    srv.result_cache.invalidate("VOTP", NOW - srv.timedelta(hours=2))  # a correction before it does not
+    assert (srv.result_cache.stats()["entries"], srv.result_cache.stats()["invalidated"]) == (0, 2)
+
+    # an update that lands while a result is being computed keeps that result out of the cache
+    real_fetch = srv.fetch_metar_documents
+    async def _fetch_then_update(*args, **kwargs):
+        docs = await real_fetch(*args, **kwargs)
+        srv.result_cache.invalidate("VOTP", NOW)
+        return docs
+    monkeypatch.setattr(srv, "fetch_metar_documents", _fetch_then_update)
+    await srv.search_metar_data(station_icao="VOTP")
+    assert srv.result_cache.stats()["entries"] == 0
+
+async def test_latest_metar_for_stations_mixed_codes(fake_db, sample_docs, monkeypatch):
+    from .fixtures_sample_data import NOW
+    older = {**sample_docs[0], "_id": "0", "timestamp": NOW.replace(hour=1), "metar": {**sample_docs[0]["metar"], "rawData": "VOTP OLD"}}
+    fake_db.collections["metar_data"].append(older)
+    aggregations = []
+    real_aggregate = type(fake_db["metar_data"]).aggregate
+    def _spy(self, pipeline, **kwargs):
+        aggregations.append(pipeline)
+        return real_aggregate(self, pipeline, **kwargs)
+    monkeypatch.setattr(type(fake_db["metar_data"]), "aggregate", _spy)
+    monkeypatch.setattr(srv, "station_directory", srv.StationDirectory(srv.STATIONS_FILE))  # not loaded: the catalog maps BLR
+
+    out = await srv.get_latest_metar_for_stations(["VOTP", "blr", "XXXX"])
+    lines = out.splitlines()
+    assert lines[0] == "📡 Latest METAR for 2 stations:"
+    assert "VOTP/TIR @ 2025-11-10 09:55:00: VOTP 101000Z 09008KT 6000 FEW020 30/22 Q1008 NOSIG" in lines
+    assert any(line.startswith("VOBG/BLR @") for line in lines)
+    assert lines[-1] == "Not found: XXXX"
+    # one catalog aggregation + one latest-per-station aggregation
+    assert len(aggregations) == 2
+
+    # IATA codes the station directory knows never reach the catalog or a $match on stationIATA
+    srv.station_directory.load()
+    async def _no_catalog():
+        raise AssertionError("catalog consulted")
+    monkeypatch.setattr(srv.station_catalog, "get", _no_catalog)
+    aggregations.clear()
+    assert "VIDP/DEL @" in await srv.get_latest_metar_for_stations(["del"])
+    assert aggregations == [srv.latest_per_station_pipeline(["VIDP"])]
+
+async def test_latest_metar_for_stations_from_cache(fake_db, sample_docs, monkeypatch):
+    cache = srv.LatestObservationCache(poll_seconds=3600, max_staleness_seconds=60)
+    monkeypatch.setattr(srv, "latest_cache", cache)
+    await cache.seed()
+    await srv.station_catalog.get()
+    fake_db.collections["metar_data"].clear()
+    out = await srv.get_latest_metar_for_stations(["VIDP", "TIR"])
+    assert "VIDP/DEL @" in out and "VOTP/TIR @" in out
+    assert cache.hits == 2
+
+async def test_update_rollups_is_incremental(fake_db, sample_docs):
+    from .fixtures_sample_data import NOW
+    assert await srv.update_rollups(batch_size=2) == 3
+    assert await srv.update_rollups() == 0
+    later = srv.enrich_metar_document({
+        **sample_docs[0], "_id": "1b", "timestamp": NOW.replace(minute=20),
+        "metar": {**sample_docs[0]["metar"], "updatedTime": NOW.replace(minute=20),
+                  "decodedData": {"observation": {"airTemperature": "32", "windSpeed": "4"}}},
+    })
+    fake_db.collections["metar_data"].append(later)
+    assert await srv.update_rollups() == 1
+    day = next(d for d in fake_db.collections["metar_rollups"] if d["_id"] == "VOTP:day:2025-11-10T00:00:00")
+    assert day["count"] == 2
+    assert (day["temperature"]["min"], day["temperature"]["max"], day["temperature"]["sum"]) == (30.0, 32.0, 62.0)
+    assert day["qnh"]["n"] == 1
+
+async def test_update_rollups_replaces_reingested_reports_and_survives_retries(fake_db, sample_docs):
+    day_id = "VOTP:day:2025-11-10T00:00:00"
+    def day():
+        return next(d for d in fake_db.collections["metar_rollups"] if d["_id"] == day_id)
+    await srv.update_rollups()
+    assert (day()["count"], day()["temperature"]["sum"]) == (1, 30.0)
+
+    # re-ingested with a later updatedTime and a corrected temperature
+    doc = next(d for d in fake_db.collections["metar_data"] if d["_id"] == "1")
+    doc["metar"] = {**doc["metar"], "updatedTime": srv.datetime(2025, 11, 10, 10, 30),
+                    "decodedData": {"observation": {**doc["metar"]["decodedData"]["observation"], "airTemperature": "31"}}}
+    doc.update(srv.derived_fields(doc))
+    assert await srv.update_rollups() == 1
+    assert (day()["count"], day()["temperature"]["sum"], day()["temperature"]["max"]) == (1, 31.0, 31.0)
+
+    # a pass whose high-water mark never got written is repeated without double counting
+    fake_db.collections["metar_rollups"].remove(next(d for d in fake_db.collections["metar_rollups"] if d["_id"] == "_state"))
+    assert await srv.update_rollups() == 3
+    assert (day()["count"], day()["temperature"]["n"]) == (1, 1)
+
+async def test_get_station_trends_from_rollups(fake_db, sample_docs, frozen_time):
+    await srv.update_rollups()
+    out = await srv.get_station_trends("TIR", hours_back=24)
+    lines = out.splitlines()
+    assert lines[0] == "📈 VOTP hourly trends, last 24h (1 reports)"
+    assert " wind: min 8, max 8, mean 8" in lines
+    assert (await srv.get_station_trends("VOTP", granularity="week")).startswith("Unknown granularity")
+    assert (await srv.get_station_trends("XXXX")).startswith("No rollup data for XXXX")
+
+async def test_get_station_trends_cache_follows_rollup_updates(fake_db, sample_docs, frozen_time, monkeypatch):
+    from .fixtures_sample_data import NOW
+    monkeypatch.setattr(srv, "result_cache", srv.QueryResultCache(100, 60, 3600))
+    await srv.update_rollups()
+    assert "(1 reports)" in await srv.get_station_trends("VOTP", hours_back=24)
+
+    # the feed sees a new report before the rollups do: the cached trends stay, they still match the buckets
+    later = NOW - srv.timedelta(minutes=2)
+    newer = srv.enrich_metar_document({**sample_docs[0], "_id": "1b", "timestamp": later, "metar": {**sample_docs[0]["metar"], "updatedTime": later}})
+    fake_db.collections["metar_data"].append(newer)
+    srv.result_cache.invalidate("VOTP", later)
+    assert "(1 reports)" in await srv.get_station_trends("VOTP", hours_back=24)
+    assert srv.result_cache.hits == 1
+
+    # rewriting VOTP's buckets retires them
+    await srv.update_rollups()
+    assert "(2 reports)" in await srv.get_station_trends("VOTP", hours_back=24)
+    assert srv.result_cache.stats()["invalidated"] == 1
+
+async def test_great_circle_and_route_offsets():
+    # DEL-BOM is ~1150 km; Nagpur sits close to the DEL-BLR great circle
+    assert 1130 < srv.great_circle_km(28.5665, 77.1031, 19.0887, 72.8679) < 1160
+    along, off = srv.route_offset_km((28.5665, 77.1031), (13.1979, 77.7063), (21.0922, 79.0472))
+    assert 800 < along < 900 and off < 200
+    along, off = srv.route_offset_km((28.5665, 77.1031), (13.1979, 77.7063), (30.6735, 76.7885))
+    assert along < 0 and off == pytest.approx(srv.great_circle_km(28.5665, 77.1031, 30.6735, 76.7885))
+
+async def test_station_directory_sync_and_lookup(fake_db):
+    directory = srv.StationDirectory(srv.STATIONS_FILE)
+    count = await directory.sync()
+    assert count == len(fake_db.collections["stations"]) > 0
+    assert fake_db.collections["stations"][0]["location"]["type"] == "Point"
+    assert directory.resolve("nag")["stationICAO"] == "VANP"
+    assert directory.resolve("vobl")["stationIATA"] == "BLR"
+    assert directory.resolve("Nagpur")["stationICAO"] == "VANP"
+    assert directory.resolve("Atlantis") is None
+    assert [s["stationICAO"] for _, s in directory.nearest(12.95, 77.67, 2)] == ["VOBG", "VOBL"]
+
+async def test_get_metar_near_uses_one_batched_query(fake_db, sample_docs, monkeypatch):
+    aggregations = []
+    real_aggregate = type(fake_db["metar_data"]).aggregate
+    def _spy(self, pipeline, **kwargs):
+        aggregations.append(pipeline)
+        return real_aggregate(self, pipeline, **kwargs)
+    monkeypatch.setattr(type(fake_db["metar_data"]), "aggregate", _spy)
+    out = await srv.get_metar_near("BLR", k=3)
+    lines = out.splitlines()
+    assert lines[0].startswith("📍 Latest METAR for 3 stations nearest VOBL")
+    assert lines[1].strip().startswith("0 km  VOBL: no METAR data")
+    assert "VOBG/BLR @" in lines[2]
+    # ICAO codes need no station catalog: one latest-per-station aggregation
+    assert len(aggregations) == 1
+    assert (await srv.get_metar_near(latitude=12.95, longitude=77.67, k=1, max_distance_km=1)).count("\n") == 2
+    assert (await srv.get_metar_near("Atlantis")).startswith("Unknown station or place")
+    assert (await srv.get_metar_near()).startswith("Provide a location")
+
+async def test_get_metar_along_route_corridor(fake_db, sample_docs):
+    out = await srv.get_metar_along_route("DEL", "BLR", corridor_km=200)
+    lines = out.splitlines()
+    assert lines[0].startswith("🛫 Latest METAR along VIDP-VOBL")
+    stations = [line.split("  ")[-1].split("/")[0].split(":")[0].strip() for line in lines[1:]]
+    assert stations[0] == "VIDP" and "VANP" in stations and {"VOBL", "VOBG"} <= set(stations)
+    assert "VABB" not in stations and "VECC" not in stations
+    assert "VIDP/DEL @" in lines[1]
+
+async def test_mongodb_client_options(monkeypatch):
+    monkeypatch.setattr(srv.importlib.util, "find_spec", lambda name: name == "snappy" or None)
+    assert srv.available_compressors("zstd, snappy,zlib,lz4") == ["snappy", "zlib"]
+    monkeypatch.setattr(srv, "MONGO_COMPRESSORS", "zstd")
+    options = srv.mongodb_client_options()
+    assert "compressors" not in options
+    assert (options["maxPoolSize"], options["minPoolSize"]) == (srv.MONGO_MAX_POOL_SIZE, srv.MONGO_MIN_POOL_SIZE)
+    assert options["event_listeners"] == [srv.pool_stats, srv.mongo_command_metrics]
+
+async def test_warm_up_mongodb_and_pool_stats(fake_db, monkeypatch):
+    monkeypatch.setattr(srv, "MONGO_MIN_POOL_SIZE", 4)
+    await srv.warm_up_mongodb()
+    assert fake_db.commands == ["ping"] * 4
+    stats = srv.pool_stats
+    for duration in (0.002, 0.010):
+        stats.connection_created(None)
+        stats.connection_checked_out(types.SimpleNamespace(duration=duration))
+    stats.connection_check_out_failed(types.SimpleNamespace(duration=0.003))
+    stats.connection_closed(None)
+    out = stats.stats()
+    assert out["open_connections"] == 1
+    assert (out["checkouts"], out["checkout_failures"]) == (2, 1)
+    assert out["checkout_wait_ms_mean"] == pytest.approx(5.0)
+    assert out["checkout_wait_ms_max"] == pytest.approx(10.0)
+    assert out["ping_ms"] is not None
+
+async def test_json_log_formatter_and_sampling(monkeypatch):
+    import logging
+    record = srv.logger.makeRecord(srv.logger.name, logging.INFO, __file__, 1, "Fetched %s", ("docs",), None,
+                                   extra={"tool": "search_metar_data", "query": {"timestamp": srv.datetime(2025, 11, 10)}})
+    entry = json.loads(srv.JsonFormatter().format(record))
+    assert (entry["level"], entry["msg"], entry["tool"]) == ("INFO", "Fetched docs", "search_metar_data")
+    assert entry["query"] == {"timestamp": "2025-11-10 00:00:00"}
+
+    sampled = srv.logger.makeRecord(srv.logger.name, logging.DEBUG, __file__, 1, "q", (), None, extra={"sampled": True})
+    monkeypatch.setattr(srv.random, "random", lambda: 0.5)
+    assert srv.SamplingFilter(0.1).filter(sampled) is False
+    assert srv.SamplingFilter(0.9).filter(sampled) is True
+    assert srv.SamplingFilter(0.0).filter(record) is True
+
+async def test_configure_logging_writes_json_off_the_caller_thread(monkeypatch):
+    import io
+    out = io.StringIO()
+    monkeypatch.setattr(srv.sys, "stdout", out)
+    monkeypatch.setattr(srv, "LOG_FORMAT", "json")
+    srv.configure_logging()
+    try:
+        try:
+            raise RuntimeError("boom")
+        except RuntimeError:
+            srv.logger.exception("Error in %s", "get_metar_statistics", extra={"tool": "get_metar_statistics"})
+    finally:
+        srv.stop_logging()
+    entry = json.loads(out.getvalue().splitlines()[-1])
+    assert entry["msg"] == "Error in get_metar_statistics"
+    assert entry["tool"] == "get_metar_statistics"
+    assert "RuntimeError: boom" in entry["exc"]
+    assert srv.logger.propagate and not srv.logger.handlers
+
+async def test_tool_errors_are_logged_with_traceback(fake_db, monkeypatch, caplog):
+    async def _boom():
+        raise RuntimeError("stats down")
+    monkeypatch.setattr(srv, "load_metar_statistics", _boom)
+    with caplog.at_level("ERROR", logger="metar_mcp"):
+        await srv.get_metar_statistics()
+    assert caplog.records[-1].getMessage() == "Error in get_metar_statistics"
+    assert caplog.records[-1].exc_info[1].args == ("stats down",)
+
+async def test_synthetic_generator_matches_schema_and_loads_into_fake(fake_db):
+    from benchmarks.load_driver import percentile
+    from benchmarks.synthetic_metar import generate_documents, load_fake
+
+    from .fixtures_sample_data import NOW
+    docs = list(generate_documents(500, end=NOW, extra_stations=10, seed=7))
+    assert len(docs) == 500 and docs[0]["timestamp"] == NOW
+    schema = await srv.metar_format()
+    for doc in docs:
+        assert set(doc) <= set(schema) | {"processed_timestamp", "timestamp"}
+        obs = doc["metar"]["decodedData"]["observation"]
+        assert set(obs) <= set(schema["metar"]["decodedData"]["observation"])
+        assert doc["metar"]["rawData"].startswith(f"{doc['stationICAO']} {doc['timestamp']:%d%H%M}Z ")
+        assert doc[srv.NUMERIC_OBS_PREFIX]["airTemperature"] == float(obs["airTemperature"])
+    def raws(seed):
+        return [d["metar"]["rawData"] for d in generate_documents(20, end=NOW, seed=seed)]
+    assert raws(7) == raws(7) != raws(8)
+
+    assert load_fake(fake_db, iter(docs)) == 500
+    out = await srv.search_metar_data(station_iata="DEL", limit=2)
+    assert out.count("--- Result") == 2
+    assert percentile([1.0, 2.0, 3.0, 4.0], 50) == 2.0 and percentile([1.0, 2.0, 3.0, 4.0], 99) == 4.0
+
+async def test_fake_mongo_indexes_agree_with_a_full_scan(fake_db):
+    import random
+
+    from .fake_mongo import _filter_docs, _run_pipeline, _sort_key
+    rng = random.Random(3)
+    docs = [
+        {"_id": i, "s": rng.choice("ABCD"), "t": rng.randint(0, 40), "g": rng.sample("xyz", rng.randint(0, 2)),
+         "n": rng.choice([None, 1, 2.5, "3"])}
+        for i in range(2000)
+    ]
+    coll = fake_db["scratch"]
+    coll.extend(docs)
+    for keys in ([("s", 1), ("t", -1)], [("g", 1)], [("n", 1)]):
+        await coll.create_index(keys)
+    queries = [{"s": "A"}, {"s": {"$in": ["A", "C"]}, "t": {"$gte": 10, "$lt": 30}}, {"g": "x"},
+               {"n": {"$gte": 1}}, {"$or": [{"s": "B"}, {"t": 5}]}, {"s": {"$regex": "^D"}}, {"n": None}]
+    for query in queries:
+        for sort in ([("t", -1), ("_id", 1)], [("s", 1), ("t", -1)], [("g", 1)]):
+            for limit in (0, 1, 25):
+                expected = sorted(_filter_docs(docs, query), key=_sort_key(sort))[:limit or None]
+                got = await coll.find(query).sort(sort).limit(limit).to_list(None)
+                assert [d["_id"] for d in got] == [d["_id"] for d in expected], (query, sort, limit)
+    assert [d["_id"] for d in fake_db.collections["scratch"]] == list(range(2000))  # never reordered
+
+    pipelines = [
+        [{"$match": {"s": {"$in": ["A", "B"]}}}, {"$sort": {"s": 1, "t": -1}}, {"$project": {"t": 1}},
+         {"$group": {"_id": "$s", "doc": {"$first": "$$ROOT"}}}],
+        [{"$sort": {"s": 1, "t": -1}}, {"$group": {"_id": "$s", "t": {"$first": "$t"}}}],
+        [{"$facet": {
+            "a": [{"$match": {"s": "A"}}, {"$count": "n"}],
+            "s": [{"$match": {"s": {"$ne": "A"}}}, {"$group": {"_id": "$s"}}, {"$count": "n"}],
+            "r": [{"$group": {"_id": None, "lo": {"$min": "$t"}, "hi": {"$max": "$t"}}}],
+        }}],
+    ]
+    for pipeline in pipelines:
+        assert await coll.aggregate(pipeline).to_list(None) == _run_pipeline(list(docs), pipeline)
+
+async def test_encode_toon_tables_and_quoting():
+    doc = {
+        "count": 2,
+        "rows": [{"icao": "VIDP", "wx": None, "metar": "VIDP 171730Z 26003KT", "note": "a,b"},
+                 {"icao": "VABB", "wx": "-RA", "metar": "", "note": "12"}],
+        "query": {"$gte": 1.5, "ok": True},
+        "codes": ["DEL", "BOM"],
+    }
+    assert srv.encode_toon(doc) == (
+        "count: 2\n"
+        "rows[2]{icao,wx,metar,note}:\n"
+        "  VIDP,null,VIDP 171730Z 26003KT,\"a,b\"\n"
+        "  VABB,\"-RA\",\"\",\"12\"\n"
+        "query:\n"
+        "  \"$gte\": 1.5\n"
+        "  ok: true\n"
+        "codes[2]: DEL,BOM\n"
+    )
+    assert json.loads(srv.encode_columns(doc))["rows"] == {
+        "icao": ["VIDP", "VABB"], "wx": [None, "-RA"], "metar": ["VIDP 171730Z 26003KT", ""], "note": ["a,b", "12"],
+    }
+
+async def test_search_and_raw_query_compact_output(fake_db, sample_docs):
+    text = await srv.search_metar_data(station_icao="VOTP", limit=5)
+    toon = await srv.search_metar_data(station_icao="VOTP", limit=5, output_format="toon")
+    columns = json.loads(await srv.search_metar_data(station_icao="VOTP", limit=5, output_format="columns"))
+    assert columns["filters"] == {"station_icao": "VOTP"}
+    assert columns["count"] == text.count("--- Result") == len(columns["rows"]["icao"])
+    assert set(columns["rows"]["icao"]) == {"VOTP"} and all(isinstance(t, int | float) for t in columns["rows"]["temp"])
+    assert f"rows[{columns['count']}]{{icao,iata,time,temp," in toon
+    assert len(toon) < len(text) and "=" * 80 not in toon
+
+    raw = json.loads(await srv.raw_mongodb_query('{"stationICAO": "VOTP"}', limit=1, output_format="columns"))
+    assert raw["query"] == {"stationICAO": "VOTP"} and raw["count"] == 1 and raw["next_cursor"]
+    assert await srv.search_metar_data(output_format="xml") == (
+        "Unknown output_format: xml (use 'text', 'toon' or 'columns')"
+    )
+
+async def test_statistics_and_trends_compact_output(fake_db, sample_docs, frozen_time):
+    stats = json.loads(await srv.get_metar_statistics(output_format="columns"))
+    assert stats["total"] == len(sample_docs) and stats["unique_icao"] >= 1
+    assert "total: " in await srv.get_metar_statistics(output_format="toon")
+
+    await srv.update_rollups()
+    trends = await srv.get_station_trends("VOTP", hours_back=24 * 365, output_format="toon")
+    assert trends.startswith("station: VOTP\n") and "summary[" in trends and "buckets[" in trends
+
+async def test_render_cache_reuses_text_until_metar_or_taf_is_updated(fake_db, sample_docs):
+    first = await srv.raw_mongodb_query('{"stationICAO": "VOTP"}', limit=3)
+    misses = srv.render_cache.misses
+    assert misses > 0 and srv.render_cache.hits == 0
+    srv.result_cache = srv.QueryResultCache(0, 0, 0)
+    assert await srv.raw_mongodb_query('{"stationICAO": "VOTP"}', limit=3) == first
+    assert srv.render_cache.misses == misses and srv.render_cache.hits == misses
+
+    doc = dict(sample_docs[0], _id="x1", metar=dict(sample_docs[0]["metar"], updatedTime=srv.datetime(2030, 1, 1)))
+    text = srv.render_cache.metar_data(doc)
+    assert text == srv.format_metar_data(doc)
+    doc["metar"] = dict(doc["metar"], rawData="VOTP 010000Z 00000KT CAVOK", updatedTime=srv.datetime(2030, 1, 2))
+    assert "CAVOK" in srv.render_cache.metar_data(doc) and "CAVOK" not in text
+    # an amended TAF on the same METAR
+    doc["tafor"] = dict(doc["tafor"], rawData="TAF AMD VOTP 010000Z 0100/0124 00000KT CAVOK")
+    assert "TAF AMD VOTP" in srv.render_cache.metar_data(doc)
+    assert "TAF AMD VOTP" in srv.render_cache.metar_line(doc)
+
+    small = srv.RenderCache(2)
+    for i in range(3):
+        small.metar_line(dict(sample_docs[0], _id=i))
+    assert small.stats() == {"entries": 2, "hits": 0, "misses": 3}
+
+async def test_parse_instant_formats():
+    from .fixtures_sample_data import NOW
+    assert srv.parse_instant("2025-11-03T02:40Z") == srv.datetime(2025, 11, 3, 2, 40)
+    assert srv.parse_instant("2025-11-03T08:10+05:30") == srv.datetime(2025, 11, 3, 2, 40)
+    assert srv.parse_instant("030240Z", now=NOW) == srv.datetime(2025, 11, 3, 2, 40)
+    assert srv.parse_instant("310240Z", now=NOW) == srv.datetime(2025, 10, 31, 2, 40)  # November has no 31st
+    assert srv.parse_instant("150240Z", now=NOW) == srv.datetime(2025, 10, 15, 2, 40)  # not in the future
+    with pytest.raises(ValueError):
+        srv.parse_instant("yesterday")
+
+async def test_get_metar_at_uses_two_bounded_index_lookups(fake_db, monkeypatch):
+    from benchmarks.synthetic_metar import generate_documents, load_fake
+
+    from .fixtures_sample_data import NOW
+    load_fake(fake_db, generate_documents(2000, end=NOW, seed=1))
+    await srv.ensure_indexes()
+    calls = []
+    fetch = srv.fetch_metar_documents
+
+    async def _recording_fetch(tool, query, sort, limit, *args):
+        calls.append((query, sort, limit))
+        return await fetch(tool, query, sort, limit, *args)
+    monkeypatch.setattr(srv, "fetch_metar_documents", _recording_fetch)
+
+    out = await srv.get_metar_at("DEL", "2025-11-10T08:40Z", neighbours=2)
+    assert out.startswith("🕒 VIDP METAR in effect at 2025-11-10 08:40Z (reported 10 min earlier):")
+    lines = out.splitlines()[1:]
+    marked = [line for line in lines if line.startswith("→")]
+    assert len(marked) == 1 and "VIDP 100830Z" in marked[0]
+    reports = [line for line in lines if line.lstrip("→ ").startswith("VIDP/DEL")]
+    assert [r.split(" @ ")[1][:19] for r in reports] == [
+        "2025-11-10 07:30:00", "2025-11-10 08:00:00", "2025-11-10 08:30:00", "2025-11-10 09:00:00", "2025-11-10 09:30:00",
+    ]
+    assert [(q["timestamp"], sort, limit) for q, sort, limit in calls] == [
+        ({"$lte": srv.datetime(2025, 11, 10, 8, 40)}, srv.SEARCH_SORT, 3),
+        ({"$gt": srv.datetime(2025, 11, 10, 8, 40)}, srv.POINT_IN_TIME_AFTER_SORT, 2),
+    ]
+    for name in ("get_metar_at:before", "get_metar_at:after"):
+        query, sort, _ = srv.index_coverage_queries()[name]
+        stages = srv.plan_stages((await fake_db["metar_data"].find(query).sort(sort).limit(1).explain())["queryPlanner"])
+        assert "IXSCAN" in stages and "SORT" not in stages and "COLLSCAN" not in stages
+
+    assert await srv.get_metar_at("VIDP", "1999-01-01T00:00Z") == "No METAR for VIDP at or before 1999-01-01 00:00Z"
+    assert (await srv.get_metar_at("VIDP", "soon")).startswith("Invalid time: soon")
+
+
+async def test_get_metar_changes_pages_by_mark_and_picks_up_updates(fake_db):
+    from benchmarks.synthetic_metar import generate_documents, load_fake
+
+    from .fixtures_sample_data import NOW
+    load_fake(fake_db, generate_documents(300, end=NOW, seed=2))
+    await srv.ensure_indexes()
+
+    seen, mark, has_more = [], None, True
+    while has_more:
+        docs, mark, has_more = await srv.fetch_changes("get_metar_changes", mark, 70)
+        seen += docs
+    assert len(seen) == 300 and len({d["_id"] for d in seen}) == 300
+    assert [d["metar"]["updatedTime"] for d in seen] == sorted(d["metar"]["updatedTime"] for d in seen)
+    # steady state: nothing new, the mark stays put
+    assert await srv.fetch_changes("get_metar_changes", mark, 70) == ([], mark, False)
+
+    coll = fake_db["metar_data"]
+    doc = next(d for d in coll._docs if d["_id"] == seen[0]["_id"])
+    await coll.replace_one({"_id": doc["_id"]}, {**doc, "metar": {**doc["metar"], "updatedTime": NOW + srv.timedelta(minutes=5)}})
+    out = await srv.get_metar_changes(mark)
+    assert out.startswith("🔄 1 changed METAR documents:") and doc["stationICAO"] in out
+    assert out.splitlines()[-1].startswith("Next mark: ")
+    mark = out.splitlines()[-1].split(": ")[1]
+    assert await srv.get_metar_changes(mark) == f"🔄 0 changed METAR documents:\nNext mark: {mark}\n"
+
+    compact = await srv.get_metar_changes(batch_size=2, output_format="toon")
+    assert "has_more: true" in compact and "count: 2" in compact
+    assert (await srv.get_metar_changes("not-a-mark")).startswith("Invalid mark")
+
+    query, sort, _ = srv.index_coverage_queries()["get_metar_changes"]
+    stages = srv.plan_stages((await coll.find(query).sort(sort).limit(1).explain())["queryPlanner"])
+    assert "IXSCAN" in stages and "SORT" not in stages and "COLLSCAN" not in stages